@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2026 Testrepository Contributors
+#
+# Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+# license at the users choice. A copy of both licenses are available in the
+# project source as Apache-2.0 and BSD. You may not use this file except in
+# compliance with one of these two licences.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# license you chose for the specific language governing permissions and
+# limitations under that license.
+
+"""Compare the compressions of stored runs.
+
+For each compression available, a synthetic run - tests with tracebacks and
+captured logs attached - is inserted into a new file repository, then
+replayed and copied out as testr last and testr last --subunit would. The
+throughput of each (in MB of uncompressed subunit a second) is shown against
+the size of the stored run.
+
+Run it from the top of the source tree:
+
+    python benchmarks/compression.py --tests 2000
+"""
+
+from datetime import datetime, timedelta, timezone
+import optparse
+import os.path
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import testtools  # noqa: E402
+
+from testrepository.repository import compression, file  # noqa: E402
+
+TRACEBACK = """Traceback (most recent call last):
+  File "/srv/app/tests/test_orders.py", line %(line)d, in test_%(index)d
+    self.assertEqual(expected, client.get("/orders/%(index)d").json())
+  File "/srv/venv/lib/python3.12/site-packages/testtools/testcase.py", line 513, in assertEqual
+    self.assertThat(observed, matcher, message)
+testtools.matchers._impl.MismatchError: {'id': %(index)d, 'state': 'open'} != {'id': %(index)d, 'state': 'closed'}
+"""
+
+LOG_LINE = (
+    "2026-10-18 12:%(minute)02d:%(second)02d,%(ms)03d DEBUG app.orders "
+    "order %(index)d moved to state %(state)s after %(ms)d ms\n"
+)
+
+
+def make_events(tests, log_lines):
+    """Make the status calls of a synthetic run.
+
+    Every fifth test fails with a traceback, and every test has a captured
+    log attached.
+
+    :return: A list of kwargs dicts for StreamResult.status.
+    """
+    events = []
+    start = datetime(2026, 10, 18, tzinfo=timezone.utc)
+    for index in range(tests):
+        test_id = "app.tests.test_orders.TestOrders.test_%d" % index
+        timestamp = start + timedelta(milliseconds=index * 20)
+        events.append(
+            dict(test_id=test_id, test_status="inprogress", timestamp=timestamp)
+        )
+        log = "".join(
+            LOG_LINE
+            % dict(
+                minute=line % 60,
+                second=(index + line) % 60,
+                ms=(index * line) % 1000,
+                index=index,
+                state=("open", "paid", "closed")[line % 3],
+            )
+            for line in range(log_lines)
+        )
+        events.append(
+            dict(
+                test_id=test_id,
+                file_name="log",
+                file_bytes=log.encode("utf8"),
+                mime_type="text/plain; charset=utf8",
+                eof=True,
+            )
+        )
+        status = "success"
+        if index % 5 == 0:
+            status = "fail"
+            events.append(
+                dict(
+                    test_id=test_id,
+                    file_name="traceback",
+                    file_bytes=(TRACEBACK % dict(line=index, index=index)).encode(
+                        "utf8"
+                    ),
+                    mime_type="text/x-traceback; charset=utf8",
+                    eof=True,
+                )
+            )
+        events.append(
+            dict(
+                test_id=test_id,
+                test_status=status,
+                timestamp=timestamp + timedelta(milliseconds=15),
+            )
+        )
+    return events
+
+
+def measure(kind, events, base):
+    """Insert, replay and copy a run stored with kind.
+
+    :return: A tuple (stored size, uncompressed size, insert seconds, replay
+        seconds, copy seconds).
+    """
+    os.mkdir(base)
+    repo = file.RepositoryFactory().initialise(base)
+    repo.compression = kind
+    started = time.perf_counter()
+    inserter = repo.get_inserter()
+    inserter.startTestRun()
+    for event in events:
+        inserter.status(**event)
+    inserter.stopTestRun()
+    inserted = time.perf_counter()
+    run = repo.get_test_run(inserter.get_id())
+    summary = testtools.StreamSummary()
+    summary.startTestRun()
+    run.get_test().run(summary)
+    summary.stopTestRun()
+    replayed = time.perf_counter()
+    size = 0
+    with run.get_subunit_stream() as stream:
+        while True:
+            content = stream.read(65536)
+            if not content:
+                break
+            size += len(content)
+    copied = time.perf_counter()
+    stored = os.path.getsize(os.path.join(repo.base, str(inserter.get_id())))
+    return stored, size, inserted - started, replayed - inserted, copied - replayed
+
+
+def main(argv):
+    parser = optparse.OptionParser(description=__doc__.split("\n\n")[0])
+    parser.add_option(
+        "--tests", type="int", default=2000, help="Tests in the run [%default]."
+    )
+    parser.add_option(
+        "--log-lines",
+        type="int",
+        default=50,
+        help="Lines of log attached to each test [%default].",
+    )
+    options, _ = parser.parse_args(argv)
+    kinds = ["none", "zlib"]
+    if compression.zstd_available():
+        kinds.append("zstd")
+    else:
+        sys.stderr.write("zstandard is not installed: skipping zstd.\n")
+    events = make_events(options.tests, options.log_lines)
+    tempdir = tempfile.mkdtemp()
+    try:
+        rows = []
+        for kind in kinds:
+            stored, size, insert, replay, copy = measure(
+                kind, events, os.path.join(tempdir, kind)
+            )
+            megabytes = size / 1e6
+            rows.append(
+                (
+                    kind,
+                    "%.1f" % (stored / 1e6),
+                    "%.1f" % (size / stored),
+                    "%.1f" % (megabytes / insert),
+                    "%.1f" % (megabytes / replay),
+                    "%.1f" % (megabytes / copy),
+                )
+            )
+    finally:
+        shutil.rmtree(tempdir)
+    header = (
+        "Compression",
+        "Stored MB",
+        "Ratio",
+        "Insert MB/s",
+        "Replay MB/s",
+        "Copy MB/s",
+    )
+    widths = [max(len(row[column]) for row in [header] + rows) for column in range(6)]
+    for row in [header] + rows:
+        print("  ".join(value.rjust(width) for value, width in zip(row, widths)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -39,6 +39,13 @@ import sys
 
 from testrepository.repository import file
 
+# The built in commands whose class sets resident. run_argv hands these to a
+# testr serve process without importing them, as importing a command module
+# can take most of the time a resident process saves.
+RESIDENT_COMMANDS = frozenset(
+    ["failing", "last", "simulate", "slowest", "stats", "timeline"]
+)
+
 
 def _find_command(cmd_name):
     orig_cmd_name = cmd_name
@@ -108,6 +115,9 @@ class Command(object):
         when a command can process more than one stream.
     :ivar options: A list of optparse.Option options to accept. These are
         merged with global options by the UI layer when set_command is called.
+    :ivar resident: True if the command may be run by a testr serve process
+        when one is serving the repository. Such commands only read the
+        repository, and take no input.
     """
 
     # class defaults to no streams.
@@ -116,6 +126,8 @@ class Command(object):
     args = []
     # class defaults to no options.
     options = []
+    # class defaults to running in the invoking process.
+    resident = False
 
     def __init__(self, ui):
         """Create a Command object with ui ui."""
@@ -161,6 +173,12 @@ class Command(object):
         raise NotImplementedError(self.run)
 
 
+def _call_resident(argv, stdout, stderr):
+    from testrepository import daemon
+
+    return daemon.call(argv[1:], stdout, stderr)
+
+
 def run_argv(argv, stdin, stdout, stderr):
     """Convenience function to run a command with a CLIUI.
 
@@ -180,7 +198,16 @@ def run_argv(argv, stdin, stdout, stderr):
         cmd_name = "help"
         cmd_args = ["help"]
     cmd_args.remove(cmd_name)
+    if cmd_name in RESIDENT_COMMANDS:
+        result = _call_resident(argv, stdout, stderr)
+        if result is not None:
+            return result
     cmdclass = _find_command(cmd_name)
+    if cmdclass.resident and cmd_name not in RESIDENT_COMMANDS:
+        # A plugin command.
+        result = _call_resident(argv, stdout, stderr)
+        if result is not None:
+            return result
     from testrepository.ui import cli
 
     ui = cli.UI(cmd_args, stdin, stdout, stderr)
@@ -36,6 +36,8 @@ class failing(Command):
     the subunit stream could not be generated successfully.
     """
 
+    resident = True
+
     options = [
         optparse.Option(
             "--subunit",
@@ -54,8 +56,8 @@ class failing(Command):
     command_factory = TestCommand
 
     def _show_subunit(self, run):
-        stream = run.get_subunit_stream()
-        self.ui.output_stream(stream)
+        with run.get_subunit_stream() as stream:
+            self.ui.output_stream(stream)
         return 0
 
     def _make_result(self, repo):
@@ -0,0 +1,155 @@
+#
+# Copyright (c) 2026 Testrepository Contributors
+#
+# Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+# license at the users choice. A copy of both licenses are available in the
+# project source as Apache-2.0 and BSD. You may not use this file except in
+# compliance with one of these two licences.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# license you chose for the specific language governing permissions and
+# limitations under that license.
+
+"""Remove old test runs and pack the rest into an archive."""
+
+import optparse
+import time
+
+from testtools import StreamToDict
+
+from testrepository.commands import Command
+
+
+def select_runs(runs, keep_last=None, keep_days=None, now=None):
+    """Choose the runs to keep by their age.
+
+    :param runs: A dict mapping run ids to the time each was stored, in
+        seconds since the epoch.
+    :param keep_last: Keep this many of the most recent runs.
+    :param keep_days: Keep the runs stored less than this many days ago.
+    :param now: The time to measure ages from. Defaults to the current time.
+    :return: The set of ids of the runs kept by either policy. If neither is
+        given, every run is kept.
+    """
+    if keep_last is None and keep_days is None:
+        return set(runs)
+    keep = set()
+    if keep_last:
+        keep.update(sorted(runs)[-keep_last:])
+    if keep_days is not None:
+        if now is None:
+            now = time.time()
+        cutoff = now - keep_days * 24 * 3600
+        keep.update(run_id for run_id, stored in runs.items() if stored >= cutoff)
+    return keep
+
+
+def _get_failed_ids(run):
+    failed = set()
+
+    def gather(test_dict):
+        if test_dict["status"] == "fail":
+            failed.add(test_dict["id"])
+
+    result = StreamToDict(gather)
+    result.startTestRun()
+    try:
+        run.get_test().run(result)
+    finally:
+        result.stopTestRun()
+    return failed
+
+
+def find_failing_runs(repo, run_ids):
+    """Find the runs holding the current failures.
+
+    For each test in the failing stream, this is the most recent of run_ids
+    in which the test failed.
+
+    :return: A set of run ids.
+    """
+    remaining = _get_failed_ids(repo.get_failing())
+    found = set()
+    for run_id in sorted(run_ids, reverse=True):
+        if not remaining:
+            break
+        run = repo.get_test_run(run_id)
+        if not run.get_summary().get_num_failures():
+            continue
+        failed = remaining.intersection(_get_failed_ids(run))
+        if failed:
+            found.add(run_id)
+            remaining -= failed
+    return found
+
+
+class gc(Command):
+    """Remove old test runs and pack the rest into an archive.
+
+    With --keep-last or --keep-days, only the runs matching either are kept,
+    along with the latest run and, for each currently failing test, the most
+    recent run in which it failed. Other runs are removed: their ids are not
+    reused. Without either option no runs are removed.
+
+    The runs that are kept, other than the latest, are then packed into a
+    single archive file in the repository, indexed by run id, so that
+    repositories with many runs do not need a file (and a summary file) for
+    each. Packed runs can still be used as before, e.g. with testr last.
+
+    Do not run testr gc while other testr commands are using the repository.
+    """
+
+    options = [
+        optparse.Option(
+            "--keep-last",
+            type="int",
+            default=None,
+            help="Keep this many of the most recent runs.",
+        ),
+        optparse.Option(
+            "--keep-days",
+            type="float",
+            default=None,
+            help="Keep the runs stored less than this many days ago.",
+        ),
+        optparse.Option(
+            "--dry-run",
+            action="store_true",
+            default=False,
+            help="Show how many runs would be removed, without changing the "
+            "repository.",
+        ),
+    ]
+
+    def run(self):
+        keep_last = self.ui.options.keep_last
+        keep_days = self.ui.options.keep_days
+        if (keep_last is not None and keep_last < 0) or (
+            keep_days is not None and keep_days < 0
+        ):
+            raise ValueError("--keep-last and --keep-days must not be negative.")
+        repo = self.repository_factory.open(self.ui.here)
+        if getattr(repo, "pack_runs", None) is None:
+            raise ValueError("testr gc needs a file repository.")
+        runs = repo.get_stored_runs()
+        keep = select_runs(runs, keep_last, keep_days)
+        to_pack = []
+        if runs:
+            latest = max(runs)
+            keep.add(latest)
+            to_pack = sorted(keep - set([latest]))
+        if keep != set(runs):
+            keep.update(find_failing_runs(repo, runs))
+            to_pack = sorted(keep - set([latest]))
+        removed = sorted(set(runs) - keep)
+        values = [("runs", len(runs)), ("removed", len(removed))]
+        if self.ui.options.dry_run:
+            self.ui.output_values(values)
+            return 0
+        repo.remove_runs(removed)
+        packed = repo.pack_runs(to_pack)
+        values.append(("packed", len(packed)))
+        self.ui.output_values(values)
+        return 0
@@ -0,0 +1,72 @@
+#
+# Copyright (c) 2026 Testrepository Contributors
+#
+# Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+# license at the users choice. A copy of both licenses are available in the
+# project source as Apache-2.0 and BSD. You may not use this file except in
+# compliance with one of these two licences.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# license you chose for the specific language governing permissions and
+# limitations under that license.
+
+"""Show and reap the test environment instances kept between runs."""
+
+import optparse
+import time
+
+from testrepository.commands import Command
+from testrepository.testcommand import TestCommand
+
+
+class instances(Command):
+    """Show the test environment instances kept between test runs.
+
+    When instance_pool_idle_timeout is set in .testr.conf, instances are
+    kept in a pool in the repository after a test run, for later runs to
+    reuse. This shows the instances in the pool: those in use, with the id of
+    the process using them, and those idle, with how long they have been idle.
+
+    With --reap, instances idle for longer than instance_pool_idle_timeout,
+    or whose process has gone away without returning them, are disposed of
+    first.
+    """
+
+    options = [
+        optparse.Option(
+            "--reap",
+            action="store_true",
+            default=False,
+            help="Dispose of expired instances.",
+        ),
+        optparse.Option(
+            "--all",
+            action="store_true",
+            default=False,
+            help="With --reap, dispose of every instance not in use.",
+        ),
+    ]
+    command_factory = TestCommand
+
+    def run(self):
+        repo = self.repository_factory.open(self.ui.here)
+        if self.ui.options.reap:
+            testcommand = self.command_factory(self.ui, repo)
+            testcommand.reap_instances(everything=self.ui.options.all)
+        pool = repo.get_instance_pool()
+        try:
+            instances = pool.list()
+        finally:
+            pool.close()
+        if instances:
+            now = time.time()
+            rows = [("Instance id", "Used by", "Idle (s)")]
+            for instance_id, holder, leased_at, idle_since in instances:
+                if holder is None:
+                    rows.append((instance_id, "", "%d" % (now - idle_since)))
+                else:
+                    rows.append((instance_id, "process %d" % holder, ""))
+            self.ui.output_table(rows)
+        return 0
@@ -32,6 +32,8 @@ class last(Command):
     the subunit stream could not be generated successfully.
     """
 
+    resident = True
+
     options = [
         optparse.Option(
             "--subunit",
@@ -48,8 +50,8 @@ class last(Command):
         testcommand = self.command_factory(self.ui, repo)
         latest_run = repo.get_latest_run()
         if self.ui.options.subunit:
-            stream = latest_run.get_subunit_stream()
-            self.ui.output_stream(stream)
+            with latest_run.get_subunit_stream() as stream:
+                self.ui.output_stream(stream)
             # Exits 0 if we successfully wrote the stream.
             return 0
         case = latest_run.get_test()
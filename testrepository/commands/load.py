@@ -15,15 +15,21 @@
 """Load data into a repository."""
 
 from functools import partial
+from io import BytesIO
 import optparse
+import selectors
+import sys
 import threading
+import time
 
 import subunit.test_results
+import subunit.v2
 import testtools
 
 from testrepository.arguments.path import ExistingPathArgument
 from testrepository.commands import Command
 from testrepository.repository import RepositoryNotFound
+from testrepository.results import ProgressResult
 from testrepository.testcommand import TestCommand
 
 
@@ -48,6 +54,438 @@ class InputToStreamResult(object):
                 result.status(test_id="stdin", test_status="fail")
 
 
+# The most to read from a stream at once.
+_CHUNK_SIZE = 65536
+_SIGNATURE = subunit.v2.SIGNATURE[0]
+
+
+def _utf8_needed(data, needed=0):
+    """Count the UTF-8 continuation bytes still expected after data.
+
+    :param needed: The count expected before data.
+    """
+    if len(data) >= 4:
+        # A character is at most 4 bytes, so the last 4 decide.
+        data = data[-4:]
+        needed = 0
+    for byte in data:
+        if byte < 0x80:
+            needed = 0
+        elif byte < 0xC0:
+            needed = max(needed - 1, 0)
+        elif byte < 0xE0:
+            needed = 1
+        elif byte < 0xF0:
+            needed = 2
+        else:
+            needed = 3
+    return needed
+
+
+class _StreamParser(object):
+    """Parse a subunit v2 byte stream incrementally.
+
+    Bytes are fed in as they arrive. Complete packets are parsed with
+    subunit.ByteStreamToStreamResult and content between packets is reported
+    as non subunit content named 'stdout', as ByteStreamToStreamResult would.
+    """
+
+    def __init__(self, result):
+        self.result = result
+        self._buffer = bytearray()
+        # UTF-8 continuation bytes expected after the non subunit content
+        # already reported: a signature byte among them is not a packet.
+        self._needed = 0
+
+    def feed(self, data):
+        self._buffer.extend(data)
+        self._parse(final=False)
+
+    def close(self):
+        self._parse(final=True)
+
+    def _packet_length(self, pos):
+        """Get the length of the packet at pos, or None if not yet known."""
+        buffer = self._buffer
+        # Signature, 2 bytes of flags, then a varint length of the packet.
+        if len(buffer) < pos + 4:
+            return None
+        width = buffer[pos + 3] >> 6
+        if width > 2:
+            # Invalid: let the parser report it.
+            return 6
+        if len(buffer) < pos + 4 + width:
+            return None
+        length = buffer[pos + 3] & 0x3F
+        for byte in buffer[pos + 4 : pos + 4 + width]:
+            length = length << 8 | byte
+        return max(length, 6)
+
+    def _find_packet(self, start):
+        """Find the next packet at or after start in the buffer.
+
+        :return: The position of the packet, or -1 if there is none.
+        """
+        buffer = self._buffer
+        pos = buffer.find(_SIGNATURE, start)
+        while pos != -1:
+            if not _utf8_needed(buffer[max(start, pos - 4) : pos], self._needed):
+                return pos
+            pos = buffer.find(_SIGNATURE, pos + 1)
+        return -1
+
+    def _parse(self, final):
+        buffer = self._buffer
+        pos = 0
+        packets_start = None
+        while pos < len(buffer):
+            packet = self._find_packet(pos)
+            if packet != pos:
+                # Non subunit content up to the next packet.
+                if packets_start is not None:
+                    self._parse_packets(buffer[packets_start:pos])
+                    packets_start = None
+                end = len(buffer) if packet == -1 else packet
+                text = bytes(buffer[pos:end])
+                self.result.status(file_name="stdout", file_bytes=text)
+                self._needed = 0 if packet != -1 else _utf8_needed(text, self._needed)
+                pos = end
+                continue
+            length = self._packet_length(pos)
+            if length is None or pos + length > len(buffer):
+                if not final:
+                    break
+                # A truncated packet: let the parser report it.
+                length = len(buffer) - pos
+            if packets_start is None:
+                packets_start = pos
+            pos += length
+            self._needed = 0
+        if packets_start is not None:
+            self._parse_packets(buffer[packets_start:pos])
+        del buffer[:pos]
+
+    def _parse_packets(self, packets):
+        parser = subunit.ByteStreamToStreamResult(
+            BytesIO(bytes(packets)), non_subunit_name="stdout"
+        )
+        parser.run(self.result)
+
+
+class _RouteCodePrefixer(testtools.CopyStreamResult):
+    """Prefix the route codes of events, as testtools.StreamToQueue does."""
+
+    def __init__(self, target, route_code):
+        super(_RouteCodePrefixer, self).__init__([target])
+        self.route_code = route_code
+
+    def status(self, route_code=None, **kwargs):
+        if route_code is None:
+            route_code = self.route_code
+        else:
+            route_code = self.route_code + "/" + route_code
+        super(_RouteCodePrefixer, self).status(route_code=route_code, **kwargs)
+
+
+class _FailureLimit(testtools.StreamResult):
+    """Call a callback once a number of tests have failed."""
+
+    def __init__(self, limit, callback):
+        super(_FailureLimit, self).__init__()
+        self.limit = limit
+        self.callback = callback
+        self.failures = 0
+
+    def status(self, test_id=None, test_status=None, **kwargs):
+        if test_status not in ("fail", "uxsuccess"):
+            return
+        self.failures += 1
+        if self.failures == self.limit:
+            self.callback()
+
+
+class _TestTracker(testtools.StreamResult):
+    """Track which tests in a stream are in progress and which have finished."""
+
+    def __init__(self):
+        super(_TestTracker, self).__init__()
+        self.inprogress = []
+        self.finished = set()
+
+    def status(self, test_id=None, test_status=None, **kwargs):
+        if test_id is None or test_status is None:
+            return
+        if test_status == "inprogress":
+            if test_id not in self.inprogress:
+                self.inprogress.append(test_id)
+            return
+        if test_id in self.inprogress:
+            self.inprogress.remove(test_id)
+        self.finished.add(test_id)
+
+
+class _UnlessStopped(object):
+    """Pass events on to the result of a stream until it is stopped."""
+
+    def __init__(self, state):
+        self.state = state
+
+    def status(self, **kwargs):
+        if not self.state.stopped:
+            self.state.result.status(**kwargs)
+
+
+class _StreamState(object):
+    """The state of one stream being read by a StreamMultiplexer."""
+
+    def __init__(self, stream, result, now):
+        self.stream = stream
+        self.tracker = _TestTracker()
+        self.result = testtools.CopyStreamResult([result, self.tracker])
+        self.parser = _StreamParser(_UnlessStopped(self))
+        self.fd = None
+        self.started = self.last_output = now
+        # Whether the current process has been aborted for timing out.
+        self.aborted = False
+        # Whether the stream has been read to its end.
+        self.ended = False
+        # Whether no more of the stream is to be read.
+        self.stopped = False
+
+
+class StreamMultiplexer(object):
+    """Parse many subunit streams at once, in a single thread.
+
+    Events from the Nth stream are tagged worker-N and routed with route code
+    N, just as for ByteStreamToStreamResult cases run by a
+    testtools.ConcurrentStreamTestSuite, but rather than a thread per stream
+    all the streams are read from one loop.
+
+    Streams with fileno() and read1() methods - such as pipes from test
+    runner processes - are polled with the selectors module, and read from
+    as soon as they have output. A stream whose fileno() changes, as it does
+    for DynamicWorker, is polled on its new fileno; read1() may return None
+    when it has nothing to read yet. Other streams are read in turn between
+    polls, which blocks if they have nothing to read.
+
+    Polled streams with an abort() or terminate() method can be timed out.
+    A stream times out when its process (each new fileno is a new process)
+    runs for longer than worker_timeout, or produces no output for longer
+    than progress_timeout. Its tests in progress are then failed, with a
+    'timeout' attachment saying why, and the stream is aborted: abort() is
+    called with the ids of the tests not to run again - those finished or
+    failed - so that the rest can be rescheduled, or if there is no abort()
+    method, terminate() is called. The stream is then read until it ends.
+
+    The whole run can be stopped early with terminate(). Tests still in
+    progress in a stream when it stops are then reported as skipped, with a
+    reason saying they were cancelled, as they did not finish.
+    """
+
+    def __init__(self, streams, worker_timeout=None, progress_timeout=None):
+        """Create a StreamMultiplexer.
+
+        :param streams: An iterable of byte streams.
+        :param worker_timeout: The longest, in seconds, a process may run.
+        :param progress_timeout: The longest, in seconds, a process may go
+            without output.
+        """
+        self.streams = streams
+        self.worker_timeout = worker_timeout
+        self.progress_timeout = progress_timeout
+        self._states = []
+        self._terminated = False
+
+    def terminate(self):
+        """Stop the run: terminate the processes supplying the streams.
+
+        Streams with a terminate() method, such as ReturnCodeToSubunit, have
+        it called, and their output continues to be read until they end.
+        Other streams, such as files, are not read any further.
+
+        :return: True if any stream was cut short: a terminate() call
+            reported stopping a process that was still running, or a stream
+            without one had not been read to its end.
+        """
+        self._terminated = True
+        terminated = False
+        for state in self._states:
+            if state.ended or state.stopped:
+                continue
+            terminate = getattr(state.stream, "terminate", None)
+            if terminate is None:
+                state.stopped = True
+                terminated = True
+            elif terminate():
+                terminated = True
+        return terminated
+
+    def _cancel(self, state):
+        """Report the tests in progress in a stopped stream as cancelled."""
+        state.stopped = True
+        for test_id in list(state.tracker.inprogress):
+            state.result.status(
+                test_id=test_id,
+                test_status="skip",
+                file_name="reason",
+                file_bytes=b"Cancelled: the test run was stopped early.",
+                mime_type="text/plain;charset=utf8",
+                eof=True,
+            )
+
+    def _end(self, state):
+        """Finish with a stream which has ended or is stopped."""
+        state.ended = True
+        if self._terminated:
+            self._cancel(state)
+
+    def _result_for(self, result, pos):
+        result = _RouteCodePrefixer(result, str(pos))
+        result = testtools.TimestampingStreamResult(result)
+        return testtools.StreamTagger([result], add=["worker-%d" % pos])
+
+    def _register(self, selector, state):
+        """Poll the stream of state with selector if possible.
+
+        :return: True if the stream is being polled.
+        """
+        stream = state.stream
+        if sys.platform == "win32":
+            # select only supports sockets on Windows.
+            return False
+        if getattr(stream, "read1", None) is None:
+            return False
+        try:
+            key = selector.register(stream, selectors.EVENT_READ, state)
+        except (AttributeError, OSError, ValueError):
+            # No fileno, or not a pollable one (e.g. a regular file for epoll).
+            return False
+        state.fd = key.fd
+        return True
+
+    def _read(self, state):
+        """Read what is available from a stream into its parser.
+
+        :return: False if the stream has ended.
+        """
+        stream = state.stream
+        read1 = getattr(stream, "read1", None) or stream.read
+        content = read1(_CHUNK_SIZE)
+        if content is None:
+            return True
+        if not content:
+            state.parser.close()
+            return False
+        state.parser.feed(content)
+        return True
+
+    def _timed(self, state):
+        stream = state.stream
+        return (self.worker_timeout or self.progress_timeout) and (
+            hasattr(stream, "abort") or hasattr(stream, "terminate")
+        )
+
+    def _deadline(self, state):
+        """Get when the process of a polled stream times out, or None."""
+        if state.aborted or not self._timed(state):
+            return None
+        deadlines = []
+        if self.worker_timeout:
+            deadlines.append(state.started + self.worker_timeout)
+        if self.progress_timeout:
+            deadlines.append(state.last_output + self.progress_timeout)
+        return min(deadlines)
+
+    def _abort(self, state, now):
+        if self.worker_timeout and now >= state.started + self.worker_timeout:
+            reason = "Test process ran for longer than %s seconds."
+            reason = reason % self.worker_timeout
+        else:
+            reason = "Test process produced no output for %s seconds."
+            reason = reason % self.progress_timeout
+        for test_id in list(state.tracker.inprogress):
+            state.result.status(
+                test_id=test_id,
+                test_status="fail",
+                file_name="timeout",
+                file_bytes=reason.encode("utf8"),
+                mime_type="text/plain;charset=utf8",
+                eof=True,
+            )
+        state.aborted = True
+        abort = getattr(state.stream, "abort", None)
+        if abort is not None:
+            abort(set(state.tracker.finished))
+        else:
+            state.stream.terminate()
+
+    def run(self, result):
+        selector = selectors.DefaultSelector()
+        blocking = []
+        try:
+            now = time.monotonic()
+            self._states = [
+                _StreamState(stream, self._result_for(result, pos), now)
+                for pos, stream in enumerate(self.streams)
+            ]
+            for state in self._states:
+                if not self._register(selector, state):
+                    blocking.append(state)
+            while blocking or selector.get_map():
+                states = [key.data for key in selector.get_map().values()]
+                deadlines = [self._deadline(state) for state in states]
+                deadlines = [deadline for deadline in deadlines if deadline]
+                if blocking:
+                    timeout = 0
+                elif deadlines:
+                    timeout = max(min(deadlines) - time.monotonic(), 0)
+                else:
+                    timeout = None
+                for key, _ in selector.select(timeout):
+                    state = key.data
+                    if state.stopped:
+                        continue
+                    active = self._read(state)
+                    state.last_output = time.monotonic()
+                    if not active:
+                        selector.unregister(key.fd)
+                        self._end(state)
+                        continue
+                    try:
+                        fd = state.stream.fileno()
+                    except (OSError, ValueError):
+                        fd = None
+                    if fd != key.fd:
+                        # A new process: time it afresh.
+                        selector.unregister(key.fd)
+                        state.started = state.last_output
+                        state.aborted = False
+                        if not self._register(selector, state):
+                            blocking.append(state)
+                if deadlines:
+                    now = time.monotonic()
+                    for key in list(selector.get_map().values()):
+                        state = key.data
+                        deadline = self._deadline(state)
+                        if deadline and deadline <= now:
+                            self._abort(state, now)
+                for state in list(blocking):
+                    if state.stopped or not self._read(state):
+                        blocking.remove(state)
+                        self._end(state)
+                for key in list(selector.get_map().values()):
+                    if key.data.stopped:
+                        selector.unregister(key.fd)
+                        self._end(key.data)
+        except KeyboardInterrupt:
+            # Test processes run in sessions of their own, so the terminal's
+            # interrupt does not reach them: stop them before giving up.
+            self.terminate()
+            raise
+        finally:
+            selector.close()
+
+
 class load(Command):
     """Load a subunit stream into a repository.
 
@@ -67,6 +505,13 @@ class load(Command):
             default=False,
             help="The stream being loaded was a partial run.",
         ),
+        optparse.Option(
+            "--max-failures",
+            type="int",
+            default=None,
+            help="Stop loading after this many failures, terminating the "
+            "processes supplying the streams, and record the run as partial.",
+        ),
         optparse.Option(
             "--force-init",
             action="store_true",
@@ -89,6 +534,14 @@ class load(Command):
     # Can be assigned to to inject a custom command factory.
     command_factory = TestCommand
 
+    def _make_progress(self, repo):
+        schedule = getattr(self.ui.options, "schedule", None)
+        durations = None
+        if schedule:
+            test_ids = [test_id for test_ids, _ in schedule for test_id in test_ids]
+            durations = repo.get_test_times(test_ids)["known"]
+        return ProgressResult(self.ui.output_progress, schedule, durations)
+
     def run(self):
         path = self.ui.here
         try:
@@ -99,6 +552,7 @@ class load(Command):
             else:
                 raise
         testcommand = self.command_factory(self.ui, repo)
+        repo.compression = testcommand.get_compression()
         # Not a full implementation of TestCase, but we only need to iterate
         # back to it. Needs to be a callable - its a head fake for
         # testsuite.add.
@@ -111,20 +565,11 @@ class load(Command):
         else:
             streams = self.ui.iter_streams("subunit")
 
-        def mktagger(pos, result):
-            return testtools.StreamTagger([result], add=["worker-%d" % pos])
-
-        def make_tests():
-            for pos, stream in enumerate(streams):
-                # Calls StreamResult API.
-                case = subunit.ByteStreamToStreamResult(
-                    stream, non_subunit_name="stdout"
-                )
-                decorate = partial(mktagger, pos)
-                case = testtools.DecorateTestCaseResult(case, decorate)
-                yield (case, str(pos))
-
-        case = testtools.ConcurrentStreamTestSuite(make_tests)
+        multiplexer = case = StreamMultiplexer(
+            streams,
+            worker_timeout=getattr(self.ui.options, "worker_timeout", None),
+            progress_timeout=getattr(self.ui.options, "progress_timeout", None),
+        )
         # One unmodified copy of the stream to repository storage
         inserter = repo.get_inserter(partial=self.ui.options.partial)
         # One copy of the stream to the UI layer after performing global
@@ -136,7 +581,22 @@ class load(Command):
         output_result, summary_result = self.ui.make_result(
             inserter.get_id, testcommand, previous_run=previous_run
         )
-        result = testtools.CopyStreamResult([inserter, output_result])
+        results = [inserter]
+        if self.ui.show_progress:
+            # Before output_result, so that progress is cleared before the
+            # summary is shown.
+            results.append(self._make_progress(repo))
+        results.append(output_result)
+        max_failures = getattr(self.ui.options, "max_failures", None)
+        if max_failures:
+
+            def stop():
+                if multiplexer.terminate():
+                    # Not every test ran.
+                    inserter.partial = True
+
+            results.append(_FailureLimit(max_failures, stop))
+        result = testtools.CopyStreamResult(results)
         runner_thread = None
         result.startTestRun()
         try:
@@ -15,6 +15,7 @@
 """Run a projects tests and load them into testrepository."""
 
 from io import BytesIO
+import itertools
 from math import ceil
 import optparse
 
@@ -27,24 +28,32 @@ from testrepository.commands import Command
 from testrepository.commands.load import load
 from testrepository.repository import RepositoryNotFound
 from testrepository.ui import decorator
-from testrepository.testcommand import TestCommand, testrconf_help
+from testrepository.testcommand import (
+    TestCommand,
+    terminate_process,
+    testrconf_help,
+)
 from testrepository.testlist import parse_list
 
 
 LINEFEED = b"\n"[0]
+# The test statuses which count as failures.
+FAILURES = ("fail", "uxsuccess")
 
 
 class ReturnCodeToSubunit(object):
     """Converts a process return code to a subunit error on the process stdout.
 
     The ReturnCodeToSubunit object behaves as a readonly stream, supplying
-    the read, readline and readlines methods. If the process exits non-zero a
-    synthetic test is added to the output, making the error accessible to
-    subunit stream consumers. If the process closes its stdout and then does
-    not terminate, reading from the ReturnCodeToSubunit stream will hang.
-
-    This class will be deleted at some point, allowing parsing to read from the
-    actual fd and benefit from select for aggregating non-subunit output.
+    the read, read1, readline and readlines methods. If the process exits
+    non-zero a synthetic test is added to the output, making the error
+    accessible to subunit stream consumers. If the process closes its stdout
+    and then does not terminate, reading from the ReturnCodeToSubunit stream
+    will hang.
+
+    The fileno of the process stdout is available too, so that many
+    ReturnCodeToSubunit streams can be polled at once: see
+    testrepository.commands.load.StreamMultiplexer.
     """
 
     def __init__(self, process):
@@ -55,6 +64,8 @@ class ReturnCodeToSubunit(object):
         """
         self.proc = process
         self.done = False
+        # True once testr has stopped the process itself.
+        self.stopped = False
         self.source = self.proc.stdout
         self.lastoutput = LINEFEED
 
@@ -63,7 +74,8 @@ class ReturnCodeToSubunit(object):
             return
         self.source = BytesIO()
         returncode = self.proc.wait()
-        if returncode != 0:
+        if returncode != 0 and not self.stopped:
+            # A process testr stopped exits non-zero: that is not an error.
             if self.lastoutput != LINEFEED:
                 # Subunit V1 is line orientated, it has to start on a fresh
                 # line. V2 needs to start on any fresh utf8 character border
@@ -91,6 +103,43 @@ class ReturnCodeToSubunit(object):
         self._append_return_code_as_test()
         return self.source.read(count)
 
+    def read1(self, count=-1):
+        read1 = getattr(self.source, "read1", self.source.read)
+        result = read1(count)
+        if result:
+            self.lastoutput = result[-1]
+            return result
+        if result is None:
+            # Nothing available yet from a non-blocking source.
+            return None
+        self._append_return_code_as_test()
+        return self.source.read1(count)
+
+    def fileno(self):
+        return self.proc.stdout.fileno()
+
+    def terminate(self):
+        """Terminate the process, e.g. to stop a test run early.
+
+        :return: True if the process was still running.
+        """
+        if not terminate_process(self.proc):
+            return False
+        self.stopped = True
+        return True
+
+    def abort(self, done_ids):
+        """Terminate the process because it has hung.
+
+        If the process is a DynamicWorker, its tests not in done_ids are
+        rescheduled.
+        """
+        abort = getattr(self.proc, "abort", None)
+        if abort is None:
+            self.terminate()
+        else:
+            abort(done_ids)
+
     def readline(self):
         result = self.source.readline()
         if result:
@@ -135,9 +184,22 @@ class run(Command):
             default=0,
             help="How many processes to use. The default (0) autodetects your CPU count.",
         ),
+        optparse.Option(
+            "--dynamic",
+            action="store_true",
+            default=False,
+            help="With --parallel, hand tests out to the workers in batches "
+            "as they finish earlier ones, rather than partitioning them up front.",
+        ),
         optparse.Option(
             "--load-list", default=None, help="Only run tests listed in the named file."
         ),
+        optparse.Option(
+            "--relist",
+            action="store_true",
+            default=False,
+            help="List the tests afresh even if a cached listing is available.",
+        ),
         optparse.Option(
             "--partial",
             action="store_true",
@@ -178,7 +240,20 @@ class run(Command):
             "--isolated",
             action="store_true",
             default=False,
-            help="Run each test id in a separate test runner.",
+            help="Run each test id in a separate test runner. With --parallel, "
+            "run as many of them at once as the concurrency allows.",
+        ),
+        optparse.Option(
+            "--fail-fast",
+            action="store_true",
+            default=False,
+            help="Stop the test run at the first failure.",
+        ),
+        optparse.Option(
+            "--max-failures",
+            type="int",
+            default=None,
+            help="Stop the test run after this many failures.",
         ),
     ]
     args = [
@@ -241,107 +316,94 @@ class run(Command):
                 cmd = testcommand.get_run_command(
                     ids, self.ui.arguments["testargs"], test_filters=filters
                 )
-                if self.ui.options.isolated:
-                    result = 0
-                    cmd.setUp()
-                    try:
-                        ids = cmd.list_tests()
-                    finally:
-                        cmd.cleanUp()
-                    for test_id in ids:
-                        cmd = testcommand.get_run_command(
-                            [test_id],
-                            self.ui.arguments["testargs"],
-                            test_filters=filters,
-                        )
-                        run_result = self._run_tests(cmd)
-                        if run_result > result:
-                            result = run_result
-                    return result
-                else:
-                    return self._run_tests(cmd)
+                # With --isolated the command runs each test in its own
+                # process, all recorded as a single run.
+                return self._run_tests(cmd)
             else:
                 # Where do we source data about the cause of conflicts.
                 # XXX: Should instead capture the run id in with the failing test
                 # data so that we can deal with failures split across many partial
                 # runs.
                 latest_run = repo.get_latest_run()
+                if not ids:
+                    return 0
                 # Stage one: reduce the list of failing tests (possibly further
-                # reduced by testfilters) to eliminate fails-on-own tests.
-                spurious_failures = set()
-                for test_id in ids:
-                    cmd = testcommand.get_run_command(
-                        [test_id], self.ui.arguments["testargs"], test_filters=filters
-                    )
-                    if not self._run_tests(cmd):
-                        # If the test was filtered, it won't have been run.
-                        if test_id in repo.get_test_ids(repo.latest_id()):
-                            spurious_failures.add(test_id)
-                        # This is arguably ugly, why not just tell the system that
-                        # a pass here isn't a real pass? [so that when we find a
-                        # test that is spuriously failing, we don't forget
-                        # that it is actually failng.
-                        # Alternatively, perhaps this is a case for data mining:
-                        # when a test starts passing, keep a journal, and allow
-                        # digging back in time to see that it was a failure,
-                        # what it failed with etc...
-                        # The current solution is to just let it get marked as
-                        # a pass temporarily.
+                # reduced by testfilters) to eliminate fails-on-own tests. The
+                # tests are run in isolation, concurrently with --parallel.
+                cmd = testcommand.get_run_command(
+                    ids,
+                    self.ui.arguments["testargs"],
+                    test_filters=filters,
+                    isolated=True,
+                )
+                self._run_tests(cmd)
+                concurrency = cmd.concurrency
+                spurious_failures = self._find_passed(repo.get_latest_run(), ids)
+                # This is arguably ugly, why not just tell the system that
+                # a pass here isn't a real pass? [so that when we find a
+                # test that is spuriously failing, we don't forget
+                # that it is actually failng.
+                # Alternatively, perhaps this is a case for data mining:
+                # when a test starts passing, keep a journal, and allow
+                # digging back in time to see that it was a failure,
+                # what it failed with etc...
+                # The current solution is to just let it get marked as
+                # a pass temporarily.
                 if not spurious_failures:
                     # All done.
                     return 0
                 # spurious-failure -> cause.
                 test_conflicts = {}
+                # spurious-failure -> the prior tests that may cause it.
+                candidates = {}
                 for spurious_failure in spurious_failures:
                     candidate_causes = self._prior_tests(latest_run, spurious_failure)
-                    bottom = 0
-                    top = len(candidate_causes)
-                    width = top - bottom
-                    while width:
-                        check_width = int(ceil(width / 2.0))
-                        cmd = testcommand.get_run_command(
-                            candidate_causes[bottom : bottom + check_width]
-                            + [spurious_failure],
-                            self.ui.arguments["testargs"],
-                        )
-                        self._run_tests(cmd)
-                        # check that the test we're probing still failed - still
-                        # awkward.
-                        found_fail = []
-
-                        def find_fail(test_dict):
-                            if test_dict["id"] == spurious_failure:
-                                found_fail.append(True)
-
-                        checker = testtools.StreamToDict(find_fail)
-                        checker.startTestRun()
-                        try:
-                            repo.get_failing().get_test().run(checker)
-                        finally:
-                            checker.stopTestRun()
-                        if found_fail:
-                            # Our conflict is in bottom - clamp the range down.
-                            top = bottom + check_width
-                            if width == 1:
-                                # found the cause
-                                test_conflicts[spurious_failure] = candidate_causes[
-                                    bottom
-                                ]
-                                width = 0
-                            else:
-                                width = top - bottom
-                        else:
-                            # Conflict in the range we did not run: discard bottom.
-                            bottom = bottom + check_width
-                            if width == 1:
-                                # there will be no more to check, so we didn't
-                                # reproduce the failure.
-                                width = 0
-                            else:
-                                width = top - bottom
-                    if spurious_failure not in test_conflicts:
-                        # Could not determine cause
+                    if candidate_causes:
+                        candidates[spurious_failure] = candidate_causes
+                    else:
                         test_conflicts[spurious_failure] = "unknown - no conflicts"
+                # Search for the causes of all the failures at once, splitting
+                # the candidates of each failure as many ways as the workers
+                # allow. Every part but the last is probed by running it with
+                # the failure: if none of them reproduce the failure, the cause
+                # must be in the last part. A part of one test is only a cause
+                # once it has been seen to reproduce the failure.
+                while candidates:
+                    ways = max(2, concurrency // len(candidates) + 1)
+                    splits = {}
+                    probes = []
+                    for spurious_failure, causes in sorted(candidates.items()):
+                        size = int(ceil(len(causes) / float(ways)))
+                        parts = [
+                            causes[pos : pos + size]
+                            for pos in range(0, len(causes), size)
+                        ]
+                        splits[spurious_failure] = parts
+                        for part in parts[:-1] or parts:
+                            probes.append((spurious_failure, part))
+                    probe_failures = self._run_partitions(
+                        repo,
+                        testcommand,
+                        [part + [failure] for failure, part in probes],
+                        concurrency,
+                    )
+                    reproduced = {}
+                    for (spurious_failure, part), failed in zip(probes, probe_failures):
+                        if spurious_failure in failed:
+                            reproduced.setdefault(spurious_failure, part)
+                    candidates = {}
+                    for spurious_failure, parts in splits.items():
+                        part = reproduced.get(spurious_failure)
+                        if part is None and len(parts) > 1:
+                            candidates[spurious_failure] = parts[-1]
+                        elif part is None:
+                            # Could not determine cause
+                            test_conflicts[spurious_failure] = "unknown - no conflicts"
+                        elif len(part) == 1:
+                            # found the cause
+                            test_conflicts[spurious_failure] = part[0]
+                        else:
+                            candidates[spurious_failure] = part
                 if test_conflicts:
                     table = [("failing test", "caused by test")]
                     for failure, causes in test_conflicts.items():
@@ -352,6 +414,63 @@ class run(Command):
         finally:
             testcommand.cleanUp()
 
+    def _get_test_dicts(self, run):
+        """Get the test dicts for the tests in run."""
+        test_dicts = []
+        result = testtools.StreamToDict(test_dicts.append)
+        result.startTestRun()
+        try:
+            run.get_test().run(result)
+        finally:
+            result.stopTestRun()
+        return test_dicts
+
+    def _find_passed(self, run, ids):
+        """Find the tests of ids that ran and did not fail in run.
+
+        A test that was filtered won't have been run, so does not count as
+        passing, and nor does a test that failed in any of its attempts.
+        """
+        passed = set()
+        failed = set()
+        for test_dict in self._get_test_dicts(run):
+            if test_dict["id"] not in ids:
+                continue
+            if test_dict["status"] in FAILURES:
+                failed.add(test_dict["id"])
+            else:
+                passed.add(test_dict["id"])
+        return passed - failed
+
+    def _run_partitions(self, repo, testcommand, partitions, concurrency):
+        """Run each of partitions in a test runner process of its own.
+
+        Up to concurrency partitions are run at a time, each group of them
+        being a single run in the repository.
+
+        :return: A list with the set of the ids of the tests that failed in
+            each of partitions.
+        """
+        result = []
+        for pos in range(0, len(partitions), concurrency):
+            chunk = partitions[pos : pos + concurrency]
+            cmd = testcommand.get_run_command(
+                list(itertools.chain(*chunk)),
+                self.ui.arguments["testargs"],
+                partitions=chunk,
+            )
+            self._run_tests(cmd)
+            # Each partition ran in the worker with the matching index.
+            failed = [set() for partition in chunk]
+            for test_dict in self._get_test_dicts(repo.get_latest_run()):
+                if test_dict["status"] not in FAILURES:
+                    continue
+                for tag in test_dict["tags"]:
+                    if tag.startswith("worker-"):
+                        failed[int(tag[len("worker-") :])].add(test_dict["id"])
+            result.extend(failed)
+        return result
+
     def _prior_tests(self, run, failing_id):
         """Calculate what tests from the test run run ran before test_id.
 
@@ -370,6 +489,9 @@ class run(Command):
             def map_test(test_dict):
                 tags = test_dict["tags"]
                 id = test_dict["id"]
+                if id in test_to_worker:
+                    # Map each test once, by where it first ran.
+                    return
                 workers = []
                 for tag in tags:
                     if tag.startswith("worker-"):
@@ -411,11 +533,25 @@ class run(Command):
                     or self.ui.options.isolated
                 ):
                     options["partial"] = True
+                if self.ui.options.max_failures:
+                    options["max_failures"] = self.ui.options.max_failures
+                elif self.ui.options.fail_fast:
+                    options["max_failures"] = 1
+                options["worker_timeout"] = getattr(cmd, "worker_timeout", None)
+                options["progress_timeout"] = getattr(cmd, "progress_timeout", None)
+                options["schedule"] = getattr(cmd, "schedule", None)
                 load_ui = decorator.UI(
                     input_streams=run_procs, options=options, decorated=self.ui
                 )
                 load_cmd = load(load_ui)
-                return load_cmd.execute()
+                try:
+                    return load_cmd.execute()
+                except KeyboardInterrupt:
+                    # The test processes are in sessions of their own, so
+                    # the terminal's interrupt does not reach them.
+                    for _, stream in run_procs:
+                        stream.terminate()
+                    raise
 
             if not self.ui.options.until_failure:
                 return run_tests()
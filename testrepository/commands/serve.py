@@ -0,0 +1,283 @@
+#
+# Copyright (c) 2026 Testrepository Contributors
+#
+# Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+# license at the users choice. A copy of both licenses are available in the
+# project source as Apache-2.0 and BSD. You may not use this file except in
+# compliance with one of these two licences.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# license you chose for the specific language governing permissions and
+# limitations under that license.
+
+"""Serve commands for a repository from a resident process."""
+
+from io import StringIO, TextIOWrapper, RawIOBase
+import json
+import optparse
+import os
+import socket
+import traceback
+
+from testrepository import daemon
+from testrepository.commands import _find_command, Command
+from testrepository.repository import file
+
+
+class CachingRepository(file.Repository):
+    """A file repository which keeps what it reads in memory.
+
+    Test durations are kept until the timing database changes, so that
+    repeated queries from a resident process do not read them again. Stored
+    runs are kept until their file changes, but like any file repository run
+    they stream their content from disk when it is needed.
+    """
+
+    def __init__(self, base):
+        super(CachingRepository, self).__init__(base)
+        # run_id -> (stat key, run)
+        self._runs = {}
+        self._times_key = None
+        self._times = {}
+        self._untimed = set()
+
+    def _stat_key(self, path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def get_test_run(self, run_id):
+        key = self._stat_key(self._path(str(run_id)))
+        cached = self._runs.get(run_id)
+        if key is not None and cached is not None and cached[0] == key:
+            return cached[1]
+        run = super(CachingRepository, self).get_test_run(run_id)
+        self._runs[run_id] = (key, run)
+        return run
+
+    def _get_test_times(self, test_ids):
+        key = self._stat_key(self._path("times.db"))
+        if key != self._times_key:
+            self._times_key = key
+            self._times = {}
+            self._untimed = set()
+        missing = [
+            test_id
+            for test_id in test_ids
+            if test_id not in self._times and test_id not in self._untimed
+        ]
+        if missing:
+            found = super(CachingRepository, self)._get_test_times(missing)
+            self._times.update(found)
+            self._untimed.update(set(missing) - set(found))
+        return dict(
+            (test_id, self._times[test_id])
+            for test_id in test_ids
+            if test_id in self._times
+        )
+
+
+class CachingRepositoryFactory(file.RepositoryFactory):
+    """Open each repository once, as a CachingRepository."""
+
+    def __init__(self):
+        self._repositories = {}
+
+    def open(self, url):
+        base = super(CachingRepositoryFactory, self).open(url).base
+        if base not in self._repositories:
+            self._repositories[base] = CachingRepository(base)
+        return self._repositories[base]
+
+
+class _FrameWriter(RawIOBase):
+    """A binary stream writing frames of one kind to a client."""
+
+    def __init__(self, sock, kind):
+        self._sock = sock
+        self._kind = kind
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if data:
+            daemon.write_frame(self._sock, self._kind, bytes(data))
+        return len(data)
+
+
+class Server(object):
+    """Run commands for the repository at here, one connection at a time."""
+
+    def __init__(self, here, repository_factory=None, idle_timeout=None):
+        """Create a Server.
+
+        :param here: The directory holding the repository.
+        :param repository_factory: The factory to open the repository with.
+            Defaults to a CachingRepositoryFactory.
+        :param idle_timeout: Stop after this many seconds without a request,
+            or None to serve until stopped.
+        """
+        self.here = here
+        self.path = daemon.socket_path(here)
+        if repository_factory is None:
+            repository_factory = CachingRepositoryFactory()
+        self.repository_factory = repository_factory
+        self.idle_timeout = idle_timeout
+        self._sock = None
+
+    def start(self):
+        """Start listening on the repository's socket."""
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except OSError:
+                # Left behind by a server which did not shut down.
+                os.unlink(self.path)
+            else:
+                raise ValueError("A testr serve process is already running.")
+            finally:
+                probe.close()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            # Only the owner of the repository may connect.
+            old_umask = os.umask(0o177)
+            try:
+                sock.bind(self.path)
+            finally:
+                os.umask(old_umask)
+            sock.listen(16)
+        except:
+            sock.close()
+            raise
+        sock.settimeout(self.idle_timeout)
+        self._sock = sock
+
+    def stop(self):
+        """Stop listening, and remove the socket."""
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+    def serve(self, requests=None):
+        """Handle requests until stopped or idle for idle_timeout.
+
+        :param requests: The most requests to handle, or None for no limit.
+        """
+        while requests is None or requests > 0:
+            try:
+                conn, _ = self._sock.accept()
+            except socket.timeout:
+                return
+            with conn:
+                # Accepted sockets inherit the idle timeout: commands may
+                # take longer.
+                conn.settimeout(None)
+                self.handle(conn)
+            if requests is not None:
+                requests -= 1
+
+    def handle(self, conn):
+        """Run the command requested on conn, sending its output back."""
+        with conn.makefile("rb") as request:
+            line = request.readline()
+        if not line:
+            # Not a client: e.g. Server.start checking for a running server.
+            return
+        args = json.loads(line.decode("utf8"))["args"]
+        stderr = _FrameWriter(conn, daemon.STDERR)
+        try:
+            try:
+                code = self.run_command(args, _FrameWriter(conn, daemon.STDOUT), stderr)
+            except BrokenPipeError:
+                raise
+            except Exception:
+                # As run_argv would show it, without stopping the server.
+                stderr.write(traceback.format_exc().encode("utf8"))
+                code = 3
+            daemon.write_frame(conn, daemon.EXIT, b"%d" % code)
+        except BrokenPipeError:
+            # The client went away.
+            pass
+
+    def run_command(self, args, stdout, stderr):
+        """Run a command as run_argv would, in this process.
+
+        :param args: The command line arguments, without the program name.
+        :param stdout: A binary stream for stdout.
+        :param stderr: A binary stream for stderr.
+        :return: The exit code.
+        """
+        from testrepository.ui import cli
+
+        stdout = TextIOWrapper(stdout, "utf8", write_through=True)
+        stderr = TextIOWrapper(stderr, "utf8", write_through=True)
+        try:
+            cmd_name = [arg for arg in args if not arg.startswith("-")][0]
+            cmd_args = list(args)
+            cmd_args.remove(cmd_name)
+            cmdclass = _find_command(cmd_name)
+            if not cmdclass.resident:
+                stderr.write("testr serve cannot run %s.\n" % cmd_name)
+                return 1
+            # The client's here, unless it gave one explicitly.
+            ui = cli.UI(["-d", self.here] + cmd_args, StringIO(), stdout, stderr)
+            cmd = cmdclass(ui)
+            cmd.repository_factory = self.repository_factory
+            try:
+                return cmd.execute() or 0
+            except SystemExit as e:
+                return e.code or 0
+        finally:
+            stdout.flush()
+            stderr.flush()
+
+
+class serve(Command):
+    """Serve commands for this repository from a resident process.
+
+    Starting testr means importing its dependencies, which can take longer
+    than commands like failing, last and slowest take to run. testr serve
+    runs in the foreground, listening on a Unix socket in the repository:
+    while it runs, those commands (the ones that only read the repository)
+    are sent to it and run there, with stored runs and test durations kept in
+    memory between commands. When testr serve is not running, commands run
+    as usual.
+
+    Stop it with ^C, or let it stop after --idle-timeout seconds without a
+    command.
+    """
+
+    options = [
+        optparse.Option(
+            "--idle-timeout",
+            type="float",
+            default=None,
+            help="Stop after this many seconds without a command.",
+        ),
+    ]
+
+    def run(self):
+        if not hasattr(socket, "AF_UNIX"):
+            raise ValueError("testr serve needs Unix domain sockets.")
+        # Fail early if there is no repository.
+        self.repository_factory.open(self.ui.here)
+        server = Server(self.ui.here, idle_timeout=self.ui.options.idle_timeout)
+        server.start()
+        try:
+            self.ui.output_values([("serving", server.path)])
+            server.serve()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.stop()
+        return 0
@@ -0,0 +1,219 @@
+#
+# Copyright (c) 2026 Testrepository Contributors
+#
+# Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+# license at the users choice. A copy of both licenses are available in the
+# project source as Apache-2.0 and BSD. You may not use this file except in
+# compliance with one of these two licences.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# license you chose for the specific language governing permissions and
+# limitations under that license.
+
+"""Predict how long a test run would take with different scheduling."""
+
+import configparser
+import heapq
+import optparse
+
+from testrepository.arguments.string import StringArgument
+from testrepository.commands import Command
+from testrepository.commands.timeline import WorkerSpans
+from testrepository.testcommand import (
+    make_group_callback,
+    TestCommand,
+    TestListingFixture,
+)
+from testrepository.utils import timedelta_to_seconds
+
+
+def simulate_partitions(partitions, durations):
+    """Run partitions, one per worker, all at once.
+
+    :param durations: A dict mapping test ids to durations in seconds.
+    :return: A tuple (makespan, last_test): when the last worker finishes, and
+        the last test it runs.
+    """
+    makespan, last_test = 0.0, None
+    for partition in partitions:
+        finish = sum(durations.get(test_id, 0.0) for test_id in partition)
+        if partition and finish >= makespan:
+            makespan, last_test = finish, partition[-1]
+    return makespan, last_test
+
+
+def simulate_batches(batches, concurrency, durations):
+    """Run batches on concurrency workers, each taking the next when free.
+
+    :param durations: A dict mapping test ids to durations in seconds.
+    :return: A tuple (makespan, last_test), as for simulate_partitions.
+    """
+    workers = [0.0] * concurrency
+    makespan, last_test = 0.0, None
+    for batch in batches:
+        finish = heapq.heappop(workers)
+        finish += sum(durations.get(test_id, 0.0) for test_id in batch)
+        heapq.heappush(workers, finish)
+        if finish >= makespan:
+            makespan, last_test = finish, batch[-1]
+    return makespan, last_test
+
+
+class simulate(Command):
+    """Predict how long a test run would take with different scheduling.
+
+    The tests of the latest run (or the run whose id is given) are scheduled
+    as testr run would schedule them - with the durations recorded in the
+    repository and the group_regex from .testr.conf - at several
+    concurrencies, both partitioned (testr run --parallel) and in batches
+    (testr run --parallel --dynamic). The schedules are then replayed with
+    the durations the tests took in that run, without running anything.
+
+    For each, this shows the predicted makespan, the ideal - the total test
+    time divided by the number of workers, or the longest group if that is
+    longer - the imbalance of the makespan over the ideal and the group
+    which finishes last. Use --group-regex to try a different grouping. The
+    time taken to start test runner processes is not included.
+    """
+
+    resident = True
+
+    args = [StringArgument("run_id", min=0, max=1)]
+    options = [
+        optparse.Option(
+            "--concurrency",
+            default="2,4,8,16",
+            help="Comma separated numbers of workers to simulate.",
+        ),
+        optparse.Option(
+            "--group-regex",
+            default=None,
+            help="Group tests with this regex rather than the group_regex in "
+            ".testr.conf.",
+        ),
+    ]
+    # Can be assigned to to inject a custom command factory.
+    command_factory = TestCommand
+
+    def _get_config(self, repo):
+        testcommand = self.command_factory(self.ui, repo)
+        try:
+            parser = testcommand.get_parser()
+        except ValueError:
+            # No .testr.conf: simulate without groups or a batch size.
+            parser = configparser.ConfigParser()
+        group_regex = self.ui.options.group_regex
+        if group_regex is None:
+            try:
+                group_regex = parser.get("DEFAULT", "group_regex")
+            except configparser.NoOptionError:
+                group_regex = None
+        try:
+            batch_size = int(parser.get("DEFAULT", "test_batch_size"))
+        except configparser.NoOptionError:
+            batch_size = None
+        return group_regex, batch_size
+
+    def run(self):
+        try:
+            concurrencies = [
+                int(value) for value in self.ui.options.concurrency.split(",")
+            ]
+        except ValueError:
+            concurrencies = []
+        if not concurrencies or min(concurrencies) < 1:
+            raise ValueError(
+                "--concurrency must be a list of positive numbers, not %r."
+                % self.ui.options.concurrency
+            )
+        repo = self.repository_factory.open(self.ui.here)
+        if self.ui.arguments["run_id"]:
+            run_id = self.ui.arguments["run_id"][0]
+            try:
+                run_id = int(run_id)
+            except ValueError:
+                raise ValueError("Run id must be a number, not %r." % run_id)
+            test_run = repo.get_test_run(run_id)
+        else:
+            test_run = repo.get_latest_run()
+        result = WorkerSpans()
+        result.startTestRun()
+        try:
+            test_run.get_test().run(result)
+        finally:
+            result.stopTestRun()
+        durations = {}
+        for test_id, _, start, stop, _ in result.spans:
+            durations[test_id] = timedelta_to_seconds(stop - start)
+        if not durations:
+            return 0
+        test_ids = sorted(durations)
+        group_regex, batch_size = self._get_config(repo)
+        group_callback = make_group_callback(group_regex)
+
+        def group_of(test_id):
+            return (group_callback and group_callback(test_id)) or test_id
+
+        group_times = {}
+        for test_id in test_ids:
+            group_id = group_of(test_id)
+            group_times[group_id] = group_times.get(group_id, 0.0) + durations[test_id]
+        total = sum(durations.values())
+        longest = max(group_times.values())
+        fixture = TestListingFixture(
+            test_ids,
+            None,
+            None,
+            None,
+            self.ui,
+            repo,
+            group_callback=group_callback,
+            batch_size=batch_size,
+        )
+        rows = [
+            (
+                "Strategy",
+                "Workers",
+                "Makespan (s)",
+                "Ideal (s)",
+                "Imbalance",
+                "Last to finish",
+            )
+        ]
+        for concurrency in concurrencies:
+            ideal = max(total / concurrency, longest)
+            simulations = [
+                (
+                    "partition",
+                    simulate_partitions(
+                        fixture.partition_tests(test_ids, concurrency), durations
+                    ),
+                ),
+                (
+                    "dynamic",
+                    simulate_batches(
+                        fixture.batch_tests(test_ids, concurrency),
+                        concurrency,
+                        durations,
+                    ),
+                ),
+            ]
+            for strategy, (makespan, last_test) in simulations:
+                if ideal:
+                    imbalance = "%d%%" % round(100 * (makespan / ideal - 1))
+                else:
+                    imbalance = "-"
+                rows.append(
+                    (
+                        strategy,
+                        "%d" % concurrency,
+                        "%.3f" % makespan,
+                        "%.3f" % ideal,
+                        imbalance,
+                        group_of(last_test),
+                    )
+                )
+        self.ui.output_table(rows)
+        return 0
@@ -28,6 +28,8 @@ class slowest(Command):
     tests at the top.
     """
 
+    resident = True
+
     DEFAULT_ROWS_SHOWN = 10
     TABLE_HEADER = ("Test id", "Runtime (s)")
 
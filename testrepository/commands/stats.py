@@ -12,7 +12,7 @@
 # license you chose for the specific language governing permissions and
 # limitations under that license.
 
-"""Report stats about a repository. Current vestigial."""
+"""Report stats about a repository."""
 
 from testrepository.commands import Command
 
@@ -20,11 +20,29 @@ from testrepository.commands import Command
 class stats(Command):
     """Report stats about a repository.
 
-    This is currently vestigial, but should grow to be the main entry point for
+    This shows the number of runs in the repository and the headline figures
+    for the most recent run. It should grow to be the main entry point for
     getting summary information about the repository.
     """
 
+    resident = True
+
     def run(self):
         repo = self.repository_factory.open(self.ui.here)
-        self.ui.output_values([("runs", repo.count())])
+        values = [("runs", repo.count())]
+        try:
+            latest_run = repo.get_latest_run()
+        except KeyError:
+            latest_run = None
+        if latest_run is not None:
+            summary = latest_run.get_summary()
+            values.extend(
+                [
+                    ("latest", latest_run.get_id()),
+                    ("tests", summary.testsRun),
+                    ("failures", summary.get_num_failures()),
+                    ("skips", summary.skips),
+                ]
+            )
+        self.ui.output_values(values)
         return 0
@@ -0,0 +1,215 @@
+#
+# Copyright (c) 2026 Testrepository Contributors
+#
+# Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+# license at the users choice. A copy of both licenses are available in the
+# project source as Apache-2.0 and BSD. You may not use this file except in
+# compliance with one of these two licences.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# license you chose for the specific language governing permissions and
+# limitations under that license.
+
+"""Show how busy each worker was during a test run."""
+
+import json
+import optparse
+
+from testtools import StreamResult
+
+from testrepository.arguments.string import StringArgument
+from testrepository.commands import Command
+from testrepository.utils import timedelta_to_seconds
+
+
+class WorkerSpans(StreamResult):
+    """Gather when each test ran, and on which worker.
+
+    A test runs from the timestamp of its inprogress event to the timestamp
+    of its final status. Tests without an inprogress event take no time.
+    The worker is taken from the worker-N tag that parallel runs add to each
+    test, and is "" for tests without one.
+
+    :ivar spans: A list of (test_id, worker, start, stop, status) tuples, in
+        the order the tests finished. start and stop are datetimes.
+    """
+
+    _finished = frozenset(["success", "fail", "skip", "xfail", "uxsuccess"])
+
+    def startTestRun(self):
+        super(WorkerSpans, self).startTestRun()
+        self.spans = []
+        self._started = {}
+
+    def status(
+        self, test_id=None, test_status=None, test_tags=None, timestamp=None, **kwargs
+    ):
+        if test_id is None or timestamp is None:
+            return
+        if test_status == "inprogress":
+            self._started[test_id] = timestamp
+        elif test_status in self._finished:
+            worker = ""
+            for tag in test_tags or ():
+                if tag.startswith("worker-"):
+                    worker = tag
+            start = self._started.pop(test_id, timestamp)
+            self.spans.append((test_id, worker, start, timestamp, test_status))
+
+
+def summarise_workers(spans):
+    """Work out how busy each worker was.
+
+    :param spans: The spans gathered by WorkerSpans.
+    :return: A tuple (workers, makespan, busy). workers is a list of
+        (worker, tests, start, finish, busy, idle, idle_tail) tuples sorted by
+        worker, with times in seconds from the start of the run. idle is the
+        time between the start and finish of the worker not spent running
+        tests, and idle_tail the time from its finish to the end of the run.
+        makespan is the length of the run and busy the total time spent
+        running tests.
+    """
+    if not spans:
+        return [], 0.0, 0.0
+    run_start = min(span[2] for span in spans)
+    run_stop = max(span[3] for span in spans)
+    makespan = timedelta_to_seconds(run_stop - run_start)
+    by_worker = {}
+    for _, worker, start, stop, _ in spans:
+        by_worker.setdefault(worker, []).append((start, stop))
+    workers = []
+    for worker, intervals in by_worker.items():
+        start = timedelta_to_seconds(min(i[0] for i in intervals) - run_start)
+        finish = timedelta_to_seconds(max(i[1] for i in intervals) - run_start)
+        busy = sum(timedelta_to_seconds(stop - start) for start, stop in intervals)
+        workers.append(
+            (
+                worker,
+                len(intervals),
+                start,
+                finish,
+                busy,
+                max(finish - start - busy, 0.0),
+                makespan - finish,
+            )
+        )
+    # worker-10 after worker-9.
+    workers.sort(key=lambda row: (len(row[0]), row[0]))
+    return workers, makespan, sum(row[4] for row in workers)
+
+
+def chrome_trace(spans):
+    """Convert spans into a Chrome trace, as loaded by Perfetto.
+
+    Each worker is a thread, and each test a complete event on it.
+
+    :return: A dict which serialises to the trace JSON.
+    """
+    events = []
+    if spans:
+        run_start = min(span[2] for span in spans)
+        threads = {}
+        for test_id, worker, start, stop, status in spans:
+            if worker not in threads:
+                threads[worker] = len(threads)
+                events.append(
+                    {
+                        "name": "thread_name",
+                        "ph": "M",
+                        "pid": 1,
+                        "tid": threads[worker],
+                        "args": {"name": worker or "tests"},
+                    }
+                )
+            events.append(
+                {
+                    "name": test_id,
+                    "cat": status,
+                    "ph": "X",
+                    "pid": 1,
+                    "tid": threads[worker],
+                    "ts": round(timedelta_to_seconds(start - run_start) * 1e6),
+                    "dur": round(timedelta_to_seconds(stop - start) * 1e6),
+                }
+            )
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+class timeline(Command):
+    """Show how busy each worker was during a test run.
+
+    The run is the latest one unless a run id is given. For each worker of a
+    parallel run this shows the number of tests it ran, when it started and
+    finished (in seconds from the start of the run), how long it spent
+    running tests, how long it was idle between tests and the idle tail from
+    its finish to the end of the run. The makespan of the run is compared with
+    the ideal - the total test time divided by the number of workers - to
+    show how much wall clock time uneven partitioning cost.
+
+    Test times come from the timestamps in the run, so runs without them -
+    e.g. loaded from a subunit v1 stream - have no timeline.
+    """
+
+    resident = True
+
+    args = [StringArgument("run_id", min=0, max=1)]
+    options = [
+        optparse.Option(
+            "--trace",
+            default=None,
+            help="Write a Chrome trace (JSON) of the run to this file, for "
+            "viewing in Perfetto or chrome://tracing.",
+        ),
+    ]
+
+    def run(self):
+        repo = self.repository_factory.open(self.ui.here)
+        if self.ui.arguments["run_id"]:
+            run_id = self.ui.arguments["run_id"][0]
+            try:
+                run_id = int(run_id)
+            except ValueError:
+                raise ValueError("Run id must be a number, not %r." % run_id)
+            test_run = repo.get_test_run(run_id)
+        else:
+            test_run = repo.get_latest_run()
+        result = WorkerSpans()
+        result.startTestRun()
+        try:
+            test_run.get_test().run(result)
+        finally:
+            result.stopTestRun()
+        if self.ui.options.trace:
+            with open(self.ui.options.trace, "w") as trace:
+                json.dump(chrome_trace(result.spans), trace)
+        workers, makespan, busy = summarise_workers(result.spans)
+        if not workers:
+            return 0
+        rows = [
+            (
+                "Worker",
+                "Tests",
+                "Start (s)",
+                "Finish (s)",
+                "Busy (s)",
+                "Idle (s)",
+                "Idle tail (s)",
+            )
+        ]
+        for worker, tests, start, finish, worker_busy, idle, idle_tail in workers:
+            rows.append(
+                (worker or "-", "%d" % tests)
+                + tuple(
+                    "%.3f" % value
+                    for value in (start, finish, worker_busy, idle, idle_tail)
+                )
+            )
+        self.ui.output_table(rows)
+        ideal = busy / len(workers)
+        values = [("makespan", "%.3f" % makespan), ("ideal", "%.3f" % ideal)]
+        if makespan:
+            values.append(("efficiency", "%d%%" % round(100 * ideal / makespan)))
+        self.ui.output_values(values)
+        return 0
@@ -0,0 +1,112 @@
+#
+# Copyright (c) 2026 Testrepository Contributors
+#
+# Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+# license at the users choice. A copy of both licenses are available in the
+# project source as Apache-2.0 and BSD. You may not use this file except in
+# compliance with one of these two licences.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# license you chose for the specific language governing permissions and
+# limitations under that license.
+
+"""The client side of the resident testr process started by testr serve.
+
+A client connects to the Unix socket in the repository and sends the
+arguments of the command as a line of JSON. The server replies with frames of
+a kind byte, a 4 byte big endian length and that many bytes of payload: 'o'
+frames are stdout, 'e' frames stderr and a final 'x' frame holds the exit
+code in ASCII.
+
+This module is imported by every testr invocation, so it imports nothing
+heavy.
+"""
+
+import json
+import os
+import socket
+import struct
+
+SOCKET_NAME = "serve.sock"
+
+STDOUT = b"o"
+STDERR = b"e"
+EXIT = b"x"
+
+_HEADER = struct.Struct(">cI")
+
+
+def socket_path(here):
+    """Get the path of the socket for the repository at here."""
+    return os.path.join(os.path.expanduser(here), ".testrepository", SOCKET_NAME)
+
+
+def get_here(args):
+    """Get the directory a command runs in from its arguments.
+
+    This follows the -d/--here option of the command line UI, without
+    building its option parser.
+    """
+    here = os.getcwd()
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if arg == "--":
+            break
+        if arg in ("-d", "--here"):
+            if args:
+                here = args.pop(0)
+        elif arg.startswith("--here="):
+            here = arg[len("--here=") :]
+        elif arg.startswith("-d"):
+            here = arg[2:]
+    return here
+
+
+def write_frame(sock, kind, payload):
+    sock.sendall(_HEADER.pack(kind, len(payload)) + payload)
+
+
+def _read_exactly(stream, count):
+    data = stream.read(count)
+    if len(data) != count:
+        raise EOFError("Connection to testr serve lost.")
+    return data
+
+
+def call(args, stdout, stderr):
+    """Run a command in the resident process for its repository, if any.
+
+    :param args: The command line arguments, without the program name.
+    :param stdout: The stream for stdout, as passed to run_argv.
+    :param stderr: The stream for stderr.
+    :return: The exit code of the command, or None if no resident process is
+        serving the repository - the caller should then run the command
+        itself.
+    """
+    path = socket_path(get_here(args))
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(path):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(path)
+        except OSError:
+            # A stale socket, left by a server which did not shut down.
+            return None
+        sock.sendall(json.dumps({"args": list(args)}).encode("utf8") + b"\n")
+        replies = sock.makefile("rb")
+        with replies:
+            while True:
+                kind, length = _HEADER.unpack(_read_exactly(replies, _HEADER.size))
+                payload = _read_exactly(replies, length)
+                if kind == EXIT:
+                    return int(payload)
+                stream = stdout if kind == STDOUT else stderr
+                stream.flush()
+                getattr(stream, "buffer", stream).write(payload)
+                stream.flush()
+    finally:
+        sock.close()
@@ -0,0 +1,56 @@
+#
+# Copyright (c) 2026 Testrepository Contributors
+#
+# Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+# license at the users choice. A copy of both licenses are available in the
+# project source as Apache-2.0 and BSD. You may not use this file except in
+# compliance with one of these two licences.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# license you chose for the specific language governing permissions and
+# limitations under that license.
+
+"""Concurrent execution of blocking calls such as starting test processes."""
+
+from concurrent.futures import ThreadPoolExecutor
+
+# The most calls made at once.
+MAX_CONCURRENCY = 64
+
+
+def gather(calls, cleanup=None):
+    """Make calls concurrently and return their results.
+
+    The calls are blocking - for instance starting a process through
+    ui.subprocess_Popen - so they are made in a pool of threads. This works
+    the same whether or not the caller is running an asyncio event loop.
+
+    :param calls: An iterable of threadsafe callables taking no arguments.
+    :param cleanup: An optional callable to undo a call. If any of calls
+        raise, it is called with the result of each of the others once all
+        the calls have finished - for instance to stop the processes they
+        started.
+    :return: A list of the results of calls, in the same order as calls. If
+        calls raise, the exception from the earliest of them in calls is
+        raised once all the calls have finished and been cleaned up.
+    """
+    calls = list(calls)
+    if len(calls) < 2:
+        return [call() for call in calls]
+    with ThreadPoolExecutor(max_workers=min(len(calls), MAX_CONCURRENCY)) as executor:
+        futures = [executor.submit(call) for call in calls]
+    errors = [future.exception() for future in futures]
+    error = next((error for error in errors if error is not None), None)
+    if error is None:
+        return [future.result() for future in futures]
+    if cleanup is not None:
+        for future, call_error in zip(futures, errors):
+            if call_error is None:
+                try:
+                    cleanup(future.result())
+                except Exception:
+                    # The error from the calls is the one to report.
+                    pass
+    raise error
@@ -27,8 +27,6 @@ Repositories are identified by their URL, and new ones are made by calling
 the initialize function in the appropriate repository module.
 """
 
-from testtools import StreamToDict
-
 
 class AbstractRepositoryFactory(object):
     """Interface for making or opening repositories."""
@@ -78,6 +76,9 @@ class AbstractRepository(object):
 
         :param partial: If True, the stream being inserted only executed some
             tests rather than all the projects tests.
+            The partial attribute of the inserter can be set to True before
+            stopTestRun is called if that only becomes clear as the stream is
+            inserted - for instance because the test run was stopped early.
         :return an inserter: Inserters meet the extended TestResult protocol
             that testtools 0.9.2 and above offer. The startTestRun and
             stopTestRun methods in particular must be called.
@@ -119,6 +120,13 @@ class AbstractRepository(object):
         unknown_times = test_ids - set(known_times)
         return dict(known=known_times, unknown=unknown_times)
 
+    def get_all_test_times(self):
+        """Retrieve estimated times for every test with timing data.
+
+        :return: A dict mapping test ids to time in seconds.
+        """
+        raise NotImplementedError(self.get_all_test_times)
+
     def _get_test_times(self, test_ids):
         """Retrieve estimated times for tests test_ids.
 
@@ -134,6 +142,33 @@ class AbstractRepository(object):
         """Return the run id for the most recently inserted test run."""
         raise NotImplementedError(self.latest_id)
 
+    def get_test_listing(self, key):
+        """Retrieve the test ids stored by set_test_listing.
+
+        :param key: The key the listing was stored with.
+        :return: A list of test ids, or None if there is no listing stored
+            with key.
+        """
+        raise NotImplementedError(self.get_test_listing)
+
+    def set_test_listing(self, key, test_ids):
+        """Store a listing of test ids for later retrieval.
+
+        Only the most recently stored listing is kept.
+
+        :param key: A string identifying what was listed, such as a
+            fingerprint of the source tree and the list command.
+        :param test_ids: The list of test ids.
+        """
+        raise NotImplementedError(self.set_test_listing)
+
+    def get_instance_pool(self):
+        """Get the pool of test run environment instances kept for reuse.
+
+        :return: A testrepository.repository.instances.InstancePool.
+        """
+        raise NotImplementedError(self.get_instance_pool)
+
     def get_test_ids(self, run_id):
         """Return the test ids from the specified run.
 
@@ -141,6 +176,8 @@ class AbstractRepository(object):
         :return: a list of test ids for the tests that
             were part of the specified test run.
         """
+        from testtools import StreamToDict
+
         run = self.get_test_run(run_id)
         ids = []
 
@@ -175,6 +212,24 @@ class AbstractTestRun(object):
         """Get a subunit stream for this test run."""
         raise NotImplementedError(self.get_subunit_stream)
 
+    def get_summary(self):
+        """Get the headline figures for this test run.
+
+        Repositories that store a summary when a run is inserted should
+        override this; the default replays the whole run.
+
+        :return: A testrepository.results.RunSummary.
+        """
+        from testrepository.results import SummarizingResult
+
+        summary = SummarizingResult()
+        summary.startTestRun()
+        try:
+            self.get_test().run(summary)
+        finally:
+            summary.stopTestRun()
+        return summary.get_run_summary()
+
     def get_test(self):
         """Get a testtools.TestCase-like object that can be run.
 
@@ -0,0 +1,258 @@
+#
+# Copyright (c) 2026 Testrepository Contributors
+#
+# Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+# license at the users choice. A copy of both licenses are available in the
+# project source as Apache-2.0 and BSD. You may not use this file except in
+# compliance with one of these two licences.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# license you chose for the specific language governing permissions and
+# limitations under that license.
+
+"""Storage of many test runs in a single file."""
+
+import io
+import json
+import os
+import shutil
+import sqlite3
+
+from testrepository.repository import compression
+
+
+class _Segment(io.RawIOBase):
+    """Read length bytes of a file, starting from its current position."""
+
+    def __init__(self, stream, length):
+        self._stream = stream
+        self._remaining = length
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        view = memoryview(buffer)[: self._remaining]
+        if not len(view):
+            return 0
+        count = self._stream.readinto(view)
+        self._remaining -= count
+        return count
+
+    def close(self):
+        if not self.closed:
+            self._stream.close()
+            super(_Segment, self).close()
+
+
+def _copy(source, target, length):
+    """Copy length bytes from source to target."""
+    while length:
+        content = source.read(min(length, 65536))
+        if not content:
+            raise ValueError("Truncated pack file.")
+        target.write(content)
+        length -= len(content)
+
+
+class RunArchive(object):
+    """Test runs packed into a single file, with an index in SQLite.
+
+    The stored stream of each archived run is copied verbatim - compressed or
+    not - into the pack file, and the index records its offset and length,
+    when it was first stored and its summary. The index also records the ids
+    of removed runs, as ids are never reused.
+
+    The pack file is only appended to, except when archived runs are removed:
+    the runs that remain are then copied into a new pack file, which the
+    index switches to in the same transaction as the new offsets.
+    """
+
+    def __init__(self, base):
+        """Create a RunArchive.
+
+        :param base: The directory holding the index (archive.db) and pack
+            files (archive-N.pack). The index is created if needed.
+        """
+        self.base = base
+        self.path = os.path.join(base, "archive.db")
+
+    def _connect(self):
+        db = sqlite3.connect(self.path)
+        try:
+            with db:
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS runs ("
+                    "run_id INTEGER PRIMARY KEY, offset INTEGER NOT NULL, "
+                    "length INTEGER NOT NULL, stored REAL NOT NULL, summary TEXT)"
+                )
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS removed (run_id INTEGER PRIMARY KEY)"
+                )
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS pack (generation INTEGER PRIMARY KEY)"
+                )
+        except:
+            db.close()
+            raise
+        return db
+
+    def _pack_path(self, generation):
+        return os.path.join(self.base, "archive-%d.pack" % generation)
+
+    def _get_generation(self, db):
+        row = db.execute("SELECT generation FROM pack").fetchone()
+        if row is None:
+            return 0
+        return row[0]
+
+    def get_run(self, run_id):
+        """Get where an archived run is stored.
+
+        :return: None if run_id is not archived, or a tuple (location,
+            summary): location is for open_run, and summary is the dict of
+            the run's RunSummary or None if it had none.
+        """
+        db = self._connect()
+        try:
+            row = db.execute(
+                "SELECT offset, length, summary FROM runs WHERE run_id = ?",
+                (run_id,),
+            ).fetchone()
+            generation = self._get_generation(db)
+        finally:
+            db.close()
+        if row is None:
+            return None
+        offset, length, summary = row
+        if summary is not None:
+            summary = json.loads(summary)
+        return (self._pack_path(generation), offset, length), summary
+
+    def open_run(self, location):
+        """Open the stream of an archived run.
+
+        :param location: The location returned by get_run.
+        :return: A binary file-like object, which the caller should close.
+        """
+        path, offset, length = location
+        stream = open(path, "rb", buffering=0)
+        try:
+            stream.seek(offset)
+        except:
+            stream.close()
+            raise
+        return compression.decompress(io.BufferedReader(_Segment(stream, length)))
+
+    def get_stored_times(self):
+        """Get the ids of the archived runs, and when they were stored.
+
+        :return: A dict mapping run ids to times in seconds since the epoch.
+        """
+        db = self._connect()
+        try:
+            return dict(db.execute("SELECT run_id, stored FROM runs"))
+        finally:
+            db.close()
+
+    def count_removed(self):
+        """Get the number of runs that have been removed."""
+        db = self._connect()
+        try:
+            return db.execute("SELECT COUNT(*) FROM removed").fetchone()[0]
+        finally:
+            db.close()
+
+    def add(self, runs):
+        """Copy runs into the archive.
+
+        The pack file is synced to disk before the index is updated, so that
+        the caller can then remove the copied files.
+
+        :param runs: A list of (run_id, path, stored, summary) tuples: path is
+            the file holding the stored stream of the run, stored the time it
+            was stored and summary the dict of its RunSummary, or None.
+        """
+        db = self._connect()
+        try:
+            archived = set(
+                run_id for (run_id,) in db.execute("SELECT run_id FROM runs")
+            )
+            runs = [run for run in runs if run[0] not in archived]
+            if not runs:
+                return
+            rows = []
+            with open(self._pack_path(self._get_generation(db)), "ab") as pack:
+                # Anything after the last indexed run was left by an
+                # interrupted add, and is ignored.
+                offset = pack.seek(0, os.SEEK_END)
+                for run_id, path, stored, summary in runs:
+                    with open(path, "rb") as stream:
+                        shutil.copyfileobj(stream, pack)
+                    length = pack.tell() - offset
+                    if summary is not None:
+                        summary = json.dumps(summary)
+                    rows.append((run_id, offset, length, stored, summary))
+                    offset += length
+                pack.flush()
+                os.fsync(pack.fileno())
+            with db:
+                db.executemany(
+                    "INSERT INTO runs (run_id, offset, length, stored, summary) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+        finally:
+            db.close()
+
+    def remove(self, run_ids):
+        """Record that runs have been removed, dropping any that are archived.
+
+        :param run_ids: The ids of the removed runs, archived or not.
+        """
+        db = self._connect()
+        try:
+            run_ids = set(run_ids)
+            generation = self._get_generation(db)
+            rows = db.execute(
+                "SELECT run_id, offset, length, stored, summary FROM runs "
+                "ORDER BY offset"
+            ).fetchall()
+            kept = [row for row in rows if row[0] not in run_ids]
+            if len(kept) == len(rows):
+                with db:
+                    db.executemany(
+                        "INSERT OR IGNORE INTO removed (run_id) VALUES (?)",
+                        [(run_id,) for run_id in run_ids],
+                    )
+                return
+            # Copy the runs that remain into a new pack.
+            new_rows = []
+            with open(self._pack_path(generation), "rb") as old:
+                with open(self._pack_path(generation + 1), "wb") as new:
+                    for run_id, offset, length, stored, summary in kept:
+                        old.seek(offset)
+                        new_rows.append((run_id, new.tell(), length, stored, summary))
+                        _copy(old, new, length)
+                    new.flush()
+                    os.fsync(new.fileno())
+            with db:
+                db.execute("DELETE FROM runs")
+                db.executemany(
+                    "INSERT INTO runs (run_id, offset, length, stored, summary) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    new_rows,
+                )
+                db.executemany(
+                    "INSERT OR IGNORE INTO removed (run_id) VALUES (?)",
+                    [(run_id,) for run_id in run_ids],
+                )
+                db.execute("DELETE FROM pack")
+                db.execute(
+                    "INSERT INTO pack (generation) VALUES (?)", (generation + 1,)
+                )
+            os.unlink(self._pack_path(generation))
+        finally:
+            db.close()
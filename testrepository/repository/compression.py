@@ -0,0 +1,153 @@
+#
+# Copyright (c) 2026 Testrepository Contributors
+#
+# Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+# license at the users choice. A copy of both licenses are available in the
+# project source as Apache-2.0 and BSD. You may not use this file except in
+# compliance with one of these two licences.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# license you chose for the specific language governing permissions and
+# limitations under that license.
+
+"""Compression of the streams stored in file repositories.
+
+A compressed stream starts with the magic bytes of its compression, so each
+stream records how it was stored and a repository can hold streams stored
+with different compressions, or none: uncompressed subunit v2 starts with
+0xb3, which neither compression starts with.
+
+zlib compressed streams use the gzip framing, to have magic bytes. zstd needs
+the zstandard package, which is optional.
+"""
+
+import gzip
+import io
+import zlib
+
+COMPRESSIONS = ("none", "zlib", "zstd")
+
+ZLIB_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def _get_zstandard():
+    """Get the zstandard module, or None if it is not installed."""
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def zstd_available():
+    """Return True if streams can be stored with zstd."""
+    return _get_zstandard() is not None
+
+
+class _CompressingWriter(io.BufferedIOBase):
+    """Compress what is written before writing it to a file.
+
+    Flushing does not flush the compressor, as subunit flushes after every
+    packet; the compressed stream is completed when the writer is closed.
+    """
+
+    def __init__(self, stream, compressor):
+        self._stream = stream
+        self._compressor = compressor
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._stream.write(self._compressor.compress(bytes(data)))
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            try:
+                self._stream.write(self._compressor.flush())
+            finally:
+                self._stream.close()
+                super(_CompressingWriter, self).close()
+
+
+class _DecompressingReader(io.BufferedIOBase):
+    """Read from a decompressing reader, closing its file when closed."""
+
+    def __init__(self, reader, stream):
+        self._reader = reader
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        return self._reader.read(size)
+
+    def close(self):
+        if not self.closed:
+            try:
+                self._reader.close()
+            finally:
+                self._stream.close()
+                super(_DecompressingReader, self).close()
+
+
+def open_writer(stream, compression):
+    """Compress what is written to stream.
+
+    :param stream: A binary file opened for writing.
+    :param compression: One of COMPRESSIONS, or None for none.
+    :return: A binary file-like object to write to. Closing it closes stream.
+    """
+    if compression in (None, "none"):
+        return stream
+    if compression == "zlib":
+        # wbits of 31 selects the gzip framing.
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    elif compression == "zstd":
+        zstandard = _get_zstandard()
+        if zstandard is None:
+            raise ValueError("zstd compression needs the zstandard package.")
+        compressor = zstandard.ZstdCompressor().compressobj()
+    else:
+        raise ValueError("Unknown compression %r." % compression)
+    return _CompressingWriter(stream, compressor)
+
+
+def open_stream(path):
+    """Open the stream stored at path, decompressing it if it is compressed.
+
+    :return: A binary file-like object, which the caller should close.
+    """
+    return decompress(open(path, "rb"))
+
+
+def decompress(stream):
+    """Decompress a stored stream if it is compressed.
+
+    :param stream: A binary file-like object supporting peek, positioned at
+        the start of the stored stream.
+    :return: A binary file-like object. Closing it closes stream.
+    """
+    try:
+        magic = stream.peek(len(ZSTD_MAGIC))
+        if magic.startswith(ZLIB_MAGIC):
+            reader = gzip.GzipFile(fileobj=stream, mode="rb")
+        elif magic.startswith(ZSTD_MAGIC):
+            zstandard = _get_zstandard()
+            if zstandard is None:
+                raise ValueError(
+                    "A stored stream is zstd compressed: reading it needs the "
+                    "zstandard package."
+                )
+            reader = zstandard.ZstdDecompressor().stream_reader(stream, closefd=False)
+        else:
+            return stream
+    except:
+        stream.close()
+        raise
+    return _DecompressingReader(reader, stream)
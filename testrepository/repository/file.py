@@ -14,30 +14,33 @@
 
 """Persistent storage of test results."""
 
+from collections import OrderedDict
 from io import BytesIO
-
-try:
-    import anydbm as dbm
-except ImportError:
-    import dbm
 import errno
+import json
 from operator import methodcaller
 import os.path
-import sys
 import tempfile
 
-import subunit.v2
-from subunit import TestProtocolClient
-import testtools
-
 from testrepository.repository import (
     AbstractRepository,
     AbstractRepositoryFactory,
     AbstractTestRun,
     RepositoryNotFound,
+    compression,
 )
+from testrepository.summary import RunSummary
+from testrepository.testlist import parse_list, write_list
 from testrepository.utils import timedelta_to_seconds
 
+# The repository format written by this module. Format 1 repositories stored
+# subunit v1 streams; format 2 stores subunit v2 streams verbatim.
+FORMAT = "2\n"
+
+# subunit and testtools (and the stores, which need sqlite3) are imported where
+# they are used: commands that only read summaries and test ids should not
+# pay for importing them.
+
 
 def atomicish_rename(source, target):
     if os.name != "posix" and os.path.exists(target):
@@ -45,6 +48,54 @@ def atomicish_rename(source, target):
     os.rename(source, target)
 
 
+def _v1_to_v2(v1_content):
+    """Transcode subunit v1 bytes into subunit v2 bytes."""
+    import subunit.v2
+    import testtools
+
+    v1_case = subunit.ProtocolTestCase(BytesIO(v1_content))
+    output = BytesIO()
+    output_stream = subunit.v2.StreamResultToBytes(output)
+    output_stream = testtools.ExtendedToStreamDecorator(output_stream)
+    output_stream.startTestRun()
+    try:
+        v1_case.run(output_stream)
+    finally:
+        output_stream.stopTestRun()
+    return output.getvalue()
+
+
+def _upgrade_format_1(base):
+    """Upgrade the format 1 repository at base to the current format.
+
+    Each stored stream (and the failing stream) is transcoded from subunit v1
+    to subunit v2 in place; the format file is only rewritten once every
+    stream has been converted, so an interrupted upgrade is simply redone.
+    """
+    import subunit.v2
+
+    names = [name for name in os.listdir(base) if name.isdigit()]
+    names.append("failing")
+    for name in names:
+        path = os.path.join(base, name)
+        try:
+            with open(path, "rb") as fp:
+                content = fp.read()
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                continue
+            raise
+        if content[:1] == subunit.v2.SIGNATURE:
+            # Already transcoded by an earlier, interrupted, upgrade.
+            continue
+        with open(path + ".new", "wb") as fp:
+            fp.write(_v1_to_v2(content))
+        atomicish_rename(path + ".new", path)
+    with open(os.path.join(base, "format.new"), "wt") as stream:
+        stream.write(FORMAT)
+    atomicish_rename(os.path.join(base, "format.new"), os.path.join(base, "format"))
+
+
 class RepositoryFactory(AbstractRepositoryFactory):
     def initialise(klass, url):
         """Create a repository at url/path."""
@@ -52,7 +103,7 @@ class RepositoryFactory(AbstractRepositoryFactory):
         os.mkdir(base)
         stream = open(os.path.join(base, "format"), "wt")
         try:
-            stream.write("1\n")
+            stream.write(FORMAT)
         finally:
             stream.close()
         result = Repository(base)
@@ -69,8 +120,11 @@ class RepositoryFactory(AbstractRepositoryFactory):
                 raise RepositoryNotFound(url)
             raise
         with stream:
-            if "1\n" != stream.read():
-                raise ValueError(url)
+            format = stream.read()
+        if format == "1\n":
+            _upgrade_format_1(base)
+        elif format != FORMAT:
+            raise ValueError(url)
         return Repository(base)
 
 
@@ -83,8 +137,14 @@ class Repository(AbstractRepository):
     This particular disk layout is subject to change at any time, as its
     primarily a bootstrapping exercise at this point. Any changes made are
     likely to have an automatic upgrade process.
+
+    :ivar compression: The compression new streams are stored with: one of
+        testrepository.repository.compression.COMPRESSIONS, or None for none.
+        Streams are read with whatever compression they were stored with.
     """
 
+    compression = None
+
     def __init__(self, base):
         """Create a file-based repository object for the repo at 'base'.
 
@@ -94,7 +154,7 @@ class Repository(AbstractRepository):
 
     def _allocate(self):
         # XXX: lock the file. K?!
-        value = self.count()
+        value = self._next_stream()
         self._write_next_stream(value + 1)
         return value
 
@@ -107,7 +167,89 @@ class Repository(AbstractRepository):
             raise ValueError("Corrupt next-stream file: %r" % next_content)
 
     def count(self):
-        return self._next_stream()
+        archive = self._get_archive()
+        if archive is None:
+            return self._next_stream()
+        return self._next_stream() - archive.count_removed()
+
+    def _get_archive(self, create=False):
+        """Get the archive of packed runs.
+
+        :param create: If True, create the archive if there is none.
+        :return: A RunArchive, or None if there is no archive and create is
+            False.
+        """
+        from testrepository.repository.archive import RunArchive
+
+        archive = RunArchive(self.base)
+        if not create and not os.path.exists(archive.path):
+            return None
+        return archive
+
+    def get_stored_runs(self):
+        """Get the ids of the runs stored in the repository.
+
+        :return: A dict mapping run ids to the time each run was inserted, in
+            seconds since the epoch.
+        """
+        runs = {}
+        archive = self._get_archive()
+        if archive is not None:
+            runs.update(archive.get_stored_times())
+        for name in os.listdir(self.base):
+            if name.isdigit():
+                runs[int(name)] = os.path.getmtime(self._path(name))
+        return runs
+
+    def remove_runs(self, run_ids):
+        """Remove runs from the repository.
+
+        The ids of removed runs are not reused, and count() no longer counts
+        them.
+        """
+        run_ids = list(run_ids)
+        if not run_ids:
+            return
+        self._get_archive(create=True).remove(run_ids)
+        for run_id in run_ids:
+            for path in (self._path(str(run_id)), self._summary_path(run_id)):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+
+    def pack_runs(self, run_ids):
+        """Move runs from their own files into the archive.
+
+        They can still be got with get_test_run, but no longer take a file
+        (and a summary file) each.
+
+        :return: The ids of the runs packed: runs already in the archive are
+            skipped.
+        """
+        runs = []
+        for run_id in run_ids:
+            path = self._path(str(run_id))
+            try:
+                stored = os.path.getmtime(path)
+            except FileNotFoundError:
+                continue
+            try:
+                with open(self._summary_path(run_id), "rt") as stream:
+                    summary = json.load(stream)
+            except FileNotFoundError:
+                summary = None
+            runs.append((run_id, path, stored, summary))
+        if not runs:
+            return []
+        self._get_archive(create=True).add(runs)
+        for run_id, path, _, _ in runs:
+            os.unlink(path)
+            try:
+                os.unlink(self._summary_path(run_id))
+            except FileNotFoundError:
+                pass
+        return [run[0] for run in runs]
 
     def latest_id(self):
         result = self._next_stream() - 1
@@ -116,53 +258,101 @@ class Repository(AbstractRepository):
         return result
 
     def get_failing(self):
-        try:
-            with open(os.path.join(self.base, "failing"), "rb") as fp:
-                run_subunit_content = fp.read()
-        except IOError:
-            err = sys.exc_info()[1]
-            if err.errno == errno.ENOENT:
-                run_subunit_content = b""
-            else:
+        path = self._path("failing")
+
+        def open_content():
+            try:
+                return compression.open_stream(path)
+            except IOError as e:
+                if e.errno == errno.ENOENT:
+                    return BytesIO()
                 raise
-        return _DiskRun(None, run_subunit_content)
+
+        return _DiskRun(None, open_content)
 
     def get_test_run(self, run_id):
+        path = self._path(str(run_id))
         try:
-            with open(os.path.join(self.base, str(run_id)), "rb") as fp:
-                run_subunit_content = fp.read()
+            # Only check the run is readable here: the content is read when
+            # it is needed, as callers wanting just the summary (e.g. for the
+            # previous run) need not read the run at all.
+            open(path, "rb").close()
         except IOError as e:
-            if e.errno == errno.ENOENT:
-                raise KeyError("No such run.")
-            raise
-        return _DiskRun(run_id, run_subunit_content)
+            if e.errno != errno.ENOENT:
+                raise
+            return self._get_archived_run(run_id)
+        return _DiskRun(
+            run_id, lambda: compression.open_stream(path), self._summary_path(run_id)
+        )
+
+    def _get_archived_run(self, run_id):
+        archive = self._get_archive()
+        stored = None
+        if archive is not None and str(run_id).isdigit():
+            run_id = int(run_id)
+            stored = archive.get_run(run_id)
+        if stored is None:
+            raise KeyError("No such run.")
+        location, summary = stored
+        return _DiskRun(run_id, lambda: archive.open_run(location), summary=summary)
 
     def _get_inserter(self, partial):
         return _Inserter(self, partial)
 
-    def _get_test_times(self, test_ids):
-        # May be too slow, but build and iterate.
-        # 'c' because an existing repo may be missing a file.
-        db = dbm.open(self._path("times.dbm"), "c")
+    def get_test_listing(self, key):
         try:
-            result = {}
-            for test_id in test_ids:
-                if not isinstance(test_id, str):
-                    test_id = test_id.encode("utf8")
-                # gdbm does not support get().
-                try:
-                    duration = db[test_id]
-                except KeyError:
-                    duration = None
-                if duration is not None:
-                    result[test_id] = float(duration)
-            return result
-        finally:
-            db.close()
+            with open(self._path("test-listing"), "rb") as stream:
+                content = stream.read()
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return None
+            raise
+        listing_key, _, test_ids = content.partition(b"\n")
+        if listing_key.decode("utf8") != key:
+            return None
+        return parse_list(test_ids)
+
+    def set_test_listing(self, key, test_ids):
+        path = self._path("test-listing")
+        with open(path + ".new", "wb") as stream:
+            stream.write(key.encode("utf8") + b"\n")
+            write_list(stream, test_ids)
+        atomicish_rename(path + ".new", path)
+
+    def get_all_test_times(self):
+        return self.get_timing_store().get_all_estimates()
+
+    def _get_test_times(self, test_ids):
+        return self.get_timing_store().get_estimates(test_ids)
+
+    def get_timing_store(self):
+        """Get the TimingStore holding this repository's test durations.
+
+        Repositories from before the store existed kept only the last
+        duration of each test in times.dbm; those are imported the first
+        time the store is used.
+        """
+        from testrepository.repository.timing import TimingStore
+
+        return TimingStore(self._path("times.db"), self._path("times.dbm"))
+
+    def get_instance_pool(self):
+        from testrepository.repository.instances import InstancePool
+
+        return InstancePool(self._path("instances.db"))
 
     def _path(self, suffix):
         return os.path.join(self.base, suffix)
 
+    def _summary_path(self, run_id):
+        return self._path("%s.summary" % run_id)
+
+    def _write_summary(self, run_id, summary):
+        path = self._summary_path(run_id)
+        with open(path + ".new", "wt") as stream:
+            json.dump(summary.to_dict(), stream)
+        atomicish_rename(path + ".new", path)
+
     def _write_next_stream(self, value):
         # Note that this is unlocked and not threadsafe : for now, shrug - single
         # user, repo-per-working-tree model makes this acceptable in the short
@@ -180,71 +370,101 @@ class Repository(AbstractRepository):
 class _DiskRun(AbstractTestRun):
     """A test run that was inserted into the repository."""
 
-    def __init__(self, run_id, subunit_content):
-        """Create a _DiskRun with the content subunit_content."""
+    def __init__(self, run_id, open_content, summary_path=None, summary=None):
+        """Create a _DiskRun.
+
+        :param run_id: The id of the run, or None.
+        :param open_content: A nullary callable returning a new binary
+            file-like object holding the subunit content of the run. It is
+            called each time the content is needed, and the content is
+            streamed from it rather than kept, so that large runs (e.g. with
+            attached logs) are not held in memory.
+        :param summary_path: The path to the summary record for the run, if
+            one may exist.
+        :param summary: The summary record for the run, as a dict, if it is
+            already known.
+        """
         self._run_id = run_id
-        self._content = subunit_content
-        assert type(subunit_content) is bytes
+        self._open_content = open_content
+        self._summary_path = summary_path
+        self._summary = summary
 
     def get_id(self):
         return self._run_id
 
     def get_subunit_stream(self):
-        # Transcode - we want V2.
-        v1_stream = BytesIO(self._content)
-        v1_case = subunit.ProtocolTestCase(v1_stream)
-        output = BytesIO()
-        output_stream = subunit.v2.StreamResultToBytes(output)
-        output_stream = testtools.ExtendedToStreamDecorator(output_stream)
-        output_stream.startTestRun()
-        try:
-            v1_case.run(output_stream)
-        finally:
-            output_stream.stopTestRun()
-        output.seek(0)
-        return output
+        # Stored as V2 already - no transcoding needed.
+        return self._open_content()
+
+    def get_summary(self):
+        if self._summary is not None:
+            return RunSummary.from_dict(self._summary)
+        if self._summary_path is not None:
+            try:
+                with open(self._summary_path, "rt") as stream:
+                    return RunSummary.from_dict(json.load(stream))
+            except IOError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+        # Runs inserted before summaries were recorded.
+        return super(_DiskRun, self).get_summary()
 
     def get_test(self):
-        # case = subunit.ProtocolTestCase(self.get_subunit_stream())
-        case = subunit.ProtocolTestCase(BytesIO(self._content))
+        import testtools
 
         def wrap_result(result):
             # Wrap in a router to mask out startTestRun/stopTestRun from the
             # ExtendedToStreamDecorator.
             result = testtools.StreamResultRouter(result, do_start_stop_run=False)
-            # Wrap that in ExtendedToStreamDecorator to convert v1 calls to
-            # StreamResult.
+            # Wrap that in ExtendedToStreamDecorator to permit v1 results to
+            # be supplied.
             return testtools.ExtendedToStreamDecorator(result)
 
         return testtools.DecorateTestCaseResult(
-            case, wrap_result, methodcaller("startTestRun"), methodcaller("stopTestRun")
+            _StoredStreamCase(self._open_content),
+            wrap_result,
+            methodcaller("startTestRun"),
+            methodcaller("stopTestRun"),
         )
 
 
+class _StoredStreamCase(object):
+    """Parse a stored stream into a result, opening it afresh for each run."""
+
+    def __init__(self, open_content):
+        self._open_content = open_content
+
+    def run(self, result):
+        import subunit
+
+        with self._open_content() as stream:
+            case = subunit.ByteStreamToStreamResult(stream, non_subunit_name="stdout")
+            case.run(result)
+
+
 class _SafeInserter(object):
     def __init__(self, repository, partial=False):
-        # XXX: Perhaps should factor into a decorator and use an unaltered
-        # TestProtocolClient.
+        import subunit.v2
+        import testtools
+
+        from testrepository.results import SummarizingResult
+
         self._repository = repository
         fd, name = tempfile.mkstemp(dir=self._repository.base)
         self.fname = name
-        stream = os.fdopen(fd, "wb")
+        stream = compression.open_writer(
+            os.fdopen(fd, "wb"), self._repository.compression
+        )
         self.partial = partial
-        # The time take by each test, flushed at the end.
-        self._times = {}
-        self._test_start = None
-        self._time = None
-        subunit_client = testtools.StreamToExtendedDecorator(TestProtocolClient(stream))
+        self._summary = SummarizingResult()
+        subunit_client = subunit.v2.StreamResultToBytes(stream)
         self.hook = testtools.CopyStreamResult(
-            [subunit_client, testtools.StreamToDict(self._handle_test)]
+            [subunit_client, testtools.StreamToDict(self._handle_test), self._summary]
         )
         self._stream = stream
 
     def _handle_test(self, test_dict):
-        start, stop = test_dict["timestamps"]
-        if test_dict["status"] == "exists" or None in (start, stop):
-            return
-        self._times[test_dict["id"]] = str(timedelta_to_seconds(stop - start))
+        """Called with each test as it completes."""
 
     def startTestRun(self):
         self.hook.startTestRun()
@@ -257,24 +477,13 @@ class _SafeInserter(object):
         run_id = self._name()
         final_path = os.path.join(self._repository.base, str(run_id))
         atomicish_rename(self.fname, final_path)
-        # May be too slow, but build and iterate.
-        db = dbm.open(self._repository._path("times.dbm"), "c")
-        try:
-            db_times = {}
-            for key, value in self._times.items():
-                if not isinstance(key, str):
-                    key = key.encode("utf8")
-                db_times[key] = value
-            if getattr(db, "update", None):
-                db.update(db_times)
-            else:
-                for key, value in db_times.items():
-                    db[key] = value
-        finally:
-            db.close()
         self._run_id = run_id
 
     def status(self, *args, **kwargs):
+        if kwargs.get("test_status") == "exists":
+            # Runners enumerate their tests before running them: the listing
+            # is not part of the run, and format 1 never stored it.
+            return
         self.hook.status(*args, **kwargs)
 
     def _cancel(self):
@@ -294,38 +503,74 @@ class _FailingInserter(_SafeInserter):
 
 
 class _Inserter(_SafeInserter):
+    def __init__(self, repository, partial=False):
+        super(_Inserter, self).__init__(repository, partial)
+        # The outcome of each test, in the order they completed: (test_id,
+        # test_dict) for failures and (test_id, None) for anything else.
+        # Only failures need their details kept for the failing stream.
+        self._outcomes = []
+        # The time taken by each test, flushed at the end.
+        self._times = {}
+
     def _name(self):
         return self._repository._allocate()
 
+    def _handle_test(self, test_dict):
+        if test_dict["status"] == "fail":
+            self._outcomes.append((test_dict["id"], test_dict))
+        else:
+            self._outcomes.append((test_dict["id"], None))
+        start, stop = test_dict["timestamps"]
+        if test_dict["status"] == "exists" or None in (start, stop):
+            return
+        self._times[test_dict["id"]] = timedelta_to_seconds(stop - start)
+
+    def _get_failing_dicts(self):
+        """Get the test dicts in the current failing stream."""
+        import testtools
+
+        failing = OrderedDict()
+
+        def gather(test_dict):
+            failing[test_dict["id"]] = test_dict
+
+        result = testtools.StreamToDict(gather)
+        result.startTestRun()
+        try:
+            self._repository.get_failing().get_test().run(result)
+        finally:
+            result.stopTestRun()
+        return failing
+
     def stopTestRun(self):
+        import testtools
+
         super(_Inserter, self).stopTestRun()
+        self._repository._write_summary(self.get_id(), self._summary.get_run_summary())
+        if self._times:
+            self._repository.get_timing_store().record(self._times)
         # XXX: locking (other inserts may happen while we update the failing
         # file).
-        # Combine failing + this run : strip passed tests, add failures.
-        # use memory repo to aggregate. a bit awkward on layering ;).
-        # Should just pull the failing items aside as they happen perhaps.
-        # Or use a router and avoid using a memory object at all.
-        from testrepository.repository import memory
-
-        repo = memory.Repository()
+        # Combine failing + this run : strip passed tests, add failures. The
+        # outcomes were gathered as the run streamed in, so only a partial
+        # run needs to read anything back - the existing failures.
         if self.partial:
-            # Seed with current failing
-            inserter = testtools.ExtendedToStreamDecorator(repo.get_inserter())
-            inserter.startTestRun()
-            failing = self._repository.get_failing()
-            failing.get_test().run(inserter)
-            inserter.stopTestRun()
-        inserter = testtools.ExtendedToStreamDecorator(repo.get_inserter(partial=True))
-        inserter.startTestRun()
-        run = self._repository.get_test_run(self.get_id())
-        run.get_test().run(inserter)
-        inserter.stopTestRun()
+            failing = self._get_failing_dicts()
+        else:
+            failing = OrderedDict()
+        for test_id, test_dict in self._outcomes:
+            if test_dict is not None:
+                failing[test_id] = test_dict
+            else:
+                failing.pop(test_id, None)
         # and now write to failing
         inserter = _FailingInserter(self._repository)
         _inserter = testtools.ExtendedToStreamDecorator(inserter)
         _inserter.startTestRun()
         try:
-            repo.get_failing().get_test().run(_inserter)
+            for test_dict in failing.values():
+                case = testtools.testresult.real.test_dict_to_case(test_dict)
+                case.run(_inserter)
         except:
             inserter._cancel()
             raise
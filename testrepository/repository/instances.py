@@ -0,0 +1,207 @@
+#
+# Copyright (c) 2026 Testrepository Contributors
+#
+# Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+# license at the users choice. A copy of both licenses are available in the
+# project source as Apache-2.0 and BSD. You may not use this file except in
+# compliance with one of these two licences.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# license you chose for the specific language governing permissions and
+# limitations under that license.
+
+"""A persistent pool of provisioned test run environment instances."""
+
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+
+def pid_alive(pid):
+    """Is there a process with id pid on this machine?"""
+    if sys.platform == "win32":
+        # os.kill would terminate the process: assume it lives.
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # It exists, but belongs to someone else.
+        return True
+    return True
+
+
+class InstancePool(object):
+    """Instances kept in an SQLite database for reuse by later test runs.
+
+    Each instance is either leased, by the process using it, or idle. Leases
+    are taken in a transaction, so processes sharing a repository never
+    lease the same instance. Instance ids are strings.
+    """
+
+    def __init__(self, path):
+        """Create an InstancePool.
+
+        :param path: The path of the SQLite database, which is created if
+            needed, or ':memory:' for a pool private to this object.
+        """
+        self.path = path
+        self._db = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._db is None:
+            # Used from whichever thread is provisioning, under self._lock.
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.isolation_level = None
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS instances ("
+                "instance_id TEXT PRIMARY KEY, holder INTEGER, "
+                "leased_at REAL, idle_since REAL)"
+            )
+            self._db = db
+        return self._db
+
+    def _transaction(self, operation):
+        with self._lock:
+            db = self._connect()
+            # IMMEDIATE takes the write lock up front, so that reading and
+            # updating leases is atomic across processes.
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                result = operation(db)
+            except:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+            return result
+
+    def close(self):
+        """Close the database, until the pool is next used.
+
+        An in-memory pool keeps its database, as closing it would lose it.
+        """
+        with self._lock:
+            if self._db is not None and self.path != ":memory:":
+                self._db.close()
+                self._db = None
+
+    def add(self, instance_ids, holder, now=None):
+        """Record newly provisioned instances as leased by holder.
+
+        :param holder: The process id of the process using the instances.
+        """
+        now = time.time() if now is None else now
+        rows = [(instance_id, holder, now) for instance_id in instance_ids]
+
+        def add(db):
+            db.executemany(
+                "INSERT OR REPLACE INTO instances "
+                "(instance_id, holder, leased_at, idle_since) VALUES (?, ?, ?, NULL)",
+                rows,
+            )
+
+        self._transaction(add)
+
+    def acquire(self, count, holder, now=None):
+        """Lease up to count idle instances to holder.
+
+        The most recently used instances are leased first.
+
+        :return: A list of the leased instance ids.
+        """
+        now = time.time() if now is None else now
+
+        def acquire(db):
+            instance_ids = [
+                row[0]
+                for row in db.execute(
+                    "SELECT instance_id FROM instances WHERE holder IS NULL "
+                    "ORDER BY idle_since DESC LIMIT ?",
+                    (count,),
+                )
+            ]
+            db.executemany(
+                "UPDATE instances SET holder = ?, leased_at = ?, idle_since = NULL "
+                "WHERE instance_id = ?",
+                [(holder, now, instance_id) for instance_id in instance_ids],
+            )
+            return instance_ids
+
+        return self._transaction(acquire)
+
+    def release(self, instance_ids, now=None):
+        """Return leased instances to the pool for reuse."""
+        now = time.time() if now is None else now
+
+        def release(db):
+            db.executemany(
+                "UPDATE instances SET holder = NULL, leased_at = NULL, "
+                "idle_since = ? WHERE instance_id = ?",
+                [(now, instance_id) for instance_id in instance_ids],
+            )
+
+        self._transaction(release)
+
+    def remove(self, instance_ids):
+        """Forget instances, e.g. because they have been disposed of."""
+
+        def remove(db):
+            db.executemany(
+                "DELETE FROM instances WHERE instance_id = ?",
+                [(instance_id,) for instance_id in instance_ids],
+            )
+
+        self._transaction(remove)
+
+    def take_expired(self, idle_timeout, now=None, alive=pid_alive):
+        """Remove and return the instances which should be disposed of.
+
+        These are the instances idle for longer than idle_timeout, and those
+        leased by processes which no longer exist.
+
+        :param idle_timeout: A number of seconds, or None to take every idle
+            instance.
+        :param alive: A callable telling if a holder process still exists.
+        :return: A list of the instance ids taken.
+        """
+        now = time.time() if now is None else now
+
+        def take(db):
+            expired = []
+            for instance_id, holder, idle_since in db.execute(
+                "SELECT instance_id, holder, idle_since FROM instances"
+            ):
+                if holder is None:
+                    if idle_timeout is None or idle_since + idle_timeout < now:
+                        expired.append(instance_id)
+                elif not alive(holder):
+                    expired.append(instance_id)
+            db.executemany(
+                "DELETE FROM instances WHERE instance_id = ?",
+                [(instance_id,) for instance_id in expired],
+            )
+            return expired
+
+        return self._transaction(take)
+
+    def list(self):
+        """List the instances in the pool.
+
+        :return: A list of (instance_id, holder, leased_at, idle_since) tuples
+            sorted by instance id. holder and leased_at are None for idle
+            instances, and idle_since is None for leased ones.
+        """
+        return self._transaction(
+            lambda db: list(
+                db.execute(
+                    "SELECT instance_id, holder, leased_at, idle_since "
+                    "FROM instances ORDER BY instance_id"
+                )
+            )
+        )
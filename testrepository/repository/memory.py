@@ -27,6 +27,7 @@ from testrepository.repository import (
     AbstractTestRun,
     RepositoryNotFound,
 )
+from testrepository.repository.instances import InstancePool
 
 
 class RepositoryFactory(AbstractRepositoryFactory):
@@ -58,6 +59,8 @@ class Repository(AbstractRepository):
         self._runs = []
         self._failing = OrderedDict()  # id -> test
         self._times = {}  # id -> duration
+        self._listing = (None, None)  # (key, test_ids)
+        self._instance_pool = None
 
     def count(self):
         return len(self._runs)
@@ -79,6 +82,27 @@ class Repository(AbstractRepository):
     def _get_inserter(self, partial):
         return _Inserter(self, partial)
 
+    def get_test_listing(self, key):
+        listing_key, test_ids = self._listing
+        if key != listing_key:
+            return None
+        return list(test_ids)
+
+    def set_test_listing(self, key, test_ids):
+        self._listing = (key, list(test_ids))
+
+    def get_instance_pool(self):
+        if self._instance_pool is None:
+            self._instance_pool = InstancePool(":memory:")
+        return self._instance_pool
+
+    def get_all_test_times(self):
+        return dict(
+            (test_id, duration)
+            for test_id, duration in self._times.items()
+            if duration is not None
+        )
+
     def _get_test_times(self, test_ids):
         result = {}
         for test_id in test_ids:
@@ -139,6 +163,14 @@ class _Inserter(AbstractTestRun):
         # Subunit V2 stream for get_subunit_stream
         self._subunit = None
 
+    @property
+    def partial(self):
+        return self._partial
+
+    @partial.setter
+    def partial(self, partial):
+        self._partial = partial
+
     def startTestRun(self):
         self._subunit = BytesIO()
         serialiser = subunit.v2.StreamResultToBytes(self._subunit)
@@ -175,6 +207,9 @@ class _Inserter(AbstractTestRun):
         return self._run_id
 
     def status(self, *args, **kwargs):
+        if kwargs.get("test_status") == "exists":
+            # The listing of the tests is not part of the run.
+            return
         self._hook.status(*args, **kwargs)
 
     def get_id(self):
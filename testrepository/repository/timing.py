@@ -0,0 +1,180 @@
+#
+# Copyright (c) 2026 Testrepository Contributors
+#
+# Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+# license at the users choice. A copy of both licenses are available in the
+# project source as Apache-2.0 and BSD. You may not use this file except in
+# compliance with one of these two licences.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# license you chose for the specific language governing permissions and
+# limitations under that license.
+
+"""Persistent storage of test durations."""
+
+import dbm
+import math
+import os.path
+import sqlite3
+
+# The number of durations kept for each test.
+HISTORY_LENGTH = 10
+# The weight of the newest duration in the moving average estimate.
+EWMA_WEIGHT = 0.3
+# Keep well under SQLite's default limit of 999 parameters per statement.
+_BATCH_SIZE = 500
+
+
+def _batches(items):
+    items = list(items)
+    for pos in range(0, len(items), _BATCH_SIZE):
+        yield items[pos : pos + _BATCH_SIZE]
+
+
+def _percentile(values, percent):
+    """Nearest-rank percentile of values."""
+    ordered = sorted(values)
+    rank = int(math.ceil(percent / 100.0 * len(ordered)))
+    return ordered[max(rank, 1) - 1]
+
+
+class TimingStore(object):
+    """Per-test duration history kept in an SQLite database.
+
+    For every test the most recent HISTORY_LENGTH durations are kept along
+    with an exponentially weighted moving average of all its durations. The
+    average is the estimate used for scheduling, as it is far less noisy than
+    the last duration alone.
+    """
+
+    def __init__(self, path, legacy_path=None):
+        """Create a TimingStore.
+
+        :param path: The path of the SQLite database. It is created if needed.
+        :param legacy_path: The path of a dbm file from older repositories.
+            If the database does not exist yet, durations are imported from
+            it when the database is created.
+        """
+        self.path = path
+        self.legacy_path = legacy_path
+
+    def _connect(self):
+        created = not os.path.exists(self.path)
+        db = sqlite3.connect(self.path)
+        try:
+            with db:
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS test_times ("
+                    "test_id TEXT PRIMARY KEY, runs INTEGER NOT NULL, "
+                    "ewma REAL NOT NULL, history TEXT NOT NULL)"
+                )
+            if created and self.legacy_path is not None:
+                self._import_legacy(db)
+        except:
+            db.close()
+            raise
+        return db
+
+    def _import_legacy(self, db):
+        """Import the last known durations from a legacy dbm file."""
+        if not dbm.whichdb(self.legacy_path):
+            return
+        legacy = dbm.open(self.legacy_path, "r")
+        try:
+            durations = {}
+            for key in legacy.keys():
+                durations[key.decode("utf8")] = float(legacy[key])
+        finally:
+            legacy.close()
+        self._record(db, durations)
+
+    def _get_rows(self, db, test_ids):
+        rows = {}
+        for batch in _batches(test_ids):
+            query = (
+                "SELECT test_id, runs, ewma, history FROM test_times "
+                "WHERE test_id IN (%s)" % ", ".join("?" * len(batch))
+            )
+            for test_id, runs, ewma, history in db.execute(query, batch):
+                rows[test_id] = (runs, ewma, [float(d) for d in history.split()])
+        return rows
+
+    def _record(self, db, durations):
+        with db:
+            # The rows are read in the write transaction, so that concurrent
+            # loads do not lose each other's updates.
+            db.execute("BEGIN IMMEDIATE")
+            rows = self._get_rows(db, durations)
+            updates = []
+            for test_id, duration in durations.items():
+                if test_id in rows:
+                    runs, ewma, history = rows[test_id]
+                    ewma = EWMA_WEIGHT * duration + (1 - EWMA_WEIGHT) * ewma
+                else:
+                    runs, ewma, history = 0, duration, []
+                history = (history + [duration])[-HISTORY_LENGTH:]
+                updates.append((test_id, runs + 1, ewma, " ".join(map(repr, history))))
+            db.executemany(
+                "INSERT OR REPLACE INTO test_times (test_id, runs, ewma, history) "
+                "VALUES (?, ?, ?, ?)",
+                updates,
+            )
+
+    def record(self, durations):
+        """Record new durations.
+
+        All the durations are written in a single transaction.
+
+        :param durations: A dict mapping test ids to durations in seconds.
+        """
+        db = self._connect()
+        try:
+            self._record(db, durations)
+        finally:
+            db.close()
+
+    def get_estimates(self, test_ids):
+        """Get the estimated duration of test_ids.
+
+        :return: A dict mapping test ids to estimated durations in seconds.
+            Tests with no recorded durations are not included.
+        """
+        db = self._connect()
+        try:
+            rows = self._get_rows(db, test_ids)
+        finally:
+            db.close()
+        return dict((test_id, row[1]) for test_id, row in rows.items())
+
+    def get_all_estimates(self):
+        """Get the estimated duration of every test with recorded durations.
+
+        :return: A dict mapping test ids to estimated durations in seconds.
+        """
+        db = self._connect()
+        try:
+            return dict(db.execute("SELECT test_id, ewma FROM test_times"))
+        finally:
+            db.close()
+
+    def get_stats(self, test_ids):
+        """Get statistics about the durations of test_ids.
+
+        :return: A dict mapping test ids to a dict with keys 'runs' (the
+            number of durations ever recorded), 'last', 'ewma' and 'p95' (the
+            95th percentile of the kept history). Tests with no recorded
+            durations are not included.
+        """
+        db = self._connect()
+        try:
+            rows = self._get_rows(db, test_ids)
+        finally:
+            db.close()
+        result = {}
+        for test_id, (runs, ewma, history) in rows.items():
+            result[test_id] = dict(
+                runs=runs, last=history[-1], ewma=ewma, p95=_percentile(history, 95)
+            )
+        return result
@@ -12,6 +12,7 @@
 # license you chose for the specific language governing permissions and
 # limitations under that license.
 
+import time
 
 import subunit
 from testtools import (
@@ -19,6 +20,7 @@ from testtools import (
     StreamResult,
 )
 
+from testrepository.summary import RunSummary
 from testrepository.utils import timedelta_to_seconds
 
 
@@ -51,6 +53,125 @@ class SummarizingResult(StreamSummary):
             return None
         return timedelta_to_seconds(self._last_time - self._first_time)
 
+    def get_run_summary(self):
+        """Get a RunSummary of the events seen so far."""
+        return RunSummary(
+            self.testsRun,
+            self.get_num_failures(),
+            len(self.skipped),
+            self._first_time,
+            self._last_time,
+        )
+
+
+class ProgressResult(StreamResult):
+    """Report the progress of a test run at a bounded rate.
+
+    The tests finished by each worker are counted, and every interval seconds
+    at most, report is called with (label, value) pairs for UI.output_progress:
+    the tests done, those done by each worker, the tests finished per second
+    and, when the tests to run are known, an estimate of the time remaining.
+
+    The estimate is taken from stored test durations: each group of tests in
+    the schedule takes the total duration of its unfinished tests divided by
+    the number of workers sharing it, and the run takes as long as the
+    longest group. Handling an event is a few dict operations, so reporting
+    is cheap even for thousands of events a second.
+    """
+
+    # Statuses which mean a test has finished.
+    _finished = frozenset(["success", "fail", "skip", "xfail", "uxsuccess"])
+
+    def __init__(self, report, schedule=None, durations=None, interval=0.5):
+        """Create a ProgressResult.
+
+        :param report: A callable taking a list of (label, value) pairs, or
+            None once the run has finished.
+        :param schedule: A list of (test_ids, workers) tuples - groups of the
+            tests to be run, each shared by workers workers - or None if
+            which tests will run is not known.
+        :param durations: A dict mapping test ids to their expected duration
+            in seconds. Tests without a duration are expected to take the
+            mean duration.
+        :param interval: The least time in seconds between reports.
+        """
+        super(ProgressResult, self).__init__()
+        self._report = report
+        self._interval = interval
+        durations = durations or {}
+        default = sum(durations.values()) / len(durations) if durations else 0.0
+        # test_id -> (group, duration)
+        self._pending = {}
+        self._remaining = []
+        self._workers = []
+        self._total = None
+        if schedule is not None:
+            for group, (test_ids, workers) in enumerate(schedule):
+                remaining = 0.0
+                for test_id in test_ids:
+                    duration = durations.get(test_id, default)
+                    self._pending[test_id] = (group, duration)
+                    remaining += duration
+                self._remaining.append(remaining)
+                self._workers.append(max(workers, 1))
+            self._total = len(self._pending)
+        self._estimate = bool(durations) and bool(self._remaining)
+
+    def startTestRun(self):
+        super(ProgressResult, self).startTestRun()
+        self._done = 0
+        self._done_by_worker = {}
+        self._started = time.monotonic()
+        self._next_report = self._started + self._interval
+
+    def stopTestRun(self):
+        super(ProgressResult, self).stopTestRun()
+        self._report(None)
+
+    def status(self, test_id=None, test_status=None, route_code=None, **kwargs):
+        if test_status not in self._finished:
+            return
+        self._done += 1
+        worker = route_code.split("/", 1)[0] if route_code else ""
+        self._done_by_worker[worker] = self._done_by_worker.get(worker, 0) + 1
+        pending = self._pending.pop(test_id, None)
+        if pending is not None:
+            self._remaining[pending[0]] -= pending[1]
+        now = time.monotonic()
+        if now >= self._next_report:
+            self._next_report = now + self._interval
+            self._report(self.get_values(now))
+
+    def get_values(self, now):
+        """Get the (label, value) pairs describing progress at time now."""
+        if self._total is None:
+            values = [("tests", "%d" % self._done)]
+        else:
+            values = [("tests", "%d/%d" % (self._done, self._total))]
+        if len(self._done_by_worker) > 1:
+            values.append(
+                (
+                    "workers",
+                    " ".join(
+                        "%d" % self._done_by_worker[worker]
+                        # Route codes are numbers: sort 10 after 9.
+                        for worker in sorted(
+                            self._done_by_worker, key=lambda w: (len(w), w)
+                        )
+                    ),
+                )
+            )
+        elapsed = now - self._started
+        if elapsed > 0:
+            values.append(("rate", "%.1f/s" % (self._done / elapsed)))
+        if self._estimate:
+            eta = max(
+                max(remaining, 0.0) / workers
+                for remaining, workers in zip(self._remaining, self._workers)
+            )
+            values.append(("eta", "%ds" % round(eta)))
+        return values
+
 
 # XXX: Should be in testtools.
 class CatFiles(StreamResult):
@@ -0,0 +1,92 @@
+#
+# Copyright (c) 2026 Testrepository Contributors
+#
+# Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+# license at the users choice. A copy of both licenses are available in the
+# project source as Apache-2.0 and BSD. You may not use this file except in
+# compliance with one of these two licences.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# license you chose for the specific language governing permissions and
+# limitations under that license.
+
+"""Headline figures for test runs.
+
+This is kept apart from testrepository.results so that reading a stored
+summary does not need the test result machinery.
+"""
+
+import iso8601
+
+from testrepository.utils import timedelta_to_seconds
+
+
+class RunSummary(object):
+    """The headline figures for a test run.
+
+    This offers the same query methods as SummarizingResult, but holds only
+    counts, so it can be stored alongside a run and loaded again without
+    replaying the run.
+    """
+
+    def __init__(self, tests_run, failures, skips, first_time, last_time):
+        self.testsRun = tests_run
+        self.failures = failures
+        self.skips = skips
+        self.first_time = first_time
+        self.last_time = last_time
+
+    def __eq__(self, other):
+        return self.__dict__ == getattr(other, "__dict__", None)
+
+    def __repr__(self):
+        return "RunSummary(%r, %r, %r, %r, %r)" % (
+            self.testsRun,
+            self.failures,
+            self.skips,
+            self.first_time,
+            self.last_time,
+        )
+
+    def get_num_failures(self):
+        return self.failures
+
+    def get_time_taken(self):
+        if None in (self.last_time, self.first_time):
+            return None
+        return timedelta_to_seconds(self.last_time - self.first_time)
+
+    def to_dict(self):
+        """Return a dict of simple values describing this summary."""
+
+        def format_time(timestamp):
+            if timestamp is None:
+                return None
+            return timestamp.isoformat()
+
+        return dict(
+            tests=self.testsRun,
+            failures=self.failures,
+            skips=self.skips,
+            first_time=format_time(self.first_time),
+            last_time=format_time(self.last_time),
+        )
+
+    @classmethod
+    def from_dict(klass, values):
+        """Create a RunSummary from the output of to_dict."""
+
+        def parse_time(timestamp):
+            if timestamp is None:
+                return None
+            return iso8601.parse_date(timestamp)
+
+        return klass(
+            values["tests"],
+            values["failures"],
+            values["skips"],
+            parse_time(values["first_time"]),
+            parse_time(values["last_time"]),
+        )
@@ -14,15 +14,23 @@
 
 """The test command that test repository knows how to run."""
 
-from collections import defaultdict
+from collections import defaultdict, deque
 import configparser
+import glob
+import hashlib
+import heapq
 import io
 import itertools
 import operator
 import os.path
 import re
+import shutil
+import signal
+import statistics
 import subprocess
+import sys
 import tempfile
+import threading
 import multiprocessing
 from textwrap import dedent
 
@@ -30,6 +38,8 @@ from fixtures import Fixture
 from subunit import ByteStreamToStreamResult
 
 from testrepository import results
+from testrepository.engine import gather
+from testrepository.repository import compression
 from testrepository.testlist import (
     parse_enumeration,
     write_list,
@@ -62,6 +72,12 @@ testrconf_help = dedent("""
       test_command should output on stdout all the test ids that would have
       been run if every other option and argument was honoured, one per line.
       This is required for parallel testing, and is substituted into $LISTOPT.
+    * test_list_cache_files -- Optional glob patterns, relative to the
+      .testr.conf directory, of the files which determine what tests exist,
+      e.g. '**/*.py'. When set, the test listing is cached in the repository
+      and reused until the size or modification time of one of the matching
+      files or the list command, with its variables expanded, changes.
+      'testr run --relist' ignores the cache.
     * test_run_concurrency -- Optional call out to establish concurrency.
       Should return one line containing the number of concurrent test runner
       processes to run.
@@ -73,14 +89,38 @@ testrconf_help = dedent("""
       be adjusted if the paths are synched with different names.
     * instance_dispose -- dispose of one or more test running environments.
       Accepts $INSTANCE_IDS.
+    * instance_pool_idle_timeout -- Optional number of seconds to keep
+      instances for after a run, so that later runs (from any process using
+      the same repository) can reuse them rather than provisioning more.
+      Instances idle for longer are disposed of at the end of a run or by
+      'testr instances --reap'.
+    * instance_check -- Optional health check for a pooled instance before it
+      is reused. Accepts $INSTANCE_ID. Instances for which it exits non-zero
+      are disposed of.
     * group_regex -- If set group tests by the matched section of the test id.
+    * test_worker_timeout -- Optional number of seconds a test runner
+      process may run for. A process which runs for longer is killed, the
+      test it was running is recorded as failing with a 'timeout' attachment
+      and the tests it had not yet started are run by another process.
+    * test_progress_timeout -- Optional number of seconds a test runner
+      process may go without output before it is treated as hung and killed,
+      as for test_worker_timeout.
+    * test_batch_size -- The number of tests given to a test runner process at
+      a time by 'testr run --parallel --dynamic'. Defaults to a size giving
+      each worker about four batches.
+    * repository_compression -- How to compress the test runs stored in the
+      repository: none (the default), zlib, or zstd if the zstandard package
+      is installed (zlib is used if it is not). Each run records how it was
+      stored, so changing this does not affect runs already stored.
     * $IDOPTION -- the variable to use to trigger running some specific tests.
     * $IDFILE -- A file created before the test command is run and deleted
       afterwards which contains a list of test ids, one per line. This can
       handle test ids with emedded whitespace.
     * $IDLIST -- A list of the test ids to run, separated by spaces. IDLIST
       defaults to an empty string when no test ids are known and no explicit
-      default is provided. This will not handle test ids with spaces.
+      default is provided. This will not handle test ids with spaces. If the
+      command would be too long for the platform, the tests are split up and
+      run by several commands, one after another.
 
     See the testrepository manual for example .testr.conf files in different
     programming languages.
@@ -88,6 +128,40 @@ testrconf_help = dedent("""
     """)
 
 
+def terminate_process(process):
+    """Terminate a test runner process, and the processes it started.
+
+    Test commands are run by a shell, which does not pass signals on to the
+    commands it runs, so runner processes are started in a session of their
+    own and their whole process group is signalled.
+
+    :param process: A subprocess.Popen-like object.
+    :return: True if the process was still running, False if it had already
+        finished.
+    """
+    if process.poll() is not None:
+        return False
+    pid = getattr(process, "pid", None)
+    if os.name == "posix" and pid is not None:
+        try:
+            if os.getpgid(pid) == pid:
+                os.killpg(pid, signal.SIGTERM)
+                return True
+        except ProcessLookupError:
+            return False
+    # Process-like objects such as DynamicWorker say if they stopped anything.
+    return process.terminate() is not False
+
+
+def stop_process(process):
+    """Terminate a test runner process if it is running, and wait for it.
+
+    Any instance the process was run in is released once it has finished.
+    """
+    terminate_process(process)
+    process.wait()
+
+
 class CallWhenProcFinishes(object):
     """Convert a process object to trigger a callback when returncode is set.
 
@@ -117,6 +191,10 @@ class CallWhenProcFinishes(object):
     def stderr(self):
         return self._proc.stderr
 
+    @property
+    def pid(self):
+        return self._proc.pid
+
     @property
     def returncode(self):
         result = self._proc.returncode
@@ -125,12 +203,297 @@ class CallWhenProcFinishes(object):
             self._callback()
         return result
 
+    def poll(self):
+        if self._proc.poll() is None:
+            return None
+        return self.returncode
+
+    def wait(self):
+        self._proc.wait()
+        return self.returncode
+
+    def terminate(self):
+        self._proc.terminate()
+
+
+class DynamicWorker(object):
+    """A process-like object which runs batches of tests from a shared queue.
+
+    Whenever the output of its current batch is exhausted, the worker takes
+    the next batch from the queue and starts it, so workers which get through
+    their batches quickly keep taking work until the queue is empty.
+
+    The stdout of the worker is the concatenated stdout of its batches, and
+    its returncode is the first non-zero returncode of its batches (or 0),
+    ignoring batches it terminated itself. Only the read, read1, readline and
+    readlines stream methods, fileno, poll, terminate and abort are
+    supported.
+    """
+
+    def __init__(self, process, test_ids, queue, start_batch, lock):
+        """Create a DynamicWorker.
+
+        :param process: The process running the first batch for this worker.
+        :param test_ids: The test ids in the first batch.
+        :param queue: A deque of the batches of test ids still to run, shared
+            by all the workers taking from it.
+        :param start_batch: A callable which starts a batch of test ids and
+            returns its process. It is called with lock held.
+        :param lock: A lock shared by all the workers taking from queue.
+        """
+        self._proc = process
+        self._test_ids = test_ids
+        self._queue = queue
+        self._start_batch = start_batch
+        self._lock = lock
+        self._stopped = False
+        # The process of the batch the worker terminated, if any.
+        self._terminated = None
+        self._returncode = 0
+        self._lastoutput = b"\n"
+
+    @property
+    def stdout(self):
+        return self
+
+    @property
+    def returncode(self):
+        if self._proc is not None:
+            return None
+        return self._returncode
+
+    def _finish_batch(self):
+        self._proc.wait()
+        with self._lock:
+            # Fetched with the lock held, as it may release an instance.
+            returncode = self._proc.returncode
+            if self._proc is self._terminated:
+                returncode = 0
+            if self._queue and not self._stopped:
+                self._test_ids = self._queue.popleft()
+                self._proc = self._start_batch(self._test_ids)
+            else:
+                self._proc = None
+        if returncode and not self._returncode:
+            self._returncode = returncode
+
+    def _read(self, read, wait_for_batch=True):
+        while self._proc is not None:
+            result = read(self._proc.stdout)
+            if result:
+                self._lastoutput = result[-1:]
+                return result
+            self._finish_batch()
+            if self._proc is not None and self._lastoutput != b"\n":
+                # As for ReturnCodeToSubunit: start the next batch on a fresh
+                # line so that line orientated v1 streams parse correctly.
+                self._lastoutput = b"\n"
+                return b"\n"
+            if self._proc is not None and not wait_for_batch:
+                return None
+        return b""
+
+    def read(self, count=-1):
+        if count == 0:
+            return b""
+        if count is None or count < 0:
+            return b"".join(iter(lambda: self._read(lambda s: s.read()), b""))
+        return self._read(lambda stream: stream.read(count))
+
+    def read1(self, count=-1):
+        """Read the output available from the current batch.
+
+        When the current batch finishes and the next one is started, None is
+        returned rather than waiting for the new batch to produce output, as
+        for a non-blocking stream. The fileno of the worker changes then too.
+        """
+
+        def read1(stream):
+            return getattr(stream, "read1", stream.read)(count)
+
+        return self._read(read1, wait_for_batch=False)
+
+    def fileno(self):
+        """Get the fileno of the stdout of the current batch."""
+        if self._proc is None:
+            raise ValueError("All batches have finished.")
+        return self._proc.stdout.fileno()
+
+    def poll(self):
+        return self.returncode
+
+    def _terminate_batch(self):
+        """Terminate the current batch, with the lock held.
+
+        :return: True if its process was still running.
+        """
+        if not terminate_process(self._proc):
+            return False
+        self._terminated = self._proc
+        return True
+
+    def terminate(self):
+        """Terminate the current batch, and start no more in this worker.
+
+        :return: True if tests were stopped from running: a batch was still
+            running, or batches were still to be started.
+        """
+        with self._lock:
+            if self._stopped or self._proc is None:
+                return False
+            self._stopped = True
+            return self._terminate_batch() or bool(self._queue)
+
+    def abort(self, done_ids):
+        """Terminate the current batch, rescheduling its unfinished tests.
+
+        The tests of the batch which are not in done_ids are put at the front
+        of the queue, for whichever worker is next to start a batch.
+
+        :param done_ids: The ids of tests not to run again.
+        """
+        with self._lock:
+            if self._proc is None:
+                return
+            remaining = [
+                test_id for test_id in self._test_ids if test_id not in done_ids
+            ]
+            if remaining:
+                self._queue.appendleft(remaining)
+            self._terminate_batch()
+
+    def readline(self):
+        return self._read(lambda stream: stream.readline())
+
+    def readlines(self):
+        return list(iter(self.readline, b""))
+
     def wait(self):
-        return self._proc.wait()
+        """Wait for all the batches to finish.
+
+        Any output not yet read is discarded, including the output of batches
+        which are started while waiting.
+        """
+        while self._proc is not None:
+            self._proc.stdout.read()
+            self._finish_batch()
+        return self._returncode
+
+
+class DurationEstimator(object):
+    """Estimate the durations of tests from the durations of other tests.
+
+    A test is assumed to take the mean duration of the known tests which share
+    the longest dotted prefix of its id - its class, then its module, then its
+    package and so on. If no known test shares any prefix with it, the median
+    of all the known durations is used.
+    """
+
+    def __init__(self, durations):
+        """Create a DurationEstimator.
+
+        :param durations: A non-empty dict mapping test ids to known durations.
+        """
+        # prefix -> [total duration, test count]
+        self._prefixes = {}
+        for test_id, duration in durations.items():
+            prefix = test_id
+            while "." in prefix:
+                prefix = prefix.rsplit(".", 1)[0]
+                totals = self._prefixes.setdefault(prefix, [0.0, 0])
+                totals[0] += duration
+                totals[1] += 1
+        self._median = statistics.median(durations.values())
+
+    def estimate(self, test_id):
+        """Estimate the duration of test_id."""
+        prefix = test_id
+        while "." in prefix:
+            prefix = prefix.rsplit(".", 1)[0]
+            totals = self._prefixes.get(prefix)
+            if totals is not None:
+                return totals[0] / totals[1]
+        return self._median
 
 
 compiled_re_type = type(re.compile(""))
 
+# Batches per worker aimed for when dynamically scheduling tests.
+BATCHES_PER_WORKER = 4
+
+
+def command_line_limit():
+    """Get the length in bytes of the longest command the shell can be given.
+
+    On POSIX systems the command, the other arguments and the environment
+    share ARG_MAX bytes, and Linux also limits any one argument - such as the
+    command passed to 'sh -c' - to 128KiB. Windows limits command lines to
+    32767 characters.
+    """
+    if sys.platform == "win32":
+        return 32767 - 1024
+    try:
+        limit = os.sysconf("SC_ARG_MAX")
+    except (AttributeError, ValueError, OSError):
+        limit = -1
+    if limit <= 0:
+        # The minimum POSIX permits.
+        limit = 4096
+    pointer = 8
+    for key, value in os.environ.items():
+        limit -= len(key.encode("utf8")) + len(value.encode("utf8")) + 2 + pointer
+    if sys.platform.startswith("linux"):
+        limit = min(limit, 131072)
+    # Leave room for the shell's own arguments.
+    return limit - 2048
+
+
+# $VAR, ${VAR} and ${VAR-default} or ${VAR:-default} references in a command.
+_shell_variable_re = re.compile(
+    r"\$(?:\{([A-Za-z_][A-Za-z0-9_]*)(?:(:?-)([^}]*))?\}|([A-Za-z_][A-Za-z0-9_]*))"
+)
+
+
+def expand_shell_variables(cmd, environ):
+    """Expand the variables in cmd as the shell running it would.
+
+    Only plain references and defaults are expanded: quoting and other
+    substitutions are left as they are.
+
+    :param environ: A dict of the variables set.
+    """
+
+    def subst(match):
+        braced, default_op, default, name = match.groups()
+        name = braced or name
+        value = environ.get(name)
+        if default_op is not None and (
+            value is None or (default_op == ":-" and not value)
+        ):
+            return _shell_variable_re.sub(subst, default)
+        return value or ""
+
+    return _shell_variable_re.sub(subst, cmd)
+
+
+def make_group_callback(group_regex):
+    """Make a group_callback for TestListingFixture from a group_regex.
+
+    Tests whose ids have the same match for group_regex - matched at the
+    start of the id - are in the same group.
+
+    :return: A callable, or None if group_regex is empty or None.
+    """
+    if not group_regex:
+        return None
+
+    def group_callback(test_id, regex=re.compile(group_regex)):
+        match = regex.match(test_id)
+        if match:
+            return match.group(0)
+
+    return group_callback
+
 
 class TestListingFixture(Fixture):
     """Write a temporary file to disk with test ids in it."""
@@ -149,6 +512,9 @@ class TestListingFixture(Fixture):
         test_filters=None,
         instance_source=None,
         group_callback=None,
+        batch_size=None,
+        isolated=False,
+        partitions=None,
     ):
         """Create a TestListingFixture.
 
@@ -186,6 +552,14 @@ class TestListingFixture(Fixture):
             test id and returns a group id. A group id is an arbitrary value
             used as a dictionary key in the scheduler. All test ids with the
             same group id are scheduled onto the same backend test process.
+        :param batch_size: The number of tests in each batch when scheduling
+            tests dynamically. If None, a size giving each worker about
+            BATCHES_PER_WORKER batches is used.
+        :param isolated: If True, run each test in a separate test runner
+            process, as the --isolated option to run does.
+        :param partitions: An optional list of lists of test ids. If
+            supplied, each list is run in its own test runner process, all at
+            once and in the order given, rather than partitioning test_ids.
         """
         self.test_ids = test_ids
         self.template = cmd_template
@@ -199,6 +573,9 @@ class TestListingFixture(Fixture):
         self.test_filters = test_filters
         self._group_callback = group_callback
         self._instance_source = instance_source
+        self.batch_size = batch_size
+        self.isolated = isolated
+        self.partitions = partitions
 
     def setUp(self):
         super(TestListingFixture, self).setUp()
@@ -220,6 +597,8 @@ class TestListingFixture(Fixture):
             return list_variables.get(match.groups(1)[0], "")
 
         self.list_cmd = re.sub(variable_regex, list_subst, cmd)
+        self.worker_timeout = self._get_timeout("test_worker_timeout")
+        self.progress_timeout = self._get_timeout("test_progress_timeout")
         nonparallel = (
             not self.parallel
             or not getattr(self.ui, "options", None)
@@ -235,11 +614,23 @@ class TestListingFixture(Fixture):
                 self.concurrency = self.local_concurrency()
             if not self.concurrency:
                 self.concurrency = 1
+        options = getattr(self.ui, "options", None)
+        # Isolated runs are dynamic runs with one test per batch, so the
+        # tests are run in one process each by however many workers the
+        # concurrency allows.
+        self.isolated = self.parallel and (
+            self.isolated or getattr(options, "isolated", False)
+        )
+        if self.isolated:
+            self.batch_size = 1
+        self.dynamic = self.isolated or (
+            not nonparallel and getattr(options, "dynamic", False)
+        )
         if self.test_ids is None:
-            if self.concurrency == 1:
+            if self.concurrency == 1 and not self.dynamic:
                 if default_idstr:
                     self.test_ids = default_idstr.split()
-            if self.concurrency != 1 or self.test_filters is not None:
+            if self.concurrency != 1 or self.dynamic or self.test_filters is not None:
                 # Have to be able to tell each worker what to run / filter
                 # tests.
                 self.test_ids = self.list_tests()
@@ -266,6 +657,15 @@ class TestListingFixture(Fixture):
             variables["IDOPTION"] = idoption
         self.cmd = re.sub(variable_regex, subst, cmd)
 
+    def _get_timeout(self, option):
+        """Get a timeout in seconds from .testr.conf, or None if not set."""
+        if self._parser is None:
+            return None
+        try:
+            return float(self._parser.get("DEFAULT", option))
+        except configparser.NoOptionError:
+            return None
+
     def make_listfile(self):
         name = None
         try:
@@ -308,6 +708,12 @@ class TestListingFixture(Fixture):
         """
         if "$LISTOPT" not in self.template:
             raise ValueError("LISTOPT not configured in .testr.conf")
+        cache_key = self._listing_cache_key()
+        relist = getattr(getattr(self.ui, "options", None), "relist", False)
+        if cache_key is not None and not relist:
+            ids = self.repository.get_test_listing(cache_key)
+            if ids is not None:
+                return ids
         instance, list_cmd = self._per_instance_command(self.list_cmd)
         try:
             self.ui.output_values([("running", list_cmd)])
@@ -327,11 +733,43 @@ class TestListingFixture(Fixture):
                     "Non-zero exit code (%d) from test listing." % (run_proc.returncode)
                 )
             ids = parse_enumeration(out)
+            if cache_key is not None:
+                self.repository.set_test_listing(cache_key, ids)
             return ids
         finally:
             if instance:
                 self._instance_source.release_instance(instance)
 
+    def _listing_cache_key(self):
+        """Fingerprint the source tree and list command for caching listings.
+
+        The list command is fingerprinted with the environment variables it
+        uses expanded.
+
+        :return: A key for the repository listing cache, or None if caching
+            is not configured.
+        """
+        if self.repository is None or self._parser is None:
+            return None
+        try:
+            patterns = self._parser.get("DEFAULT", "test_list_cache_files")
+        except configparser.NoOptionError:
+            return None
+        paths = set()
+        for pattern in patterns.split():
+            paths.update(glob.glob(os.path.join(self.ui.here, pattern), recursive=True))
+        # The command the shell will run, and which program that is, so that
+        # changing e.g. $PYTHON or $PATH lists the tests again.
+        list_cmd = expand_shell_variables(self.list_cmd, os.environ)
+        words = list_cmd.split()
+        program = words and shutil.which(words[0])
+        fingerprint = hashlib.sha1(("%s\0%s" % (list_cmd, program)).encode("utf8"))
+        for path in sorted(paths):
+            stat = os.stat(path)
+            entry = "\0%s\0%d\0%d" % (path, stat.st_mtime_ns, stat.st_size)
+            fingerprint.update(entry.encode("utf8"))
+        return fingerprint.hexdigest()
+
     def _per_instance_command(self, cmd):
         """Customise cmd to with an instance-id.
 
@@ -364,68 +802,304 @@ class TestListingFixture(Fixture):
     def run_tests(self):
         """Run the tests defined by the command and ui.
 
+        self.schedule is set to a list of (test_ids, workers) tuples saying
+        how the tests were shared out, or None if the tests to run are not
+        known.
+
         :return: A list of spawned processes.
         """
-        result = []
         test_ids = self.test_ids
-        if self.concurrency == 1 and (test_ids is None or test_ids):
-            # Have to customise cmd here, as instances are allocated
-            # just-in-time. XXX: Indicates this whole region needs refactoring.
-            instance, cmd = self._per_instance_command(self.cmd)
-            self.ui.output_values([("running", cmd)])
-            run_proc = self.ui.subprocess_Popen(
-                cmd, shell=True, stdout=subprocess.PIPE, stdin=subprocess.PIPE
-            )
+        self.schedule = None
+        if self.partitions is not None:
+            self.schedule = [(ids, 1) for ids in self.partitions]
+            return self._start_workers(self.partitions)
+        if (
+            self.concurrency == 1
+            and not self.dynamic
+            and (test_ids is None or test_ids)
+        ):
+            if test_ids is not None:
+                self.schedule = [(test_ids, 1)]
+            if test_ids and (self.worker_timeout or self.progress_timeout):
+                # So that the tests after one which times out still run.
+                return self._start_workers([test_ids])
+            return [self._prepare_process()()]
+        if self.dynamic:
+            self.schedule = [(test_ids, self.concurrency)]
+            return self._run_dynamic(test_ids)
+        test_id_groups = self.partition_tests(test_ids, self.concurrency)
+        # No tests in empty partitions.
+        test_id_groups = [ids for ids in test_id_groups if ids]
+        self.schedule = [(ids, 1) for ids in test_id_groups]
+        return self._start_workers(test_id_groups)
+
+    def _prepare_process(self):
+        """Prepare to run the command in a single test runner process.
+
+        If the command would be too long for the platform, because $IDLIST
+        holds too many test ids, the tests are split into chunks run one
+        after another by a DynamicWorker instead.
+
+        :return: A callable which starts the process and returns it. It is
+            safe to call from any thread.
+        """
+        chunks = self._command_line_chunks()
+        if chunks is not None:
+            return self._prepare_chunks(chunks)
+        # Have to customise cmd here, as instances are allocated
+        # just-in-time. XXX: Indicates this whole region needs refactoring.
+        instance, cmd = self._per_instance_command(self.cmd)
+        self.ui.output_values([("running", cmd)])
+
+        def start():
+            # In a session of its own, so that terminate_process can stop the
+            # commands the shell runs as well as the shell.
+            try:
+                run_proc = self.ui.subprocess_Popen(
+                    cmd,
+                    shell=True,
+                    stdout=subprocess.PIPE,
+                    stdin=subprocess.PIPE,
+                    start_new_session=True,
+                )
+            except:
+                if instance:
+                    self._instance_source.release_instance(instance)
+                raise
             # Prevent processes stalling if they read from stdin; we could
             # pass this through in future, but there is no point doing that
             # until we have a working can-run-debugger-inline story.
             run_proc.stdin.close()
             if instance:
-                return [
-                    CallWhenProcFinishes(
-                        run_proc,
-                        lambda: self._instance_source.release_instance(instance),
-                    )
-                ]
-            else:
-                return [run_proc]
-        test_id_groups = self.partition_tests(test_ids, self.concurrency)
-        for test_ids in test_id_groups:
-            if not test_ids:
-                # No tests in this partition
-                continue
-            fixture = self.useFixture(
-                TestListingFixture(
-                    test_ids,
-                    self.template,
-                    self.listopt,
-                    self.idoption,
-                    self.ui,
-                    self.repository,
-                    parallel=False,
-                    parser=self._parser,
-                    instance_source=self._instance_source,
+                return CallWhenProcFinishes(
+                    run_proc,
+                    lambda: self._instance_source.release_instance(instance),
                 )
+            return run_proc
+
+        return start
+
+    def _command_line_chunks(self):
+        """Split the test ids so each command using $IDLIST fits on a command line.
+
+        :return: None if the command fits, or a list of lists of test ids.
+        """
+        if not self.test_ids or len(self.test_ids) == 1:
+            return None
+        uses = self.template.count("$IDLIST")
+        if "$IDOPTION" in self.template:
+            uses += self.template.count("$IDOPTION") * self.idoption.count("$IDLIST")
+        if not uses:
+            return None
+        limit = command_line_limit()
+        if self._instance_source is not None and self._parser is not None:
+            try:
+                instance_execute = self._parser.get("DEFAULT", "instance_execute")
+            except configparser.NoOptionError:
+                pass
+            else:
+                # The command is wrapped with this; allow for its variables.
+                limit -= len(instance_execute.encode("utf8")) + 1024
+        length = len(self.cmd.encode("utf8"))
+        if length <= limit:
+            return None
+        idlist_length = len(" ".join(self.test_ids).encode("utf8"))
+        available = limit - (length - uses * idlist_length)
+        chunks = [[]]
+        chunk_length = 0
+        for test_id in self.test_ids:
+            id_length = len(test_id.encode("utf8")) + 1
+            if chunks[-1] and chunk_length + id_length > available // uses:
+                chunks.append([])
+                chunk_length = 0
+            chunks[-1].append(test_id)
+            chunk_length += id_length
+        return chunks
+
+    def _prepare_chunks(self, chunks):
+        """Prepare to run chunks of test ids in processes one after another.
+
+        :return: A callable which starts the first process and returns a
+            DynamicWorker which starts the rest as each finishes.
+        """
+        chunks = deque(chunks)
+        first_chunk = chunks.popleft()
+        start_first = self._prepare_subset(first_chunk)
+
+        def start():
+            return DynamicWorker(
+                start_first(),
+                first_chunk,
+                chunks,
+                self._start_subset,
+                threading.Lock(),
             )
-            result.extend(fixture.run_tests())
-        return result
+
+        return start
+
+    def _prepare_subset(self, test_ids):
+        """Prepare to run test_ids in a single test runner process.
+
+        :return: A callable which starts the process and returns it.
+        """
+        fixture = self.useFixture(
+            TestListingFixture(
+                test_ids,
+                self.template,
+                self.listopt,
+                self.idoption,
+                self.ui,
+                self.repository,
+                parallel=False,
+                parser=self._parser,
+                instance_source=self._instance_source,
+            )
+        )
+        return fixture._prepare_process()
+
+    def _start_subset(self, test_ids):
+        """Run test_ids in a single test runner process, now."""
+        return self._prepare_subset(test_ids)()
+
+    def _start_workers(self, test_id_groups):
+        """Start a worker for each group of test ids.
+
+        If timeouts are configured, the workers are DynamicWorkers, so that
+        tests from a worker which is aborted can be run by another.
+
+        :return: A list of the workers.
+        """
+        processes = self._start_subsets(test_id_groups)
+        if not (self.worker_timeout or self.progress_timeout):
+            return processes
+        queue = deque()
+        lock = threading.Lock()
+        return [
+            DynamicWorker(process, test_ids, queue, self._start_subset, lock)
+            for process, test_ids in zip(processes, test_id_groups)
+        ]
+
+    def _start_subsets(self, test_id_groups):
+        """Start a test runner process for each group of test ids.
+
+        Instances are obtained and commands built one group at a time, but the
+        processes are started concurrently when the ui permits it. If any
+        process cannot be started, those which were are stopped.
+
+        :return: A list of the started processes.
+        """
+        if not self.ui.concurrent_popen:
+            processes = []
+            try:
+                for test_ids in test_id_groups:
+                    processes.append(self._prepare_subset(test_ids)())
+            except:
+                for process in processes:
+                    stop_process(process)
+                raise
+            return processes
+        starts = [self._prepare_subset(test_ids) for test_ids in test_id_groups]
+        return gather(starts, cleanup=stop_process)
+
+    def _run_dynamic(self, test_ids):
+        """Run test_ids in batches taken by concurrency workers as they go."""
+        batches = deque(self.batch_tests(test_ids, self.concurrency))
+        lock = threading.Lock()
+        first_batches = [
+            batches.popleft() for _ in range(min(len(batches), self.concurrency))
+        ]
+        processes = self._start_subsets(first_batches)
+        return [
+            DynamicWorker(process, batch, batches, self._start_subset, lock)
+            for process, batch in zip(processes, first_batches)
+        ]
+
+    def batch_tests(self, test_ids, concurrency):
+        """Split test_ids into batches for dynamic scheduling.
+
+        Groups whose duration cannot be estimated at all (see partition_tests)
+        come first, as they are the most likely to be mispredicted, followed
+        by the rest longest first. Groups are then packed into batches of at
+        least batch_size tests. Running the batches in this order leaves the
+        shortest work for the end of the run where it can fill the gaps
+        between the workers.
+
+        :return: A list of non-empty lists of test ids, whose union is
+            set(test_ids).
+        """
+        batch_size = self.batch_size
+        if not batch_size:
+            batch_size = -(-len(test_ids) // (concurrency * BATCHES_PER_WORKER))
+        group_ids, timed, unknown = self._time_groups(test_ids)
+        queue = list(unknown)
+        queue.extend(sorted(timed, key=timed.__getitem__, reverse=True))
+        batches = []
+        batch = []
+        for group_id in queue:
+            batch.extend(group_ids[group_id])
+            if len(batch) >= batch_size:
+                batches.append(batch)
+                batch = []
+        if batch:
+            batches.append(batch)
+        return batches
 
     def partition_tests(self, test_ids, concurrency):
         """Parition test_ids by concurrency.
 
         Test durations from the repository are used to get partitions which
         have roughly the same expected runtime. New tests - those with no
-        recorded duration - are allocated in round-robin fashion to the
-        partitions created using test durations.
+        recorded duration - are given the mean duration of the other tests in
+        their group, or failing that an estimate from tests with similar ids
+        (see DurationEstimator), and scheduled along with the timed tests.
+        Only when no durations are recorded at all are tests allocated in
+        round-robin fashion.
 
         :return: A list where each element is a distinct subset of test_ids,
             and the union of all the elements is equal to set(test_ids).
         """
         partitions = [list() for i in range(concurrency)]
-        timed_partitions = [[0.0, partition] for partition in partitions]
+        timed_partitions = [(0.0, 0, index) for index in range(concurrency)]
+        group_ids, timed, unknown = self._time_groups(test_ids)
+
+        # Scheduling is NP complete in general, so we avoid aiming for
+        # perfection. A quick approximation that is sufficient for our general
+        # needs:
+        # sort the groups by time
+        # allocate to partitions by putting each group in to the partition with
+        # the current (lowest time, shortest length[in tests])
+        # The partitions are kept in a heap of (time, length, index) so that
+        # finding that partition does not require re-sorting them all.
+        def consume_queue(groups):
+            queue = sorted(groups.items(), key=operator.itemgetter(1), reverse=True)
+            for group_id, duration in queue:
+                time, _, index = timed_partitions[0]
+                partition = partitions[index]
+                partition.extend(group_ids[group_id])
+                heapq.heapreplace(
+                    timed_partitions, (time + duration, len(partition), index)
+                )
+
+        consume_queue(timed)
+        # Assign groups with entirely unknown times in round robin fashion to
+        # the partitions.
+        for partition, group_id in zip(itertools.cycle(partitions), unknown):
+            partition.extend(group_ids[group_id])
+        return partitions
+
+    def _time_groups(self, test_ids):
+        """Group test_ids and estimate the duration of each group.
+
+        :return: A tuple (group_ids, timed, unknown). group_ids maps group ids
+            to test ids. timed maps group ids to the recorded durations of
+            their tests, with estimates filled in for tests that have none.
+            Estimates are made from the durations of every test the
+            repository has timed, not only those in test_ids. unknown is a
+            list of the ids of groups which could not be timed, which only
+            happens when no durations are known at all.
+        """
         time_data = self.repository.get_test_times(test_ids)
         timed_tests = time_data["known"]
-        unknown_tests = time_data["unknown"]
         # Group tests: generate group_id -> test_ids.
         group_ids = defaultdict(list)
         if self._group_callback is None:
@@ -437,50 +1111,32 @@ class TestListingFixture(Fixture):
         for test_id in test_ids:
             group_id = group_callback(test_id) or test_id
             group_ids[group_id].append(test_id)
-        # Time groups: generate three sets of groups:
-        # - fully timed dict(group_id -> time),
-        # - partially timed dict(group_id -> time) and
-        # - unknown (set of group_id)
-        # We may in future treat partially timed different for scheduling, but
-        # at least today we just schedule them after the fully timed groups.
         timed = {}
-        partial = {}
         unknown = []
+        estimator = None
+        history = None
         for group_id, group_tests in group_ids.items():
-            untimed_ids = unknown_tests.intersection(group_tests)
-            group_time = sum(
-                [
-                    timed_tests[test_id]
-                    for test_id in untimed_ids.symmetric_difference(group_tests)
-                ]
-            )
-            if not untimed_ids:
+            known = [
+                timed_tests[test_id]
+                for test_id in group_tests
+                if test_id in timed_tests
+            ]
+            group_time = sum(known)
+            if len(known) == len(group_tests):
                 timed[group_id] = group_time
-            elif group_time:
-                partial[group_id] = group_time
+            elif known:
+                # Tests in a group are usually alike: use the group mean.
+                timed[group_id] = group_time * len(group_tests) / len(known)
             else:
-                unknown.append(group_id)
-
-        # Scheduling is NP complete in general, so we avoid aiming for
-        # perfection. A quick approximation that is sufficient for our general
-        # needs:
-        # sort the groups by time
-        # allocate to partitions by putting each group in to the partition with
-        # the current (lowest time, shortest length[in tests])
-        def consume_queue(groups):
-            queue = sorted(groups.items(), key=operator.itemgetter(1), reverse=True)
-            for group_id, duration in queue:
-                timed_partitions[0][0] = timed_partitions[0][0] + duration
-                timed_partitions[0][1].extend(group_ids[group_id])
-                timed_partitions.sort(key=lambda item: (item[0], len(item[1])))
-
-        consume_queue(timed)
-        consume_queue(partial)
-        # Assign groups with entirely unknown times in round robin fashion to
-        # the partitions.
-        for partition, group_id in zip(itertools.cycle(partitions), unknown):
-            partition.extend(group_ids[group_id])
-        return partitions
+                if history is None:
+                    history = self.repository.get_all_test_times()
+                    if history:
+                        estimator = DurationEstimator(history)
+                if estimator is None:
+                    unknown.append(group_id)
+                else:
+                    timed[group_id] = sum(map(estimator.estimate, group_tests))
+        return group_ids, timed, unknown
 
     def callout_concurrency(self):
         """Callout for user defined concurrency."""
@@ -536,19 +1192,207 @@ class TestCommand(Fixture):
         self.repository = repository
         self._instances = None
         self._allocated_instances = None
+        self._pool = None
+        self._pool_idle_timeout = None
 
     def setUp(self):
         super(TestCommand, self).setUp()
         self._instances = set()
         self._allocated_instances = set()
+        self._provisioning = None
+        self._provisioning_error = None
         self.addCleanup(self._dispose_instances)
+        self._start_provisioning()
+
+    def _start_provisioning(self):
+        """Start provisioning the instances a run will need, if possible.
+
+        Provisioning can be slow - e.g. when it boots virtual machines - so
+        when the ui can start processes from other threads, it is done in the
+        background while tests are listed and partitioned. obtain_instance
+        waits for it to finish.
+        """
+        if not self.ui.concurrent_popen:
+            return
+        try:
+            parser = self.get_parser()
+            cmd = parser.get("DEFAULT", "instance_provision")
+        except (ValueError, configparser.NoOptionError):
+            return
+        count = self._expected_concurrency(parser)
+        if count is None:
+            return
+        self._provisioning = threading.Thread(
+            target=self._provision_in_background, args=(cmd, count)
+        )
+        self._provisioning.daemon = True
+        self._provisioning.start()
+
+    def _expected_concurrency(self, parser):
+        """Get the concurrency runs will use, if known without a callout.
+
+        :return: The concurrency, or None if test_run_concurrency would
+            have to be called to find out.
+        """
+        options = getattr(self.ui, "options", None)
+        if not getattr(options, "parallel", False):
+            return 1
+        if options.concurrency:
+            return options.concurrency
+        if parser.has_option("DEFAULT", "test_run_concurrency"):
+            return None
+        try:
+            return multiprocessing.cpu_count()
+        except NotImplementedError:
+            return 1
+
+    def _provision_in_background(self, cmd, count):
+        try:
+            self._provision(cmd, count)
+        except Exception as e:
+            self._provisioning_error = e
+
+    def _wait_for_provisioning(self):
+        """Wait for any background provisioning, raising its error if any."""
+        if self._provisioning is None:
+            return
+        self._provisioning.join()
+        self._provisioning = None
+        error, self._provisioning_error = self._provisioning_error, None
+        if error is not None:
+            raise error
+
+    def _call_all(self, calls):
+        """Make calls, concurrently if the ui permits it.
+
+        :return: A list of the results of calls.
+        """
+        if self.ui.concurrent_popen:
+            return gather(calls)
+        return [call() for call in calls]
+
+    def _provision(self, cmd, count):
+        """Get count more instances.
+
+        Healthy instances from the instance pool are used first, if there is
+        one, and the rest are provisioned with the instance_provision command
+        cmd, while any unhealthy pooled instances are disposed of.
+        """
+        pool = self._get_pool()
+        calls = []
+        if pool is not None:
+            healthy, unhealthy = self._acquire_pooled(pool, count)
+            count -= healthy
+            if unhealthy:
+                calls.append(lambda: self._run_dispose(unhealthy))
+        if count > 0:
+            calls.append(lambda: self._provision_new(cmd, count, pool))
+        self._call_all(calls)
+
+    def _provision_new(self, cmd, count, pool):
+        """Provision count new instances with the instance_provision command."""
+        variable_regex = "\$INSTANCE_COUNT"
+        cmd = re.sub(variable_regex, str(count), cmd)
+        self.ui.output_values([("running", cmd)])
+        proc = self.ui.subprocess_Popen(cmd, shell=True, stdout=subprocess.PIPE)
+        out, _ = proc.communicate()
+        if proc.returncode:
+            raise ValueError(
+                "Provisioning instances failed, return %d" % proc.returncode
+            )
+        new_instances = set([item.strip() for item in out.split()])
+        self._instances.update(new_instances)
+        if pool is not None:
+            pool.add(
+                [instance.decode("utf8") for instance in new_instances], os.getpid()
+            )
+
+    def _get_pool(self):
+        """Get the pool keeping instances between runs, if one is configured.
+
+        :return: An InstancePool, or None.
+        """
+        if self._pool is not None or self.repository is None:
+            return self._pool
+        try:
+            timeout = self.get_parser().get("DEFAULT", "instance_pool_idle_timeout")
+        except (ValueError, configparser.NoOptionError):
+            return None
+        self._pool_idle_timeout = float(timeout)
+        self._pool = self.repository.get_instance_pool()
+        return self._pool
+
+    def _acquire_pooled(self, pool, count):
+        """Lease up to count healthy instances from pool.
+
+        The instances are checked with instance_check concurrently. Those
+        failing it are removed from the pool, to be disposed of by the caller.
+
+        :return: A tuple (leased, unhealthy): the number of instances leased
+            and a list of the unhealthy instances.
+        """
+        instances = [
+            instance.encode("utf8") for instance in pool.acquire(count, os.getpid())
+        ]
+        checks = self._call_all(
+            [
+                lambda instance=instance: self._check_instance(instance)
+                for instance in instances
+            ]
+        )
+        unhealthy = [
+            instance for instance, healthy in zip(instances, checks) if not healthy
+        ]
+        if unhealthy:
+            pool.remove([instance.decode("utf8") for instance in unhealthy])
+        healthy = set(instances) - set(unhealthy)
+        self._instances.update(healthy)
+        return len(healthy), unhealthy
+
+    def _check_instance(self, instance):
+        """Run the instance_check command for instance, if configured.
+
+        :return: True if the instance is usable.
+        """
+        try:
+            check_cmd = self.get_parser().get("DEFAULT", "instance_check")
+        except configparser.NoOptionError:
+            return True
+        variable_regex = "\$INSTANCE_ID"
+        check_cmd = re.sub(variable_regex, instance.decode("utf8"), check_cmd)
+        self.ui.output_values([("running", check_cmd)])
+        run_proc = self.ui.subprocess_Popen(check_cmd, shell=True)
+        run_proc.communicate()
+        return not run_proc.returncode
 
     def _dispose_instances(self):
         instances = self._instances
         if instances is None:
             return
+        self._wait_for_provisioning()
         self._instances = None
         self._allocated_instances = None
+        pool = self._get_pool()
+        if pool is not None:
+            # Keep our instances for later runs, and dispose of any which
+            # have not been used for too long instead.
+            try:
+                pool.release([instance.decode("utf8") for instance in instances])
+                instances = pool.take_expired(self._pool_idle_timeout)
+            finally:
+                self._close_pool()
+            if not instances:
+                return
+            instances = [instance.encode("utf8") for instance in instances]
+        self._run_dispose(instances)
+
+    def _close_pool(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+    def _run_dispose(self, instances):
+        """Dispose of instances with the instance_dispose command."""
         try:
             dispose_cmd = self.get_parser().get("DEFAULT", "instance_dispose")
         except (ValueError, configparser.NoOptionError):
@@ -567,6 +1411,29 @@ class TestCommand(Fixture):
                 "Disposing of instances failed, return %d" % run_proc.returncode
             )
 
+    def reap_instances(self, everything=False):
+        """Dispose of the instances in the instance pool which have expired.
+
+        Instances expire when they have been idle for longer than
+        instance_pool_idle_timeout, or when the process leasing them has gone
+        away without returning them. This does not need the TestCommand to be
+        setUp.
+
+        :param everything: If True, dispose of every instance not in use.
+        :return: A sorted list of the disposed instance ids.
+        """
+        pool = self._get_pool()
+        if pool is None:
+            raise ValueError("No instance pool configured in .testr.conf")
+        try:
+            timeout = None if everything else self._pool_idle_timeout
+            instances = sorted(pool.take_expired(timeout))
+        finally:
+            self._close_pool()
+        if instances:
+            self._run_dispose([instance.encode("utf8") for instance in instances])
+        return instances
+
     def get_parser(self):
         """Get a parser with the .testr.conf in it."""
         parser = configparser.ConfigParser()
@@ -577,10 +1444,18 @@ class TestCommand(Fixture):
             raise ValueError("No .testr.conf config file")
         return parser
 
-    def get_run_command(self, test_ids=None, testargs=(), test_filters=None):
+    def get_run_command(
+        self,
+        test_ids=None,
+        testargs=(),
+        test_filters=None,
+        isolated=False,
+        partitions=None,
+    ):
         """Get the command that would be run to run tests.
 
-        See TestListingFixture for the definition of test_ids and test_filters.
+        See TestListingFixture for the definition of test_ids, test_filters,
+        isolated and partitions.
         """
         if self._instances is None:
             raise TypeError("TestCommand not setUp")
@@ -615,14 +1490,11 @@ class TestCommand(Fixture):
             group_regex = parser.get("DEFAULT", "group_regex")
         except configparser.NoOptionError:
             group_regex = None
-        if group_regex:
-
-            def group_callback(test_id, regex=re.compile(group_regex)):
-                match = regex.match(test_id)
-                if match:
-                    return match.group(0)
-        else:
-            group_callback = None
+        group_callback = make_group_callback(group_regex)
+        try:
+            batch_size = int(parser.get("DEFAULT", "test_batch_size"))
+        except configparser.NoOptionError:
+            batch_size = None
         if self.oldschool:
             listpath = os.path.join(self.ui.here, "failing.list")
             result = self.run_factory(
@@ -637,6 +1509,9 @@ class TestCommand(Fixture):
                 test_filters=test_filters,
                 instance_source=self,
                 group_callback=group_callback,
+                batch_size=batch_size,
+                isolated=isolated,
+                partitions=partitions,
             )
         else:
             result = self.run_factory(
@@ -650,6 +1525,9 @@ class TestCommand(Fixture):
                 test_filters=test_filters,
                 instance_source=self,
                 group_callback=group_callback,
+                batch_size=batch_size,
+                isolated=isolated,
+                partitions=partitions,
             )
         return result
 
@@ -663,29 +1541,43 @@ class TestCommand(Fixture):
             return set()
         return set([tag.strip() for tag in tags.split()])
 
+    def get_compression(self):
+        """Get the compression to store test runs with.
+
+        :return: One of testrepository.repository.compression.COMPRESSIONS.
+        """
+        try:
+            parser = self.get_parser()
+        except ValueError:
+            # No .testr.conf, e.g. for testr load.
+            return "none"
+        try:
+            value = parser.get("DEFAULT", "repository_compression").strip()
+        except configparser.NoOptionError:
+            return "none"
+        if value not in compression.COMPRESSIONS:
+            raise ValueError(
+                "Unknown repository_compression %r: expected one of %s."
+                % (value, ", ".join(compression.COMPRESSIONS))
+            )
+        if value == "zstd" and not compression.zstd_available():
+            return "zlib"
+        return value
+
     def obtain_instance(self, concurrency):
         """If possible, get one or more test run environment instance ids.
 
         Note this is not threadsafe: calling it from multiple threads would
         likely result in shared results.
         """
+        self._wait_for_provisioning()
         while len(self._instances) < concurrency:
             try:
                 cmd = self.get_parser().get("DEFAULT", "instance_provision")
             except configparser.NoOptionError:
                 # Instance allocation not configured
                 return None
-            variable_regex = "\$INSTANCE_COUNT"
-            cmd = re.sub(variable_regex, str(concurrency - len(self._instances)), cmd)
-            self.ui.output_values([("running", cmd)])
-            proc = self.ui.subprocess_Popen(cmd, shell=True, stdout=subprocess.PIPE)
-            out, _ = proc.communicate()
-            if proc.returncode:
-                raise ValueError(
-                    "Provisioning instances failed, return %d" % proc.returncode
-                )
-            new_instances = set([item.strip() for item in out.split()])
-            self._instances.update(new_instances)
+            self._provision(cmd, concurrency - len(self._instances))
         # Cached first.
         available_instances = self._instances - self._allocated_instances
         # We only ask for instances when one should be available.
@@ -16,9 +16,6 @@
 
 from io import BytesIO
 
-from subunit import ByteStreamToStreamResult
-from testtools.testresult.doubles import StreamResult
-
 
 def write_list(stream, test_ids):
     """Write test_ids out to stream.
@@ -36,6 +33,9 @@ def parse_list(list_bytes):
 
 def parse_enumeration(enumeration_bytes):
     """Parse enumeration_bytes into a list of test_ids."""
+    from subunit import ByteStreamToStreamResult
+    from testtools.testresult.doubles import StreamResult
+
     parser = ByteStreamToStreamResult(
         BytesIO(enumeration_bytes), non_subunit_name="stdout"
     )
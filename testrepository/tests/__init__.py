@@ -63,6 +63,9 @@ def test_suite():
     names = [
         "arguments",
         "commands",
+        "daemon",
+        "engine",
+        "importtime",
         "matchers",
         "monkeypatch",
         "repository",
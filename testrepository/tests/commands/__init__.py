@@ -21,15 +21,20 @@ def test_suite():
     names = [
         "commands",
         "failing",
+        "gc",
         "help",
         "init",
+        "instances",
         "last",
         "list_tests",
         "load",
         "quickstart",
         "run",
+        "serve",
+        "simulate",
         "slowest",
         "stats",
+        "timeline",
     ]
     module_names = ["testrepository.tests.commands.test_" + name for name in names]
     loader = unittest.TestLoader()
@@ -0,0 +1,118 @@
+#
+# Copyright (c) 2026 Testrepository Contributors
+#
+# Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+# license at the users choice. A copy of both licenses are available in the
+# project source as Apache-2.0 and BSD. You may not use this file except in
+# compliance with one of these two licences.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# license you chose for the specific language governing permissions and
+# limitations under that license.
+
+"""Tests for the gc command."""
+
+import os.path
+
+from fixtures import TempDir
+
+from testrepository.commands import gc
+from testrepository.ui.model import UI
+from testrepository.repository import file, memory
+from testrepository.tests import ResourcedTestCase
+
+
+class TestSelectRuns(ResourcedTestCase):
+    runs = {0: 100.0, 1: 200.0, 2: 86600.0, 3: 86700.0}
+
+    def test_no_policy_keeps_everything(self):
+        self.assertEqual(set(self.runs), gc.select_runs(self.runs))
+
+    def test_keep_last(self):
+        self.assertEqual(set([2, 3]), gc.select_runs(self.runs, keep_last=2))
+        self.assertEqual(set(), gc.select_runs(self.runs, keep_last=0))
+
+    def test_keep_days(self):
+        self.assertEqual(
+            set([1, 2, 3]), gc.select_runs(self.runs, keep_days=1, now=86600.0)
+        )
+
+    def test_keeps_the_union(self):
+        self.assertEqual(
+            set([1, 2, 3]),
+            gc.select_runs(self.runs, keep_last=3, keep_days=0.5, now=50000.0),
+        )
+
+
+class TestCommand(ResourcedTestCase):
+    def get_test_ui_and_cmd(self, options=()):
+        ui = UI(options=options)
+        ui.here = self.useFixture(TempDir()).path
+        cmd = gc.gc(ui)
+        ui.set_command(cmd)
+        cmd.repository_factory = file.RepositoryFactory()
+        return ui, cmd
+
+    def insert_runs(self, repo):
+        """Insert a run in which foo fails, then three partial runs."""
+        for partial in (False, True, True, True):
+            inserter = repo.get_inserter(partial=partial)
+            inserter.startTestRun()
+            if partial:
+                inserter.status(test_id="bar", test_status="success")
+            else:
+                inserter.status(test_id="foo", test_status="fail")
+            inserter.stopTestRun()
+
+    def test_no_policy_packs_all_but_the_latest(self):
+        ui, cmd = self.get_test_ui_and_cmd()
+        repo = cmd.repository_factory.initialise(ui.here)
+        self.insert_runs(repo)
+        self.assertEqual(0, cmd.execute())
+        self.assertEqual(
+            [("values", [("runs", 4), ("removed", 0), ("packed", 3)])], ui.outputs
+        )
+        self.assertEqual([0, 1, 2, 3], sorted(repo.get_stored_runs()))
+        self.assertTrue(os.path.exists(os.path.join(repo.base, "3")))
+        self.assertEqual(["foo"], repo.get_test_ids(0))
+
+    def test_keeps_latest_and_current_failures(self):
+        ui, cmd = self.get_test_ui_and_cmd(options=[("keep_last", 0)])
+        repo = cmd.repository_factory.initialise(ui.here)
+        self.insert_runs(repo)
+        self.assertEqual(0, cmd.execute())
+        self.assertEqual(
+            [("values", [("runs", 4), ("removed", 2), ("packed", 1)])], ui.outputs
+        )
+        self.assertEqual([0, 3], sorted(repo.get_stored_runs()))
+        self.assertEqual(2, repo.count())
+        self.assertEqual(["foo"], repo.get_test_ids(0))
+        self.assertEqual(["bar"], repo.get_test_ids(3))
+
+    def test_dry_run_changes_nothing(self):
+        ui, cmd = self.get_test_ui_and_cmd(
+            options=[("keep_last", 1), ("dry_run", True)]
+        )
+        repo = cmd.repository_factory.initialise(ui.here)
+        self.insert_runs(repo)
+        listing = sorted(os.listdir(repo.base))
+        self.assertEqual(0, cmd.execute())
+        self.assertEqual([("values", [("runs", 4), ("removed", 2)])], ui.outputs)
+        self.assertEqual(listing, sorted(os.listdir(repo.base)))
+
+    def test_empty_repository(self):
+        ui, cmd = self.get_test_ui_and_cmd(options=[("keep_last", 1)])
+        cmd.repository_factory.initialise(ui.here)
+        self.assertEqual(0, cmd.execute())
+        self.assertEqual(
+            [("values", [("runs", 0), ("removed", 0), ("packed", 0)])], ui.outputs
+        )
+
+    def test_needs_a_file_repository(self):
+        ui, cmd = self.get_test_ui_and_cmd()
+        cmd.repository_factory = memory.RepositoryFactory()
+        cmd.repository_factory.initialise(ui.here)
+        self.assertEqual(3, cmd.execute())
+        self.assertEqual("error", ui.outputs[0][0])
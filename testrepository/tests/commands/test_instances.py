@@ -0,0 +1,99 @@
+#
+# Copyright (c) 2026 Testrepository Contributors
+#
+# Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+# license at the users choice. A copy of both licenses are available in the
+# project source as Apache-2.0 and BSD. You may not use this file except in
+# compliance with one of these two licences.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# license you chose for the specific language governing permissions and
+# limitations under that license.
+
+"""Tests for the instances command."""
+
+import os.path
+import time
+
+from fixtures import TempDir
+
+from testrepository.commands import instances
+from testrepository.ui.model import UI
+from testrepository.repository import memory
+from testrepository.tests import ResourcedTestCase, Wildcard
+
+
+class TestCommand(ResourcedTestCase):
+    def get_test_ui_and_cmd(self, options=()):
+        ui = UI(options=options)
+        ui.here = self.useFixture(TempDir()).path
+        cmd = instances.instances(ui)
+        ui.set_command(cmd)
+        cmd.repository_factory = memory.RepositoryFactory()
+        repo = cmd.repository_factory.initialise(ui.here)
+        with open(os.path.join(ui.here, ".testr.conf"), "wt") as stream:
+            stream.write(
+                "[DEFAULT]\ntest_command=foo\n"
+                "instance_dispose=bar $INSTANCE_IDS\n"
+                "instance_pool_idle_timeout=60\n"
+            )
+        return ui, cmd, repo.get_instance_pool()
+
+    def test_empty_pool(self):
+        ui, cmd, pool = self.get_test_ui_and_cmd()
+        self.assertEqual(0, cmd.execute())
+        self.assertEqual([], ui.outputs)
+
+    def test_lists_instances(self):
+        ui, cmd, pool = self.get_test_ui_and_cmd()
+        pool.add(["foo", "bar"], 1234)
+        pool.release(["bar"], now=time.time() - 10)
+        self.assertEqual(0, cmd.execute())
+        self.assertEqual(
+            [
+                (
+                    "table",
+                    [
+                        ("Instance id", "Used by", "Idle (s)"),
+                        ("bar", "", Wildcard),
+                        ("foo", "process 1234", ""),
+                    ],
+                )
+            ],
+            ui.outputs,
+        )
+        self.assertTrue(int(ui.outputs[0][1][1][2]) >= 10)
+
+    def test_reap_disposes_of_expired_instances(self):
+        ui, cmd, pool = self.get_test_ui_and_cmd(options=[("reap", True)])
+        pool.add(["old", "new"], 1)
+        pool.release(["old"], now=time.time() - 61)
+        pool.release(["new"])
+        self.assertEqual(0, cmd.execute())
+        self.assertEqual(
+            [
+                ("values", [("running", "bar old")]),
+                ("popen", ("bar old",), {"shell": True}),
+                ("communicate",),
+                ("table", [("Instance id", "Used by", "Idle (s)"), ("new", "", "0")]),
+            ],
+            ui.outputs,
+        )
+
+    def test_reap_all(self):
+        ui, cmd, pool = self.get_test_ui_and_cmd(
+            options=[("reap", True), ("all", True)]
+        )
+        pool.add(["old", "new"], 1)
+        pool.release(["old", "new"])
+        self.assertEqual(0, cmd.execute())
+        self.assertEqual(
+            [
+                ("values", [("running", "bar new old")]),
+                ("popen", ("bar new old",), {"shell": True}),
+                ("communicate",),
+            ],
+            ui.outputs,
+        )
@@ -16,22 +16,25 @@
 
 from datetime import datetime, timedelta
 from io import BytesIO
+import os
 from tempfile import NamedTemporaryFile
 
+from fixtures import TempDir
 import subunit
 import iso8601
 
 import testtools
 from testtools.matchers import MatchesException
+from testtools.testresult.doubles import StreamResult
 
-from testrepository.commands import load
-from testrepository.ui.model import UI
+from testrepository.commands import load, run
+from testrepository.ui.model import ProcessModel, UI
 from testrepository.tests import (
     ResourcedTestCase,
     Wildcard,
 )
 from testrepository.tests.test_repository import RecordingRepositoryFactory
-from testrepository.repository import memory, RepositoryNotFound
+from testrepository.repository import file, memory, RepositoryNotFound
 
 
 class TestCommandLoad(ResourcedTestCase):
@@ -124,6 +127,41 @@ class TestCommandLoad(ResourcedTestCase):
         cmd.repository_factory.initialise(ui.here)
         self.assertEqual(1, cmd.execute())
 
+    def test_load_does_not_store_test_enumeration(self):
+        buffer = BytesIO()
+        stream = subunit.StreamResultToBytes(buffer)
+        for test_id in ("foo", "bar"):
+            stream.status(test_id=test_id, test_status="exists")
+        for test_id in ("foo", "bar"):
+            stream.status(test_id=test_id, test_status="inprogress")
+            stream.status(test_id=test_id, test_status="success")
+        ui = UI([("subunit", buffer.getvalue())])
+        ui.here = self.useFixture(TempDir()).path
+        cmd = load.load(ui)
+        ui.set_command(cmd)
+        cmd.repository_factory = file.RepositoryFactory()
+        repo = cmd.repository_factory.initialise(ui.here)
+        self.assertEqual(0, cmd.execute())
+        self.assertEqual(["foo", "bar"], repo.get_test_ids(0))
+
+    def test_load_stores_with_repository_compression(self):
+        buffer = BytesIO()
+        stream = subunit.StreamResultToBytes(buffer)
+        stream.status(test_id="foo", test_status="inprogress")
+        stream.status(test_id="foo", test_status="success")
+        ui = UI([("subunit", buffer.getvalue())])
+        ui.here = self.useFixture(TempDir()).path
+        with open(os.path.join(ui.here, ".testr.conf"), "wt") as config:
+            config.write("[DEFAULT]\nrepository_compression=zlib\n")
+        cmd = load.load(ui)
+        ui.set_command(cmd)
+        cmd.repository_factory = file.RepositoryFactory()
+        repo = cmd.repository_factory.initialise(ui.here)
+        self.assertEqual(0, cmd.execute())
+        with open(os.path.join(repo.base, "0"), "rb") as stored:
+            self.assertEqual(b"\x1f\x8b", stored.read(2))
+        self.assertEqual(["foo"], repo.get_test_ids(0))
+
     def test_load_new_shows_test_failures(self):
         buffer = BytesIO()
         stream = subunit.StreamResultToBytes(buffer)
@@ -237,6 +275,24 @@ class TestCommandLoad(ResourcedTestCase):
             ui.outputs,
         )
 
+    def test_load_shows_progress(self):
+        ui = UI([("subunit", b"")], [("schedule", [(["foo"], 1)])])
+        ui.show_progress = True
+        cmd = load.load(ui)
+        ui.set_command(cmd)
+        cmd.repository_factory = memory.RepositoryFactory()
+        cmd.repository_factory.initialise(ui.here)
+        self.assertEqual(0, cmd.execute())
+        # Progress is cleared before the summary is shown.
+        self.assertEqual(
+            [
+                ("progress", None),
+                ("results", Wildcard),
+                ("summary", True, 0, None, None, None, [("id", 0, None)]),
+            ],
+            ui.outputs,
+        )
+
     def test_load_quiet_shows_nothing(self):
         ui = UI([("subunit", b"")], [("quiet", True)])
         cmd = load.load(ui)
@@ -283,6 +339,52 @@ class TestCommandLoad(ResourcedTestCase):
             True, cmd.repository_factory.repos[ui.here].get_test_run(0)._partial
         )
 
+    def test_max_failures_stops_reading_streams(self):
+        buffer = BytesIO()
+        stream = subunit.StreamResultToBytes(buffer)
+        stream.status(test_id="foo", test_status="fail")
+        stream.status(test_id="bar", test_status="fail")
+        ui = UI(
+            [("subunit", buffer.getvalue())], [("quiet", True), ("max_failures", 1)]
+        )
+        cmd = load.load(ui)
+        ui.set_command(cmd)
+        cmd.repository_factory = memory.RepositoryFactory()
+        cmd.repository_factory.initialise(ui.here)
+        self.assertEqual(1, cmd.execute())
+        run = cmd.repository_factory.repos[ui.here].get_test_run(0)
+        self.assertEqual(["foo"], [test["id"] for test in run._tests])
+        # Not all of the stream was loaded, so the run is partial.
+        self.assertEqual(True, run._partial)
+
+    def test_max_failures_cancels_tests_in_progress(self):
+        buffer = BytesIO()
+        stream = subunit.StreamResultToBytes(buffer)
+        stream.status(test_id="bar", test_status="inprogress")
+        stream.status(test_id="foo", test_status="fail")
+        stream.status(test_id="bar", test_status="success")
+        ui = UI([("subunit", buffer.getvalue())], [("max_failures", 1)])
+        cmd = load.load(ui)
+        ui.set_command(cmd)
+        cmd.repository_factory = memory.RepositoryFactory()
+        cmd.repository_factory.initialise(ui.here)
+        self.assertEqual(1, cmd.execute())
+        # bar did not finish, so is skipped rather than failed.
+        self.assertEqual(
+            (
+                "summary",
+                False,
+                2,
+                None,
+                Wildcard,
+                None,
+                [("id", 0, None), ("failures", 1, None), ("skips", 1, None)],
+            ),
+            ui.outputs[-1],
+        )
+        repo = cmd.repository_factory.repos[ui.here]
+        self.assertEqual(["foo"], list(repo._failing))
+
     def test_load_timed_run(self):
         buffer = BytesIO()
         stream = subunit.StreamResultToBytes(buffer)
@@ -363,3 +465,174 @@ class TestCommandLoad(ResourcedTestCase):
             ],
             ui.outputs[1:],
         )
+
+
+class TestStreamMultiplexer(ResourcedTestCase):
+    def make_stream(self, test_id):
+        buffer = BytesIO()
+        stream = subunit.StreamResultToBytes(buffer)
+        stream.status(test_id=test_id, test_status="success")
+        return buffer.getvalue()
+
+    def get_events(self, streams):
+        result = StreamResult()
+        load.StreamMultiplexer(streams).run(result)
+        return [
+            (
+                event.test_id,
+                event.test_status,
+                event.test_tags,
+                event.file_name,
+                event.route_code,
+            )
+            for event in result._events
+            if event.name == "status"
+        ]
+
+    def test_tags_and_routes_each_stream(self):
+        streams = []
+        for test_id in ("foo", "bar"):
+            read_fd, write_fd = os.pipe()
+            with os.fdopen(write_fd, "wb") as stream:
+                stream.write(self.make_stream(test_id) + b"output")
+            streams.append(os.fdopen(read_fd, "rb"))
+            self.addCleanup(streams[-1].close)
+        events = self.get_events(streams)
+        self.assertEqual(
+            [
+                ("foo", "success", {"worker-0"}, None, "0"),
+                (None, None, {"worker-0"}, "stdout", "0"),
+                ("bar", "success", {"worker-1"}, None, "1"),
+                (None, None, {"worker-1"}, "stdout", "1"),
+            ],
+            events,
+        )
+
+    def test_terminate_only_reports_running_processes(self):
+        ui = UI()
+        proc = ProcessModel(ui)
+        proc.stdout = BytesIO(self.make_stream("foo"))
+        multiplexer = load.StreamMultiplexer([run.ReturnCodeToSubunit(proc)])
+        multiplexer.run(StreamResult())
+        # The process has finished, so stopping it stops no tests.
+        self.assertEqual(False, multiplexer.terminate())
+        self.assertNotIn(("terminate",), ui.outputs)
+
+    def test_terminate_cancels_tests_in_progress(self):
+        ui = UI()
+        proc = ProcessModel(ui)
+        buffer = BytesIO()
+        stream = subunit.StreamResultToBytes(buffer)
+        stream.status(test_id="foo", test_status="inprogress")
+        stream.status(test_id="bar", test_status="fail")
+        proc.stdout = BytesIO(buffer.getvalue())
+        multiplexer = load.StreamMultiplexer([run.ReturnCodeToSubunit(proc)])
+
+        class Terminator(StreamResult):
+            def status(self, test_id=None, test_status=None, **kwargs):
+                super(Terminator, self).status(
+                    test_id=test_id, test_status=test_status, **kwargs
+                )
+                if test_status == "fail":
+                    multiplexer.terminate()
+
+        result = Terminator()
+        multiplexer.run(result)
+        self.assertIn(("terminate",), ui.outputs)
+        self.assertEqual(
+            [
+                ("foo", "inprogress", None),
+                ("bar", "fail", None),
+                ("foo", "skip", "reason"),
+            ],
+            [
+                (event.test_id, event.test_status, event.file_name)
+                for event in result._events
+                if event.name == "status"
+            ],
+        )
+
+    def test_interrupt_terminates_processes(self):
+        ui = UI()
+        proc = ProcessModel(ui)
+        proc.stdout = BytesIO(self.make_stream("foo"))
+
+        class Interrupted(object):
+            def read(self, count):
+                raise KeyboardInterrupt()
+
+        multiplexer = load.StreamMultiplexer(
+            [run.ReturnCodeToSubunit(proc), Interrupted()]
+        )
+        self.assertRaises(KeyboardInterrupt, multiplexer.run, StreamResult())
+        self.assertIn(("terminate",), ui.outputs)
+
+    def test_packets_split_across_reads(self):
+        content = self.make_stream("foo") + self.make_stream("bar")
+
+        class Trickle(object):
+            def __init__(self):
+                self.pos = 0
+
+            def read(self, count):
+                self.pos += 1
+                return content[self.pos - 1 : self.pos]
+
+        events = self.get_events([Trickle()])
+        self.assertEqual(
+            [
+                ("foo", "success", {"worker-0"}, None, "0"),
+                ("bar", "success", {"worker-0"}, None, "0"),
+            ],
+            events,
+        )
+
+    def test_signature_byte_within_utf8_is_not_a_packet(self):
+        # U+0733 encodes as b"\xdc\xb3".
+        content = "\u0733 done".encode("utf8") + self.make_stream("foo")
+        result = StreamResult()
+        load.StreamMultiplexer([BytesIO(content)]).run(result)
+        events = [event for event in result._events if event.name == "status"]
+        self.assertEqual("stdout", events[0].file_name)
+        self.assertEqual("\u0733 done".encode("utf8"), events[0].file_bytes)
+        self.assertEqual("foo", events[1].test_id)
+
+    def test_progress_timeout_fails_tests_in_progress(self):
+        buffer = BytesIO()
+        stream = subunit.StreamResultToBytes(buffer)
+        stream.status(test_id="done", test_status="inprogress")
+        stream.status(test_id="done", test_status="success")
+        stream.status(test_id="hung", test_status="inprogress")
+        read_fd, write_fd = os.pipe()
+        os.write(write_fd, buffer.getvalue())
+        aborts = []
+
+        class Hung(object):
+            def __init__(self):
+                self.stream = os.fdopen(read_fd, "rb", buffering=0)
+
+            def read1(self, count):
+                return self.stream.read(count)
+
+            def fileno(self):
+                return read_fd
+
+            def abort(self, done_ids):
+                aborts.append(done_ids)
+                os.close(write_fd)
+
+        hung = Hung()
+        self.addCleanup(hung.stream.close)
+        result = StreamResult()
+        load.StreamMultiplexer([hung], progress_timeout=0.05).run(result)
+        # The hung test has been failed, so only the unstarted tests rerun.
+        self.assertEqual([{"done", "hung"}], aborts)
+        events = [event for event in result._events if event.name == "status"]
+        self.assertEqual(
+            ("hung", "fail", "timeout"),
+            (events[-1].test_id, events[-1].test_status, events[-1].file_name),
+        )
+        self.assertEqual(
+            b"Test process produced no output for 0.05 seconds.",
+            events[-1].file_bytes,
+        )
@@ -121,7 +121,12 @@ class TestCommand(ResourcedTestCase):
                 (
                     "popen",
                     (expected_cmd,),
-                    {"shell": True, "stdin": PIPE, "stdout": PIPE},
+                    {
+                        "shell": True,
+                        "stdin": PIPE,
+                        "stdout": PIPE,
+                        "start_new_session": True,
+                    },
                 ),
                 ("results", Wildcard),
                 ("summary", True, 0, -3, None, None, [("id", 1, None)]),
@@ -144,7 +149,12 @@ class TestCommand(ResourcedTestCase):
                 (
                     "popen",
                     (expected_cmd,),
-                    {"shell": True, "stdin": PIPE, "stdout": PIPE},
+                    {
+                        "shell": True,
+                        "stdin": PIPE,
+                        "stdout": PIPE,
+                        "start_new_session": True,
+                    },
                 ),
                 ("results", Wildcard),
                 ("summary", True, 0, -3, None, None, [("id", 1, None)]),
@@ -169,7 +179,12 @@ class TestCommand(ResourcedTestCase):
                 (
                     "popen",
                     (expected_cmd,),
-                    {"shell": True, "stdin": PIPE, "stdout": PIPE},
+                    {
+                        "shell": True,
+                        "stdin": PIPE,
+                        "stdout": PIPE,
+                        "start_new_session": True,
+                    },
                 ),
                 ("results", Wildcard),
                 ("summary", True, 0, -3, None, None, [("id", 1, None)]),
@@ -192,7 +207,12 @@ class TestCommand(ResourcedTestCase):
                 (
                     "popen",
                     (expected_cmd,),
-                    {"shell": True, "stdin": PIPE, "stdout": PIPE},
+                    {
+                        "shell": True,
+                        "stdin": PIPE,
+                        "stdout": PIPE,
+                        "start_new_session": True,
+                    },
                 ),
                 ("results", Wildcard),
                 ("summary", True, 0, -3, None, None, [("id", 1, None)]),
@@ -215,7 +235,12 @@ class TestCommand(ResourcedTestCase):
                 (
                     "popen",
                     (expected_cmd,),
-                    {"shell": True, "stdin": PIPE, "stdout": PIPE},
+                    {
+                        "shell": True,
+                        "stdin": PIPE,
+                        "stdout": PIPE,
+                        "start_new_session": True,
+                    },
                 ),
                 ("results", Wildcard),
                 ("summary", True, 0, -3, None, None, [("id", 1, None)]),
@@ -313,7 +338,12 @@ class TestCommand(ResourcedTestCase):
                 (
                     "popen",
                     (expected_cmd,),
-                    {"shell": True, "stdin": PIPE, "stdout": PIPE},
+                    {
+                        "shell": True,
+                        "stdin": PIPE,
+                        "stdout": PIPE,
+                        "start_new_session": True,
+                    },
                 ),
                 ("results", Wildcard),
                 ("summary", True, 0, -3, None, None, [("id", 1, None)]),
@@ -334,7 +364,12 @@ class TestCommand(ResourcedTestCase):
                 (
                     "popen",
                     (expected_cmd,),
-                    {"shell": True, "stdin": PIPE, "stdout": PIPE},
+                    {
+                        "shell": True,
+                        "stdin": PIPE,
+                        "stdout": PIPE,
+                        "start_new_session": True,
+                    },
                 ),
             ],
             ui.outputs,
@@ -354,7 +389,12 @@ class TestCommand(ResourcedTestCase):
                 (
                     "popen",
                     (expected_cmd,),
-                    {"shell": True, "stdin": PIPE, "stdout": PIPE},
+                    {
+                        "shell": True,
+                        "stdin": PIPE,
+                        "stdout": PIPE,
+                        "start_new_session": True,
+                    },
                 ),
             ],
             ui.outputs,
@@ -407,6 +447,105 @@ class TestCommand(ResourcedTestCase):
         run = cmd.repository_factory.repos[ui.here].get_test_run(1)
         self.assertEqual([Wildcard, "fail"], [test["status"] for test in run._tests])
 
+    def test_dynamic_runs_batches_in_workers(self):
+        list_file = tempfile.NamedTemporaryFile()
+        self.addCleanup(list_file.close)
+        write_list(list_file, ["test1", "test2", "test3"])
+        list_file.flush()
+        outputs = []
+        for test_id in ["test1", "test2", "test3"]:
+            buffer = BytesIO()
+            stream = subunit.StreamResultToBytes(buffer)
+            stream.status(test_id=test_id, test_status="success")
+            outputs.append(buffer.getvalue())
+        ui, cmd = self.get_test_ui_and_cmd(
+            options=[
+                ("quiet", True),
+                ("parallel", True),
+                ("concurrency", 2),
+                ("dynamic", True),
+                ("load_list", list_file.name),
+            ],
+            proc_outputs=outputs,
+        )
+        cmd.repository_factory = memory.RepositoryFactory()
+        self.setup_repo(cmd, ui)
+        self.set_config("[DEFAULT]\ntest_command=foo $IDLIST\ntest_batch_size=1\n")
+        self.assertEqual(0, cmd.execute())
+        self.assertEqual(
+            ["foo test1", "foo test2", "foo test3"],
+            sorted(output[1][0] for output in ui.outputs if output[0] == "popen"),
+        )
+        run = cmd.repository_factory.repos[ui.here].get_test_run(1)
+        tests = dict((test["id"], test) for test in run._tests)
+        self.assertEqual(set(["test1", "test2", "test3"]), set(tests))
+        workers = set()
+        for test in tests.values():
+            workers.update(test["tags"])
+        self.assertEqual(set(["worker-0", "worker-1"]), workers)
+
+    def test_fail_fast_stops_workers(self):
+        list_file = tempfile.NamedTemporaryFile()
+        self.addCleanup(list_file.close)
+        write_list(list_file, ["test1", "test2", "test3"])
+        list_file.flush()
+        outputs = []
+        for test_id in ["test1", "test2", "test3"]:
+            buffer = BytesIO()
+            stream = subunit.StreamResultToBytes(buffer)
+            stream.status(test_id=test_id, test_status="fail")
+            outputs.append(buffer.getvalue())
+        ui, cmd = self.get_test_ui_and_cmd(
+            options=[
+                ("quiet", True),
+                ("parallel", True),
+                ("concurrency", 1),
+                ("dynamic", True),
+                ("fail_fast", True),
+                ("load_list", list_file.name),
+            ],
+            proc_outputs=outputs,
+        )
+        cmd.repository_factory = memory.RepositoryFactory()
+        self.setup_repo(cmd, ui)
+        self.set_config("[DEFAULT]\ntest_command=foo $IDLIST\ntest_batch_size=1\n")
+        self.assertEqual(1, cmd.execute())
+        # Only the first batch ran.
+        self.assertEqual(
+            1, len([output for output in ui.outputs if output[0] == "popen"])
+        )
+        self.assertIn(("terminate",), ui.outputs)
+        run = cmd.repository_factory.repos[ui.here].get_test_run(1)
+        self.assertEqual(["test1"], [test["id"] for test in run._tests])
+        self.assertEqual(True, run._partial)
+
+    def test_interrupt_stops_workers(self):
+        list_file = tempfile.NamedTemporaryFile()
+        self.addCleanup(list_file.close)
+        write_list(list_file, ["test1", "test2"])
+        list_file.flush()
+        ui, cmd = self.get_test_ui_and_cmd(
+            options=[
+                ("quiet", True),
+                ("parallel", True),
+                ("concurrency", 2),
+                ("load_list", list_file.name),
+            ],
+        )
+        cmd.repository_factory = memory.RepositoryFactory()
+        self.setup_repo(cmd, ui)
+        self.set_config("[DEFAULT]\ntest_command=foo $IDLIST\n")
+
+        def interrupt(self):
+            raise KeyboardInterrupt()
+
+        self.useFixture(
+            MonkeyPatch("testrepository.commands.load.load.execute", interrupt)
+        )
+        self.assertRaises(KeyboardInterrupt, cmd.execute)
+        # Both workers were stopped.
+        self.assertEqual(2, ui.outputs.count(("terminate",)))
+
     def test_regex_test_filter(self):
         ui, cmd = self.get_test_ui_and_cmd(args=("ab.*cd", "--", "bar", "quux"))
         cmd.repository_factory = memory.RepositoryFactory()
@@ -499,7 +638,12 @@ class TestCommand(ResourcedTestCase):
                 (
                     "popen",
                     (expected_cmd,),
-                    {"shell": True, "stdin": PIPE, "stdout": PIPE},
+                    {
+                        "shell": True,
+                        "stdin": PIPE,
+                        "stdout": PIPE,
+                        "start_new_session": True,
+                    },
                 ),
                 ("results", Wildcard),
                 ("summary", True, 1, -2, Wildcard, Wildcard, [("id", 1, None)]),
@@ -507,7 +651,12 @@ class TestCommand(ResourcedTestCase):
                 (
                     "popen",
                     (expected_cmd,),
-                    {"shell": True, "stdin": PIPE, "stdout": PIPE},
+                    {
+                        "shell": True,
+                        "stdin": PIPE,
+                        "stdout": PIPE,
+                        "start_new_session": True,
+                    },
                 ),
                 ("results", Wildcard),
                 (
@@ -542,8 +691,25 @@ class TestCommand(ResourcedTestCase):
         )
         self.assertEqual(0, result)
 
+    def isolated_outputs(self, test_ids):
+        """Make process outputs for listing and then running test_ids."""
+        buffer = BytesIO()
+        stream = subunit.StreamResultToBytes(buffer)
+        for test_id in test_ids:
+            stream.status(test_id=test_id, test_status="exists")
+        outputs = [buffer.getvalue()]
+        for test_id in test_ids:
+            buffer = BytesIO()
+            stream = subunit.StreamResultToBytes(buffer)
+            stream.status(test_id=test_id, test_status="success")
+            outputs.append(buffer.getvalue())
+        return outputs
+
     def test_isolated_runs_multiple_processes(self):
-        ui, cmd = self.get_test_ui_and_cmd(options=[("isolated", True)])
+        ui, cmd = self.get_test_ui_and_cmd(
+            options=[("isolated", True)],
+            proc_outputs=self.isolated_outputs(["ab", "cd", "ef"]),
+        )
         cmd.repository_factory = memory.RepositoryFactory()
         self.setup_repo(cmd, ui)
         self.set_config(
@@ -551,31 +717,136 @@ class TestCommand(ResourcedTestCase):
             "test_id_option=--load-list $IDFILE\n"
             "test_list_option=--list\n"
         )
-        params, capture_ids = self.capture_ids(list_result=["ab", "cd", "ef"])
-        self.useFixture(
-            MonkeyPatch(
-                "testrepository.testcommand.TestCommand.get_run_command", capture_ids
+        cmd_result = cmd.execute()
+        self.assertEqual(0, cmd_result)
+        # once to list, then 3 each executing one test.
+        self.assertEqual(
+            ["foo  --list", "foo ab ", "foo cd ", "foo ef "],
+            [output[1][0] for output in ui.outputs if output[0] == "popen"],
+        )
+        # All in a single run.
+        self.assertEqual(
+            ("summary", True, 3, 0, Wildcard, Wildcard, [("id", 1, None)]),
+            ui.outputs[-1],
+        )
+        self.assertEqual(2, cmd.repository_factory.repos[ui.here].count())
+
+    def test_isolated_parallel(self):
+        ui, cmd = self.get_test_ui_and_cmd(
+            options=[("isolated", True), ("parallel", True), ("concurrency", 2)],
+            proc_outputs=self.isolated_outputs(["ab", "cd", "ef"]),
+        )
+        cmd.repository_factory = memory.RepositoryFactory()
+        self.setup_repo(cmd, ui)
+        self.set_config(
+            "[DEFAULT]\ntest_command=foo $IDLIST $LISTOPT\n"
+            "test_id_option=--load-list $IDFILE\n"
+            "test_list_option=--list\n"
+        )
+        self.assertEqual(0, cmd.execute())
+        self.assertEqual(
+            ["foo  --list", "foo ab ", "foo cd ", "foo ef "],
+            sorted(output[1][0] for output in ui.outputs if output[0] == "popen"),
+        )
+        run = cmd.repository_factory.repos[ui.here].get_test_run(1)
+        workers = set()
+        for test in run._tests:
+            workers.update(test["tags"])
+        self.assertEqual(set(["worker-0", "worker-1"]), workers)
+
+    def run_output(self, test_status):
+        buffer = BytesIO()
+        stream = subunit.StreamResultToBytes(buffer)
+        stream.status(test_id="failing1", test_status=test_status)
+        return buffer.getvalue()
+
+    def setup_isolation_repo(self, cmd, ui):
+        repo = cmd.repository_factory.initialise(ui.here)
+        inserter = repo.get_inserter()
+        inserter.startTestRun()
+        for test_id in ["a", "b", "c"]:
+            inserter.status(
+                test_id=test_id, test_status="success", test_tags=set(["worker-0"])
             )
+        inserter.status(
+            test_id="failing1", test_status="fail", test_tags=set(["worker-0"])
         )
-        cmd_result = cmd.execute()
+        inserter.status(test_id="d", test_status="success", test_tags=set(["worker-1"]))
+        inserter.stopTestRun()
+
+    def test_analyze_isolation(self):
+        # failing1 passes on its own, and fails when run after b.
+        ui, cmd = self.get_test_ui_and_cmd(
+            options=[("analyze_isolation", True)],
+            proc_outputs=[
+                self.run_output("success"),
+                self.run_output("fail"),
+                self.run_output("success"),
+                self.run_output("fail"),
+            ],
+        )
+        cmd.repository_factory = memory.RepositoryFactory()
+        self.setup_isolation_repo(cmd, ui)
+        self.set_config("[DEFAULT]\ntest_command=foo $IDLIST\n")
+        self.assertEqual(3, cmd.execute())
         self.assertEqual(
-            [
-                ("results", Wildcard),
-                ("summary", True, 0, -3, None, None, [("id", 1, None)]),
-                ("results", Wildcard),
-                ("summary", True, 0, 0, None, None, [("id", 2, None)]),
-                ("results", Wildcard),
-                ("summary", True, 0, 0, None, None, [("id", 3, None)]),
+            ["foo failing1", "foo a b failing1", "foo a failing1", "foo b failing1"],
+            [output[1][0] for output in ui.outputs if output[0] == "popen"],
+        )
+        self.assertEqual(
+            ("table", [("failing test", "caused by test"), ("failing1", "b")]),
+            ui.outputs[-1],
+        )
+
+    def test_analyze_isolation_parallel_probes(self):
+        # With more workers the candidates are split more ways and probed at
+        # once: a and b are each run with failing1, and had neither
+        # reproduced the failure c would have been left.
+        ui, cmd = self.get_test_ui_and_cmd(
+            options=[
+                ("analyze_isolation", True),
+                ("parallel", True),
+                ("concurrency", 2),
+            ],
+            proc_outputs=[
+                self.run_output("success"),
+                self.run_output("success"),
+                self.run_output("fail"),
             ],
-            ui.outputs,
         )
-        self.assertEqual(0, cmd_result)
-        # once to list, then 3 each executing one test.
-        self.assertThat(params, HasLength(4))
-        self.assertThat(params[0][1], Equals(None))
-        self.assertThat(params[1][1], Equals(["ab"]))
-        self.assertThat(params[2][1], Equals(["cd"]))
-        self.assertThat(params[3][1], Equals(["ef"]))
+        cmd.repository_factory = memory.RepositoryFactory()
+        self.setup_isolation_repo(cmd, ui)
+        self.set_config("[DEFAULT]\ntest_command=foo $IDLIST\n")
+        self.assertEqual(3, cmd.execute())
+        self.assertEqual(
+            ["foo failing1", "foo a failing1", "foo b failing1"],
+            [output[1][0] for output in ui.outputs if output[0] == "popen"],
+        )
+        self.assertEqual(
+            ("table", [("failing test", "caused by test"), ("failing1", "b")]),
+            ui.outputs[-1],
+        )
+
+    def test_analyze_isolation_retried_tests(self):
+        # failing1 timed out on worker-0 and passed when rescheduled onto
+        # worker-1, after b.
+        repo = memory.RepositoryFactory().initialise("memory:")
+        inserter = repo.get_inserter()
+        inserter.startTestRun()
+        for test_id, status, worker in [
+            ("a", "success", "worker-0"),
+            ("failing1", "fail", "worker-0"),
+            ("b", "success", "worker-1"),
+            ("failing1", "success", "worker-1"),
+        ]:
+            inserter.status(
+                test_id=test_id, test_status=status, test_tags=set([worker])
+            )
+        inserter.stopTestRun()
+        ui, cmd = self.get_test_ui_and_cmd()
+        run = repo.get_latest_run()
+        self.assertEqual(set(["a"]), cmd._find_passed(run, ["a", "failing1"]))
+        self.assertEqual(["a"], cmd._prior_tests(run, "failing1"))
 
     def test_fails_if_repo_doesnt_exist(self):
         ui, cmd = self.get_test_ui_and_cmd(args=())
@@ -598,7 +869,16 @@ class TestCommand(ResourcedTestCase):
         self.assertEqual(
             [
                 ("values", [("running", "foo ")]),
-                ("popen", ("foo ",), {"shell": True, "stdin": PIPE, "stdout": PIPE}),
+                (
+                    "popen",
+                    ("foo ",),
+                    {
+                        "shell": True,
+                        "stdin": PIPE,
+                        "stdout": PIPE,
+                        "start_new_session": True,
+                    },
+                ),
                 ("results", Wildcard),
                 ("summary", True, 0, None, Wildcard, Wildcard, [("id", 0, None)]),
             ],
@@ -672,3 +952,15 @@ class TestReturnCodeToSubunit(ResourcedTestCase):
         )
         expected_content = buffer.getvalue()
         self.assertEqual(expected_content, content)
+
+    def test_returncode_of_terminated_process_not_reported(self):
+        proc = ProcessModel(UI())
+        proc.stdout.write(self.stdout)
+        proc.stdout.seek(0)
+        proc.returncode = -15
+        stream = run.ReturnCodeToSubunit(proc)
+        self.assertEqual(True, stream.terminate())
+        content = accumulate(stream, self.reader)
+        self.assertEqual(self.stdout, content)
+        # Once the process has finished there is nothing to terminate.
+        self.assertEqual(False, stream.terminate())
@@ -0,0 +1,122 @@
+#
+# Copyright (c) 2026 Testrepository Contributors
+#
+# Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+# license at the users choice. A copy of both licenses are available in the
+# project source as Apache-2.0 and BSD. You may not use this file except in
+# compliance with one of these two licences.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# license you chose for the specific language governing permissions and
+# limitations under that license.
+
+"""Tests for the serve command."""
+
+from datetime import (
+    datetime,
+    timedelta,
+    timezone,
+)
+from io import BytesIO, TextIOWrapper
+import os
+import threading
+
+from fixtures import TempDir
+
+from testrepository import daemon
+from testrepository.commands import serve
+from testrepository.repository import file
+from testrepository.tests import ResourcedTestCase
+
+
+class TestServer(ResourcedTestCase):
+    def setUp(self):
+        super(TestServer, self).setUp()
+        self.here = self.useFixture(TempDir()).path
+        file.RepositoryFactory().initialise(self.here)
+
+    def start_server(self, requests):
+        server = serve.Server(self.here)
+        server.start()
+        self.addCleanup(server.stop)
+        thread = threading.Thread(target=server.serve, args=(requests,))
+        thread.start()
+        self.addCleanup(thread.join)
+        return server
+
+    def call(self, *args):
+        stdout = TextIOWrapper(BytesIO(), "utf8")
+        stderr = TextIOWrapper(BytesIO(), "utf8")
+        code = daemon.call(list(args) + ["-d", self.here], stdout, stderr)
+        return code, stdout.buffer.getvalue(), stderr.buffer.getvalue()
+
+    def test_runs_resident_commands(self):
+        self.start_server(1)
+        self.assertEqual((0, b"runs=0\n", b""), self.call("stats"))
+
+    def test_refuses_other_commands(self):
+        self.start_server(1)
+        self.assertEqual((1, b"", b"testr serve cannot run init.\n"), self.call("init"))
+
+    def test_stop_removes_socket(self):
+        server = serve.Server(self.here)
+        server.start()
+        self.assertTrue(os.path.exists(server.path))
+        server.stop()
+        self.assertFalse(os.path.exists(server.path))
+
+    def test_start_refuses_second_server(self):
+        # The check connects to the running server, without a request.
+        self.start_server(2)
+        self.assertRaises(ValueError, serve.Server(self.here).start)
+        # Let the first server finish.
+        self.call("stats")
+
+    def test_idle_timeout(self):
+        server = serve.Server(self.here, idle_timeout=0.01)
+        server.start()
+        self.addCleanup(server.stop)
+        # Returns, rather than waiting for a request.
+        server.serve()
+
+
+class TestCachingRepository(ResourcedTestCase):
+    def setUp(self):
+        super(TestCachingRepository, self).setUp()
+        self.here = self.useFixture(TempDir()).path
+        file.RepositoryFactory().initialise(self.here)
+        self.factory = serve.CachingRepositoryFactory()
+        self.repo = self.factory.open(self.here)
+
+    def insert_run(self, duration):
+        base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        inserter = self.repo.get_inserter()
+        inserter.startTestRun()
+        inserter.status(test_id="foo", test_status="inprogress", timestamp=base)
+        inserter.status(
+            test_id="foo",
+            test_status="success",
+            timestamp=base + timedelta(seconds=duration),
+        )
+        inserter.stopTestRun()
+
+    def test_opens_repository_once(self):
+        self.assertIs(self.repo, self.factory.open(self.here))
+
+    def test_caches_runs_until_changed(self):
+        self.insert_run(1)
+        run = self.repo.get_test_run(0)
+        self.assertIs(run, self.repo.get_test_run(0))
+        with open(os.path.join(self.repo.base, "0"), "ab") as stream:
+            stream.write(b"more")
+        self.assertIsNot(run, self.repo.get_test_run(0))
+
+    def test_caches_times_until_changed(self):
+        self.insert_run(1)
+        self.assertEqual({"foo": 1.0}, self.repo.get_test_times(["foo"])["known"])
+        self.insert_run(3)
+        times = self.repo.get_test_times(["foo", "bar"])
+        self.assertNotEqual(1.0, times["known"]["foo"])
+        self.assertEqual({"bar"}, times["unknown"])
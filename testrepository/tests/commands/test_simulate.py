@@ -0,0 +1,87 @@
+#
+# Copyright (c) 2026 Testrepository Contributors
+#
+# Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+# license at the users choice. A copy of both licenses are available in the
+# project source as Apache-2.0 and BSD. You may not use this file except in
+# compliance with one of these two licences.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# license you chose for the specific language governing permissions and
+# limitations under that license.
+
+"""Tests for the simulate command."""
+
+from datetime import (
+    datetime,
+    timedelta,
+    timezone,
+)
+
+from testrepository.commands import simulate
+from testrepository.ui.model import UI
+from testrepository.repository import memory
+from testrepository.tests import ResourcedTestCase
+
+
+class TestCommand(ResourcedTestCase):
+    def get_test_ui_and_cmd(self, options=(), args=()):
+        ui = UI(options=options, args=args)
+        cmd = simulate.simulate(ui)
+        ui.set_command(cmd)
+        cmd.repository_factory = memory.RepositoryFactory()
+        self.repo = cmd.repository_factory.initialise(ui.here)
+        return ui, cmd
+
+    def insert_run(self, durations):
+        base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        inserter = self.repo.get_inserter()
+        inserter.startTestRun()
+        for test_id, duration in durations:
+            inserter.status(test_id=test_id, test_status="inprogress", timestamp=base)
+            inserter.status(
+                test_id=test_id,
+                test_status="success",
+                timestamp=base + timedelta(seconds=duration),
+            )
+        inserter.stopTestRun()
+
+    def test_simulates_each_strategy_and_concurrency(self):
+        ui, cmd = self.get_test_ui_and_cmd(options=[("concurrency", "1,2")])
+        self.insert_run([("a", 4), ("b", 1), ("c", 1), ("d", 2)])
+        self.assertEqual(0, cmd.execute())
+        [(kind, rows)] = ui.outputs
+        self.assertEqual("table", kind)
+        self.assertEqual(
+            [
+                ("partition", "1", "8.000", "8.000", "0%", "c"),
+                ("dynamic", "1", "8.000", "8.000", "0%", "c"),
+                ("partition", "2", "4.000", "4.000", "0%", "c"),
+                ("dynamic", "2", "4.000", "4.000", "0%", "c"),
+            ],
+            rows[1:],
+        )
+
+    def test_group_regex_option(self):
+        ui, cmd = self.get_test_ui_and_cmd(
+            options=[("concurrency", "2"), ("group_regex", "[^.]+")]
+        )
+        self.insert_run([("x.a", 4), ("x.b", 1), ("y.c", 1), ("y.d", 2)])
+        self.assertEqual(0, cmd.execute())
+        rows = ui.outputs[0][1]
+        # The x group is longer than the fair share of the total time.
+        self.assertEqual(("partition", "2", "5.000", "5.000", "0%", "x"), rows[1])
+
+    def test_bad_concurrency(self):
+        ui, cmd = self.get_test_ui_and_cmd(options=[("concurrency", "0")])
+        self.assertEqual(3, cmd.execute())
+        self.assertEqual("error", ui.outputs[0][0])
+
+    def test_simulate_batches_takes_next_batch_when_free(self):
+        durations = {"a": 3.0, "b": 1.0, "c": 1.0, "d": 0.5}
+        self.assertEqual(
+            (3.0, "a"),
+            simulate.simulate_batches([["a"], ["b"], ["c"], ["d"]], 2, durations),
+        )
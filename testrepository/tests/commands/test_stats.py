@@ -36,6 +36,29 @@ class TestCommand(ResourcedTestCase):
         inserter.stopTestRun()
         inserter = repo.get_inserter()
         inserter.startTestRun()
+        inserter.status(test_id="foo", test_status="success")
+        inserter.status(test_id="bar", test_status="fail")
         inserter.stopTestRun()
         self.assertEqual(0, cmd.execute())
-        self.assertEqual([("values", [("runs", 2)])], ui.outputs)
+        self.assertEqual(
+            [
+                (
+                    "values",
+                    [
+                        ("runs", 2),
+                        ("latest", 1),
+                        ("tests", 2),
+                        ("failures", 1),
+                        ("skips", 0),
+                    ],
+                )
+            ],
+            ui.outputs,
+        )
+
+    def test_empty_repository(self):
+        ui, cmd = self.get_test_ui_and_cmd()
+        cmd.repository_factory = memory.RepositoryFactory()
+        cmd.repository_factory.initialise(ui.here)
+        self.assertEqual(0, cmd.execute())
+        self.assertEqual([("values", [("runs", 0)])], ui.outputs)
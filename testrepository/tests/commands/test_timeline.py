@@ -0,0 +1,139 @@
+#
+# Copyright (c) 2026 Testrepository Contributors
+#
+# Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+# license at the users choice. A copy of both licenses are available in the
+# project source as Apache-2.0 and BSD. You may not use this file except in
+# compliance with one of these two licences.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# license you chose for the specific language governing permissions and
+# limitations under that license.
+
+"""Tests for the timeline command."""
+
+from datetime import (
+    datetime,
+    timedelta,
+    timezone,
+)
+import json
+import os.path
+
+from fixtures import TempDir
+
+from testrepository.commands import timeline
+from testrepository.ui.model import UI
+from testrepository.repository import memory
+from testrepository.tests import ResourcedTestCase
+
+
+class TestCommand(ResourcedTestCase):
+    def get_test_ui_and_cmd(self, options=(), args=()):
+        ui = UI(options=options, args=args)
+        cmd = timeline.timeline(ui)
+        ui.set_command(cmd)
+        cmd.repository_factory = memory.RepositoryFactory()
+        self.repo = cmd.repository_factory.initialise(ui.here)
+        return ui, cmd
+
+    def insert_run(self, tests):
+        """Insert a run of tests.
+
+        :param tests: A list of (test_id, worker, start, stop) tuples, with
+            start and stop in seconds from the start of the run.
+        """
+        base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        inserter = self.repo.get_inserter()
+        inserter.startTestRun()
+        for test_id, worker, start, stop in tests:
+            inserter.status(
+                test_id=test_id,
+                test_status="inprogress",
+                test_tags={worker},
+                timestamp=base + timedelta(seconds=start),
+            )
+            inserter.status(
+                test_id=test_id,
+                test_status="success",
+                test_tags={worker},
+                timestamp=base + timedelta(seconds=stop),
+            )
+        inserter.stopTestRun()
+
+    def test_shows_worker_utilisation(self):
+        ui, cmd = self.get_test_ui_and_cmd()
+        self.insert_run(
+            [
+                ("a", "worker-0", 0, 2),
+                ("b", "worker-1", 0, 1),
+                ("c", "worker-0", 3, 4),
+            ]
+        )
+        self.assertEqual(0, cmd.execute())
+        self.assertEqual(
+            [
+                (
+                    "table",
+                    [
+                        (
+                            "Worker",
+                            "Tests",
+                            "Start (s)",
+                            "Finish (s)",
+                            "Busy (s)",
+                            "Idle (s)",
+                            "Idle tail (s)",
+                        ),
+                        ("worker-0", "2", "0.000", "4.000", "3.000", "1.000", "0.000"),
+                        ("worker-1", "1", "0.000", "1.000", "1.000", "0.000", "3.000"),
+                    ],
+                ),
+                (
+                    "values",
+                    [("makespan", "4.000"), ("ideal", "2.000"), ("efficiency", "50%")],
+                ),
+            ],
+            ui.outputs,
+        )
+
+    def test_run_id_selects_run(self):
+        ui, cmd = self.get_test_ui_and_cmd(args=["0"])
+        self.insert_run([("a", "worker-0", 0, 2)])
+        self.insert_run([("a", "worker-0", 0, 5)])
+        self.assertEqual(0, cmd.execute())
+        self.assertEqual(
+            (
+                "values",
+                [("makespan", "2.000"), ("ideal", "2.000"), ("efficiency", "100%")],
+            ),
+            ui.outputs[-1],
+        )
+
+    def test_writes_chrome_trace(self):
+        path = os.path.join(self.useFixture(TempDir()).path, "trace.json")
+        ui, cmd = self.get_test_ui_and_cmd(options=[("trace", path)])
+        self.insert_run([("a", "worker-0", 0, 2), ("b", "worker-1", 1, 1.5)])
+        self.assertEqual(0, cmd.execute())
+        with open(path) as trace:
+            events = json.load(trace)["traceEvents"]
+        self.assertEqual(
+            [
+                ("thread_name", "M", 0, None, None),
+                ("a", "X", 0, 0, 2000000),
+                ("thread_name", "M", 1, None, None),
+                ("b", "X", 1, 1000000, 500000),
+            ],
+            [
+                (
+                    event["name"],
+                    event["ph"],
+                    event["tid"],
+                    event.get("ts"),
+                    event.get("dur"),
+                )
+                for event in events
+            ],
+        )
@@ -19,7 +19,10 @@ import unittest
 
 def test_suite():
     names = [
+        "compression",
         "file",
+        "instances",
+        "timing",
     ]
     module_names = ["testrepository.tests.repository.test_" + name for name in names]
     loader = unittest.TestLoader()
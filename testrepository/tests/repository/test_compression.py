@@ -0,0 +1,68 @@
+#
+# Copyright (c) 2026 Testrepository Contributors
+#
+# Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+# license at the users choice. A copy of both licenses are available in the
+# project source as Apache-2.0 and BSD. You may not use this file except in
+# compliance with one of these two licences.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# license you chose for the specific language governing permissions and
+# limitations under that license.
+
+"""Tests for the compression of stored streams."""
+
+import os.path
+
+from fixtures import TempDir
+
+from testrepository.repository import compression
+from testrepository.tests import ResourcedTestCase
+
+
+class TestCompression(ResourcedTestCase):
+    def write(self, content, kind):
+        path = os.path.join(self.useFixture(TempDir()).path, "stream")
+        with compression.open_writer(open(path, "wb"), kind) as stream:
+            for offset in range(0, len(content), 7):
+                stream.write(content[offset : offset + 7])
+                stream.flush()
+        return path
+
+    def check_round_trip(self, kind, magic):
+        content = b"\xb3 some subunit\n" * 1000
+        path = self.write(content, kind)
+        with open(path, "rb") as stream:
+            stored = stream.read()
+        self.assertTrue(stored.startswith(magic))
+        self.assertLess(len(stored), len(content))
+        with compression.open_stream(path) as stream:
+            self.assertEqual(content[:1], stream.read(1))
+            self.assertEqual(content[1:], stream.read())
+
+    def test_none(self):
+        content = b"\xb3 some subunit\n"
+        for kind in (None, "none"):
+            path = self.write(content, kind)
+            with compression.open_stream(path) as stream:
+                self.assertEqual(content, stream.read())
+
+    def test_zlib(self):
+        self.check_round_trip("zlib", compression.ZLIB_MAGIC)
+
+    def test_zstd(self):
+        if not compression.zstd_available():
+            self.skipTest("zstandard is not installed.")
+        self.check_round_trip("zstd", compression.ZSTD_MAGIC)
+
+    def test_empty_stream(self):
+        path = self.write(b"", "zlib")
+        with compression.open_stream(path) as stream:
+            self.assertEqual(b"", stream.read())
+
+    def test_unknown_compression(self):
+        path = os.path.join(self.useFixture(TempDir()).path, "stream")
+        with open(path, "wb") as stream:
+            self.assertRaises(ValueError, compression.open_writer, stream, "lzma")
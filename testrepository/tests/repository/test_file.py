@@ -19,6 +19,8 @@ import shutil
 import tempfile
 
 from fixtures import Fixture
+from subunit import TestProtocolClient
+import testtools
 from testtools.matchers import Raises, MatchesException
 
 from testrepository.repository import file
@@ -59,7 +61,7 @@ class TestFileRepository(ResourcedTestCase):
             contents = stream.read()
         finally:
             stream.close()
-        self.assertEqual("1\n", contents)
+        self.assertEqual("2\n", contents)
         stream = open(os.path.join(base, "next-stream"), "rt")
         try:
             contents = stream.read()
@@ -108,3 +110,179 @@ class TestFileRepository(ResourcedTestCase):
         inserter.stopTestRun()
         os.chmod(os.path.join(repo.base, "0"), 0000)
         self.assertRaises(IOError, repo.get_test_run, "0")
+
+    def test_inserted_streams_are_subunit_v2(self):
+        repo = self.useFixture(FileRepositoryFixture(self)).repo
+        inserter = repo.get_inserter()
+        inserter.startTestRun()
+        inserter.status(test_id="foo", test_status="success")
+        inserter.stopTestRun()
+        with open(os.path.join(repo.base, "0"), "rb") as stream:
+            content = stream.read()
+        self.assertEqual(b"\xb3", content[:1])
+        self.assertEqual(content, repo.get_test_run(0).get_subunit_stream().read())
+
+    def test_get_test_rereads_the_run_each_time(self):
+        repo = self.useFixture(FileRepositoryFixture(self)).repo
+        inserter = repo.get_inserter()
+        inserter.startTestRun()
+        inserter.status(test_id="foo", test_status="fail")
+        inserter.stopTestRun()
+        case = repo.get_test_run(0).get_test()
+        for _ in range(2):
+            summary = testtools.StreamSummary()
+            summary.startTestRun()
+            case.run(summary)
+            summary.stopTestRun()
+            self.assertEqual(["foo"], [test.id() for test, _ in summary.errors])
+
+    def test_empty_streams(self):
+        repo = self.useFixture(FileRepositoryFixture(self)).repo
+        inserter = repo.get_inserter()
+        inserter.startTestRun()
+        inserter.stopTestRun()
+        open(os.path.join(repo.base, "0"), "wb").close()
+        os.unlink(os.path.join(repo.base, "failing"))
+        for run in (repo.get_test_run(0), repo.get_failing()):
+            with run.get_subunit_stream() as stream:
+                self.assertEqual(b"", stream.read())
+            summary = testtools.StreamSummary()
+            summary.startTestRun()
+            run.get_test().run(summary)
+            summary.stopTestRun()
+            self.assertEqual(0, summary.testsRun)
+
+    def test_compressed_streams(self):
+        repo = self.useFixture(FileRepositoryFixture(self)).repo
+        for kind in ("none", "zlib"):
+            repo.compression = kind
+            inserter = repo.get_inserter()
+            inserter.startTestRun()
+            inserter.status(test_id=kind, test_status="fail")
+            inserter.stopTestRun()
+        with open(os.path.join(repo.base, "1"), "rb") as stream:
+            self.assertEqual(b"\x1f\x8b", stream.read(2))
+        with open(os.path.join(repo.base, "failing"), "rb") as stream:
+            self.assertEqual(b"\x1f\x8b", stream.read(2))
+        # Each run is read with the compression it was stored with.
+        self.assertEqual(["none"], repo.get_test_ids(0))
+        self.assertEqual(["zlib"], repo.get_test_ids(1))
+        with repo.get_test_run(1).get_subunit_stream() as stream:
+            self.assertEqual(b"\xb3", stream.read(1))
+        summary = testtools.StreamSummary()
+        summary.startTestRun()
+        repo.get_failing().get_test().run(summary)
+        summary.stopTestRun()
+        self.assertEqual(["zlib"], [test.id() for test, _ in summary.errors])
+
+    def insert_runs(self, repo, kinds):
+        for kind in kinds:
+            repo.compression = kind
+            inserter = repo.get_inserter()
+            inserter.startTestRun()
+            inserter.status(test_id=kind, test_status="fail")
+            inserter.stopTestRun()
+
+    def test_pack_runs(self):
+        repo = self.useFixture(FileRepositoryFixture(self)).repo
+        self.insert_runs(repo, ["none", "zlib", "none"])
+        stored = repo.get_stored_runs()
+        self.assertEqual([0, 1], repo.pack_runs([0, 1]))
+        self.assertEqual([], repo.pack_runs([0, 1]))
+        for name in ("0", "0.summary", "1", "1.summary"):
+            self.assertFalse(os.path.exists(os.path.join(repo.base, name)))
+        self.assertEqual(stored, repo.get_stored_runs())
+        self.assertEqual(3, repo.count())
+        self.assertEqual(["none"], repo.get_test_ids(0))
+        self.assertEqual(["zlib"], repo.get_test_ids(1))
+        self.assertEqual(["none"], repo.get_test_ids(2))
+        self.assertEqual(1, repo.get_test_run(1).get_summary().get_num_failures())
+        self.assertRaises(KeyError, repo.get_test_run, 3)
+
+    def test_remove_runs(self):
+        repo = self.useFixture(FileRepositoryFixture(self)).repo
+        self.insert_runs(repo, ["none", "zlib", "none", "zlib"])
+        repo.pack_runs([0, 1, 2])
+        repo.remove_runs([1, 3])
+        self.assertEqual([0, 2], sorted(repo.get_stored_runs()))
+        self.assertEqual(2, repo.count())
+        self.assertRaises(KeyError, repo.get_test_run, 1)
+        self.assertRaises(KeyError, repo.get_test_run, 3)
+        self.assertEqual(["none"], repo.get_test_ids(0))
+        self.assertEqual(["none"], repo.get_test_ids(2))
+        self.assertEqual(
+            ["archive-1.pack", "archive.db", "failing", "format", "next-stream"],
+            sorted(os.listdir(repo.base)),
+        )
+        # Removed ids are not reused.
+        self.insert_runs(repo, ["none"])
+        self.assertEqual([0, 2, 4], sorted(repo.get_stored_runs()))
+        self.assertEqual(4, repo.latest_id())
+
+    def test_open_upgrades_format_1(self):
+        base = os.path.join(self.tempdir, ".testrepository")
+        self.resources[0][1].dirtied(self.tempdir)
+        os.mkdir(base)
+        with open(os.path.join(base, "format"), "wt") as stream:
+            stream.write("1\n")
+        with open(os.path.join(base, "next-stream"), "wt") as stream:
+            stream.write("1\n")
+        for name in ("0", "failing"):
+            with open(os.path.join(base, name), "wb") as stream:
+                client = testtools.StreamToExtendedDecorator(TestProtocolClient(stream))
+                client.startTestRun()
+                client.status(test_id="foo", test_status="inprogress")
+                client.status(test_id="foo", test_status="fail")
+                client.stopTestRun()
+        repo = file.RepositoryFactory().open(self.tempdir)
+        with open(os.path.join(base, "format"), "rt") as stream:
+            self.assertEqual("2\n", stream.read())
+        self.assertEqual(["foo"], repo.get_test_ids(0))
+        summary = testtools.StreamSummary()
+        summary.startTestRun()
+        repo.get_failing().get_test().run(summary)
+        summary.stopTestRun()
+        self.assertEqual(["foo"], [test.id() for test, _ in summary.errors])
+
+    def test_get_summary_uses_summary_record(self):
+        repo = self.useFixture(FileRepositoryFixture(self)).repo
+        inserter = repo.get_inserter()
+        inserter.startTestRun()
+        inserter.status(test_id="foo", test_status="fail")
+        inserter.stopTestRun()
+        self.assertTrue(os.path.exists(os.path.join(repo.base, "0.summary")))
+        # The run itself is not consulted when the record exists.
+        open(os.path.join(repo.base, "0"), "wb").close()
+        summary = repo.get_test_run(0).get_summary()
+        self.assertEqual(1, summary.testsRun)
+        self.assertEqual(1, summary.get_num_failures())
+
+    def test_get_summary_without_summary_record(self):
+        repo = self.useFixture(FileRepositoryFixture(self)).repo
+        inserter = repo.get_inserter()
+        inserter.startTestRun()
+        inserter.status(test_id="foo", test_status="fail")
+        inserter.stopTestRun()
+        os.unlink(os.path.join(repo.base, "0.summary"))
+        summary = repo.get_test_run(0).get_summary()
+        self.assertEqual(1, summary.testsRun)
+        self.assertEqual(1, summary.get_num_failures())
+
+    def test_inserting_does_not_reread_the_run(self):
+        repo = self.useFixture(FileRepositoryFixture(self)).repo
+
+        def get_test_run(run_id):
+            self.fail("get_test_run called during insertion")
+
+        repo.get_test_run = get_test_run
+        inserter = repo.get_inserter()
+        inserter.startTestRun()
+        inserter.status(test_id="foo", test_status="inprogress")
+        inserter.status(test_id="foo", test_status="fail")
+        inserter.status(test_id="bar", test_status="success")
+        inserter.stopTestRun()
+        summary = testtools.StreamSummary()
+        summary.startTestRun()
+        repo.get_failing().get_test().run(summary)
+        summary.stopTestRun()
+        self.assertEqual(["foo"], [test.id() for test, _ in summary.errors])
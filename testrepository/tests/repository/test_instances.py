@@ -0,0 +1,84 @@
+#
+# Copyright (c) 2026 Testrepository Contributors
+#
+# Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+# license at the users choice. A copy of both licenses are available in the
+# project source as Apache-2.0 and BSD. You may not use this file except in
+# compliance with one of these two licences.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# license you chose for the specific language governing permissions and
+# limitations under that license.
+
+"""Tests for the instance pool."""
+
+import os
+import os.path
+
+from fixtures import TempDir
+
+from testrepository.repository import instances
+from testrepository.tests import ResourcedTestCase
+
+
+class TestInstancePool(ResourcedTestCase):
+    def make_pool(self):
+        tempdir = self.useFixture(TempDir()).path
+        pool = instances.InstancePool(os.path.join(tempdir, "instances.db"))
+        self.addCleanup(pool.close)
+        return pool
+
+    def test_empty(self):
+        pool = self.make_pool()
+        self.assertEqual([], pool.list())
+        self.assertEqual([], pool.acquire(2, 1))
+
+    def test_added_instances_are_leased(self):
+        pool = self.make_pool()
+        pool.add(["foo", "bar"], 1, now=10.0)
+        self.assertEqual([("bar", 1, 10.0, None), ("foo", 1, 10.0, None)], pool.list())
+        self.assertEqual([], pool.acquire(2, 2))
+
+    def test_released_instances_are_reused_most_recent_first(self):
+        pool = self.make_pool()
+        pool.add(["foo", "bar", "quux"], 1)
+        pool.release(["foo"], now=10.0)
+        pool.release(["bar"], now=20.0)
+        self.assertEqual(["bar"], pool.acquire(1, 2, now=30.0))
+        self.assertEqual(
+            [("bar", 2, 30.0, None), ("foo", None, None, 10.0)],
+            pool.list()[:2],
+        )
+
+    def test_leases_shared_between_pools(self):
+        pool = self.make_pool()
+        pool.add(["foo"], 1)
+        pool.release(["foo"])
+        other = instances.InstancePool(pool.path)
+        self.addCleanup(other.close)
+        self.assertEqual(["foo"], other.acquire(1, 2))
+        self.assertEqual([], pool.acquire(1, 3))
+
+    def test_take_expired(self):
+        pool = self.make_pool()
+        pool.add(["old", "new", "orphan", "used"], 1)
+        pool.release(["old"], now=10.0)
+        pool.release(["new"], now=95.0)
+        pool.add(["orphan"], 2)
+        self.assertEqual(
+            ["old", "orphan"],
+            sorted(pool.take_expired(60, now=100.0, alive=lambda pid: pid == 1)),
+        )
+        self.assertEqual(["new", "used"], [row[0] for row in pool.list()])
+        self.assertEqual(["new"], pool.take_expired(None, now=100.0))
+
+    def test_memory_pool_survives_close(self):
+        pool = instances.InstancePool(":memory:")
+        pool.add(["foo"], 1)
+        pool.close()
+        self.assertEqual(["foo"], [row[0] for row in pool.list()])
+
+    def test_pid_alive(self):
+        self.assertTrue(instances.pid_alive(os.getpid()))
@@ -0,0 +1,110 @@
+#
+# Copyright (c) 2026 Testrepository Contributors
+#
+# Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+# license at the users choice. A copy of both licenses are available in the
+# project source as Apache-2.0 and BSD. You may not use this file except in
+# compliance with one of these two licences.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# license you chose for the specific language governing permissions and
+# limitations under that license.
+
+"""Tests for the test duration store."""
+
+import dbm
+import os.path
+import threading
+
+from fixtures import TempDir
+
+from testrepository.repository import timing
+from testrepository.tests import ResourcedTestCase
+
+
+class TestTimingStore(ResourcedTestCase):
+    def make_store(self, legacy_path=None):
+        tempdir = self.useFixture(TempDir()).path
+        return timing.TimingStore(os.path.join(tempdir, "times.db"), legacy_path)
+
+    def test_unknown_tests_not_returned(self):
+        store = self.make_store()
+        self.assertEqual({}, store.get_estimates(["foo"]))
+        self.assertEqual({}, store.get_stats(["foo"]))
+
+    def test_first_duration_is_the_estimate(self):
+        store = self.make_store()
+        store.record({"foo": 0.1, "bar": 2.0})
+        self.assertEqual({"foo": 0.1, "bar": 2.0}, store.get_estimates(["foo", "bar"]))
+
+    def test_all_estimates(self):
+        store = self.make_store()
+        self.assertEqual({}, store.get_all_estimates())
+        store.record({"foo": 0.1, "bar": 2.0})
+        self.assertEqual({"foo": 0.1, "bar": 2.0}, store.get_all_estimates())
+
+    def test_estimate_is_moving_average(self):
+        store = self.make_store()
+        store.record({"foo": 1.0})
+        store.record({"foo": 11.0})
+        expected = timing.EWMA_WEIGHT * 11.0 + (1 - timing.EWMA_WEIGHT) * 1.0
+        self.assertAlmostEqual(expected, store.get_estimates(["foo"])["foo"])
+
+    def test_stats(self):
+        store = self.make_store()
+        for duration in range(1, 21):
+            store.record({"foo": float(duration)})
+        stats = store.get_stats(["foo"])["foo"]
+        self.assertEqual(20, stats["runs"])
+        self.assertEqual(20.0, stats["last"])
+        self.assertEqual(20.0, stats["p95"])
+        # Only the last HISTORY_LENGTH durations are kept.
+        for _ in range(timing.HISTORY_LENGTH):
+            store.record({"foo": 1.0})
+        stats = store.get_stats(["foo"])["foo"]
+        self.assertEqual(1.0, stats["p95"])
+        self.assertEqual(20 + timing.HISTORY_LENGTH, stats["runs"])
+
+    def test_concurrent_records_are_not_lost(self):
+        store = self.make_store()
+        store.record({"foo": 1.0})
+        get_rows = store._get_rows
+        other = []
+
+        def interleaved_get_rows(db, test_ids):
+            rows = get_rows(db, test_ids)
+            if not other:
+                # Another load records while this one holds its rows.
+                other.append(
+                    threading.Thread(target=store.record, args=({"foo": 1.0},))
+                )
+                other[0].start()
+                other[0].join(0.2)
+            return rows
+
+        store._get_rows = interleaved_get_rows
+        store.record({"foo": 1.0})
+        other[0].join()
+        self.assertEqual(3, store.get_stats(["foo"])["foo"]["runs"])
+
+    def test_many_ids(self):
+        store = self.make_store()
+        durations = dict(("test-%d" % i, float(i)) for i in range(2000))
+        store.record(durations)
+        self.assertEqual(durations, store.get_estimates(durations))
+
+    def test_imports_legacy_dbm(self):
+        tempdir = self.useFixture(TempDir()).path
+        legacy_path = os.path.join(tempdir, "times.dbm")
+        legacy = dbm.open(legacy_path, "c")
+        legacy["foo"] = "1.5"
+        legacy.close()
+        store = self.make_store(legacy_path)
+        self.assertEqual({"foo": 1.5}, store.get_estimates(["foo", "bar"]))
+
+    def test_missing_legacy_dbm(self):
+        tempdir = self.useFixture(TempDir()).path
+        store = self.make_store(os.path.join(tempdir, "times.dbm"))
+        self.assertEqual({}, store.get_estimates(["foo"]))
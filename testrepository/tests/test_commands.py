@@ -121,6 +121,10 @@ class TestIterCommands(ResourcedTestCase):
         cmds = [cmd for cmd in cmds if cmd in ("one", "two")]
         self.assertEqual(["one", "two"], cmds)
 
+    def test_resident_commands(self):
+        resident = set(cmd.name for cmd in commands.iter_commands() if cmd.resident)
+        self.assertEqual(commands.RESIDENT_COMMANDS, resident)
+
 
 class TestRunArgv(ResourcedTestCase):
     def stub__find_command(self, cmd_run):
@@ -175,6 +179,19 @@ class TestRunArgv(ResourcedTestCase):
         self.stub__find_command(lambda x: 1)
         self.assertEqual(1, commands.run_argv(["testr", "foo"], "in", "out", "err"))
 
+    def test_resident_command_served_without_import(self):
+        self.stub__find_command(lambda x: 1)
+        calls = []
+
+        def call(args, stdout, stderr):
+            calls.append(args)
+            return 0
+
+        self.addCleanup(monkeypatch("testrepository.daemon.call", call))
+        self.assertEqual(0, commands.run_argv(["testr", "last"], "in", "out", "err"))
+        self.assertEqual([["last"]], calls)
+        self.assertEqual([], self.calls)
+
 
 class TestGetCommandParser(ResourcedTestCase):
     def test_trivial(self):
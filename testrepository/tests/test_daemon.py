@@ -0,0 +1,76 @@
+#
+# Copyright (c) 2026 Testrepository Contributors
+#
+# Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+# license at the users choice. A copy of both licenses are available in the
+# project source as Apache-2.0 and BSD. You may not use this file except in
+# compliance with one of these two licences.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# license you chose for the specific language governing permissions and
+# limitations under that license.
+
+"""Tests for the testr serve client."""
+
+from io import BytesIO, TextIOWrapper
+import os
+import socket
+import threading
+
+from fixtures import TempDir
+
+from testrepository import daemon
+from testrepository.tests import ResourcedTestCase
+
+
+class TestDaemon(ResourcedTestCase):
+    def test_get_here(self):
+        self.assertEqual(os.getcwd(), daemon.get_here(["stats"]))
+        self.assertEqual("foo", daemon.get_here(["-d", "foo", "stats"]))
+        self.assertEqual("foo", daemon.get_here(["stats", "-dfoo"]))
+        self.assertEqual("foo", daemon.get_here(["--here=foo", "stats"]))
+        self.assertEqual(os.getcwd(), daemon.get_here(["stats", "--", "-dfoo"]))
+
+    def test_call_without_server(self):
+        here = self.useFixture(TempDir()).path
+        self.assertEqual(None, daemon.call(["-d", here, "stats"], None, None))
+
+    def test_call_with_stale_socket(self):
+        here = self.useFixture(TempDir()).path
+        os.mkdir(os.path.join(here, ".testrepository"))
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(daemon.socket_path(here))
+        # Bound but not listening, as if its server had died.
+        sock.close()
+        self.assertEqual(None, daemon.call(["-d", here, "stats"], None, None))
+
+    def test_call_writes_frames_to_streams(self):
+        here = self.useFixture(TempDir()).path
+        os.mkdir(os.path.join(here, ".testrepository"))
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.addCleanup(listener.close)
+        listener.bind(daemon.socket_path(here))
+        listener.listen(1)
+        requests = []
+
+        def reply():
+            conn, _ = listener.accept()
+            with conn:
+                requests.append(conn.makefile("rb").readline())
+                daemon.write_frame(conn, daemon.STDOUT, b"out\n")
+                daemon.write_frame(conn, daemon.STDERR, b"err\n")
+                daemon.write_frame(conn, daemon.EXIT, b"2")
+
+        thread = threading.Thread(target=reply)
+        thread.start()
+        stdout = TextIOWrapper(BytesIO(), "utf8")
+        stderr = TextIOWrapper(BytesIO(), "utf8")
+        self.assertEqual(2, daemon.call(["stats", "-d", here], stdout, stderr))
+        thread.join()
+        self.assertEqual(b"out\n", stdout.buffer.getvalue())
+        self.assertEqual(b"err\n", stderr.buffer.getvalue())
+        self.assertEqual(
+            b'{"args": ["stats", "-d", "%s"]}\n' % here.encode("utf8"), requests[0]
+        )
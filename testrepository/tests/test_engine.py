@@ -0,0 +1,84 @@
+#
+# Copyright (c) 2026 Testrepository Contributors
+#
+# Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+# license at the users choice. A copy of both licenses are available in the
+# project source as Apache-2.0 and BSD. You may not use this file except in
+# compliance with one of these two licences.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# license you chose for the specific language governing permissions and
+# limitations under that license.
+
+"""Tests for the engine module."""
+
+import asyncio
+import threading
+
+from testrepository.engine import gather
+from testrepository.tests import ResourcedTestCase
+
+
+class TestGather(ResourcedTestCase):
+    def make_calls(self, count):
+        # Each call only returns once all of them are running.
+        barrier = threading.Barrier(count, timeout=10)
+
+        def make_call(value):
+            def call():
+                barrier.wait()
+                return value
+
+            return call
+
+        return [make_call(value) for value in range(count)]
+
+    def test_calls_are_concurrent(self):
+        self.assertEqual([0, 1, 2], gather(self.make_calls(3)))
+
+    def test_no_calls(self):
+        self.assertEqual([], gather([]))
+
+    def test_single_call_in_this_thread(self):
+        self.assertEqual(
+            [threading.current_thread()], gather([threading.current_thread])
+        )
+
+    def test_within_running_event_loop(self):
+        async def main():
+            return gather(self.make_calls(2))
+
+        self.assertEqual([0, 1], asyncio.run(main()))
+
+    def test_earliest_exception_raised_after_all_calls(self):
+        called = []
+
+        def fail(error):
+            def call():
+                called.append(error)
+                raise error
+
+            return call
+
+        first = ValueError("first")
+        calls = [fail(first), fail(KeyError("second")), lambda: called.append(3)]
+        error = self.assertRaises(ValueError, gather, calls)
+        self.assertIs(first, error)
+        self.assertEqual(3, len(called))
+
+    def test_successful_calls_cleaned_up_on_error(self):
+        cleaned = []
+
+        def fail():
+            raise ValueError("failed")
+
+        calls = [lambda: 1, fail, lambda: 3]
+        self.assertRaises(ValueError, gather, calls, cleanup=cleaned.append)
+        self.assertEqual([1, 3], cleaned)
+
+    def test_no_cleanup_without_error(self):
+        cleaned = []
+        self.assertEqual([0, 1], gather(self.make_calls(2), cleanup=cleaned.append))
+        self.assertEqual([], cleaned)
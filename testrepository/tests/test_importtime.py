@@ -0,0 +1,113 @@
+#
+# Copyright (c) 2026 Testrepository Contributors
+#
+# Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+# license at the users choice. A copy of both licenses are available in the
+# project source as Apache-2.0 and BSD. You may not use this file except in
+# compliance with one of these two licences.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# license you chose for the specific language governing permissions and
+# limitations under that license.
+
+"""Guard the time testr takes to start."""
+
+import os
+import subprocess
+import sys
+
+from fixtures import TempDir
+from testtools.content import text_content
+
+from testrepository.repository import file
+from testrepository.tests import ResourcedTestCase
+
+# Runs a command as testr would, then writes which of the test result
+# dependencies it imported to stdout.
+SCRIPT = r"""import sys
+from testrepository.commands import run_argv
+run_argv(["testr"] + sys.argv[1:], sys.stdin, sys.stderr, sys.stderr)
+heavy = ("fixtures", "subunit", "testtools")
+sys.stdout.write(" ".join(name for name in heavy if name in sys.modules))
+"""
+
+# The most time, in microseconds, that importing testrepository may take
+# for testr stats: about twice what it takes on a laptop. Only checked when
+# TESTR_BENCHMARK is set.
+STATS_BUDGET = 100000
+
+
+def import_times(output):
+    """Parse python -X importtime output.
+
+    :return: A dict mapping top level modules to their cumulative import time
+        in microseconds.
+    """
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if name.startswith("  "):
+            # Imported by another module, and counted in its time.
+            continue
+        times[name.strip()] = times.get(name.strip(), 0) + int(cumulative)
+    return times
+
+
+class TestImportTime(ResourcedTestCase):
+    def run_testr(self, args):
+        here = self.useFixture(TempDir()).path
+        repo = file.RepositoryFactory().initialise(here)
+        # So that stats has a run to summarise.
+        inserter = repo.get_inserter()
+        inserter.startTestRun()
+        inserter.status(test_id="foo", test_status="success")
+        inserter.stopTestRun()
+        root = os.path.join(os.path.dirname(__file__), "..", "..")
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.path.abspath(root)
+        proc = subprocess.Popen(
+            [sys.executable, "-X", "importtime", "-c", SCRIPT] + args,
+            cwd=here,
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        out, err = proc.communicate()
+        self.assertEqual(0, proc.returncode, err)
+        return out, import_times(err)
+
+    def test_import_times(self):
+        output = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       100 |        100 | os\n"
+            "import time:        50 |         50 |   iso8601\n"
+            "import time:       200 |        250 | testrepository\n"
+        )
+        self.assertEqual({"os": 100, "testrepository": 250}, import_times(output))
+
+    def test_help_does_not_import_test_results(self):
+        heavy, _ = self.run_testr(["help"])
+        self.assertEqual("", heavy)
+
+    def test_stats_does_not_import_test_results(self):
+        heavy, _ = self.run_testr(["stats"])
+        self.assertEqual("", heavy)
+
+    def test_stats_within_budget(self):
+        # Import times depend too much on the machine and its load to fail
+        # the suite over: set TESTR_BENCHMARK to check them against the
+        # budget. By default the time taken is only reported.
+        _, times = self.run_testr(["stats"])
+        spent = sum(
+            cumulative
+            for name, cumulative in times.items()
+            if name.split(".")[0] == "testrepository"
+        )
+        self.addDetail("benchmark", text_content("imports took %dus" % spent))
+        if os.environ.get("TESTR_BENCHMARK"):
+            self.assertLess(spent, STATS_BUDGET)
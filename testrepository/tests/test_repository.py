@@ -395,6 +395,20 @@ class TestRepositoryContract(ResourcedTestCase):
             result._events,
         )
 
+    def test_get_summary(self):
+        repo = self.repo_impl.initialise(self.sample_url)
+        result = repo.get_inserter()
+        legacy_result = testtools.ExtendedToStreamDecorator(result)
+        legacy_result.startTestRun()
+        make_test("passing", True).run(legacy_result)
+        make_test("failing", False).run(legacy_result)
+        legacy_result.stopTestRun()
+        summary = repo.get_latest_run().get_summary()
+        self.assertEqual(2, summary.testsRun)
+        self.assertEqual(1, summary.get_num_failures())
+        self.assertEqual(0, summary.skips)
+        self.assertNotEqual(None, summary.get_time_taken())
+
     def test_get_failing_get_id(self):
         repo = self.repo_impl.initialise(self.sample_url)
         result = repo.get_inserter()
@@ -556,6 +570,17 @@ class TestRepositoryContract(ResourcedTestCase):
         legacy_result.stopTestRun()
         self.assertEqual({test_name: 0.1}, repo.get_test_times([test_name])["known"])
 
+    def test_get_all_test_times(self):
+        repo = self.repo_impl.initialise(self.sample_url)
+        self.assertEqual({}, repo.get_all_test_times())
+        result = repo.get_inserter()
+        legacy_result = testtools.ExtendedToStreamDecorator(result)
+        legacy_result.startTestRun()
+        run_timed("foo", 0.1, legacy_result)
+        run_timed("bar", 0.2, legacy_result)
+        legacy_result.stopTestRun()
+        self.assertEqual({"foo": 0.1, "bar": 0.2}, repo.get_all_test_times())
+
     def test_inserted_exists_no_impact_on_test_times(self):
         repo = self.repo_impl.initialise(self.sample_url)
         result = repo.get_inserter()
@@ -571,6 +596,30 @@ class TestRepositoryContract(ResourcedTestCase):
         result.stopTestRun()
         self.assertEqual({test_name: 0.1}, repo.get_test_times([test_name])["known"])
 
+    def test_get_test_listing_missing(self):
+        repo = self.repo_impl.initialise(self.sample_url)
+        self.assertEqual(None, repo.get_test_listing("key"))
+
+    def test_set_test_listing(self):
+        repo = self.repo_impl.initialise(self.sample_url)
+        repo.set_test_listing("key", ["foo", "bar"])
+        self.assertEqual(["foo", "bar"], repo.get_test_listing("key"))
+        self.assertEqual(None, repo.get_test_listing("other"))
+        # Only the latest listing is kept.
+        repo.set_test_listing("other", ["quux"])
+        self.assertEqual(None, repo.get_test_listing("key"))
+        self.assertEqual(["quux"], repo.get_test_listing("other"))
+
+    def test_instance_pool_persists(self):
+        repo = self.repo_impl.initialise(self.sample_url)
+        pool = repo.get_instance_pool()
+        pool.add(["foo"], 1)
+        pool.release(["foo"])
+        pool.close()
+        pool = repo.get_instance_pool()
+        self.assertEqual(["foo"], pool.acquire(2, 1))
+        pool.close()
+
     def test_get_test_ids(self):
         repo = self.repo_impl.initialise(self.sample_url)
         inserter = repo.get_inserter()
@@ -18,9 +18,10 @@ from datetime import (
 )
 import sys
 
+import iso8601
 from testtools import TestCase
 
-from testrepository.results import SummarizingResult
+from testrepository.results import ProgressResult, RunSummary, SummarizingResult
 
 
 class TestSummarizingResult(TestCase):
@@ -60,3 +61,72 @@ class TestSummarizingResult(TestCase):
             result.status(test_id="foo", test_status="success")
         result.stopTestRun()
         self.assertEqual(5, result.testsRun)
+
+    def test_get_run_summary(self):
+        result = SummarizingResult()
+        now = datetime.now(tz=iso8601.UTC)
+        result.startTestRun()
+        result.status(test_id="foo", test_status="success", timestamp=now)
+        result.status(
+            test_id="bar", test_status="fail", timestamp=now + timedelta(seconds=2)
+        )
+        result.status(test_id="baz", test_status="skip")
+        result.stopTestRun()
+        summary = result.get_run_summary()
+        self.assertEqual(3, summary.testsRun)
+        self.assertEqual(1, summary.get_num_failures())
+        self.assertEqual(1, summary.skips)
+        self.assertEqual(2.0, summary.get_time_taken())
+
+
+class TestRunSummary(TestCase):
+    def test_dict_round_trip(self):
+        now = datetime(2001, 1, 1, tzinfo=iso8601.UTC)
+        summary = RunSummary(5, 2, 1, now, now + timedelta(seconds=3))
+        self.assertEqual(summary, RunSummary.from_dict(summary.to_dict()))
+
+    def test_no_times(self):
+        summary = RunSummary(0, 0, 0, None, None)
+        self.assertIs(None, summary.get_time_taken())
+        self.assertEqual(summary, RunSummary.from_dict(summary.to_dict()))
+
+
+class TestProgressResult(TestCase):
+    def make_result(self, schedule=None, durations=None, interval=0):
+        reports = []
+        result = ProgressResult(reports.append, schedule, durations, interval)
+        result.startTestRun()
+        return result, reports
+
+    def test_estimates_from_the_slowest_group(self):
+        result, reports = self.make_result(
+            [(["a", "b"], 1), (["c", "d", "e"], 2)],
+            {"a": 2.0, "b": 3.0, "c": 4.0, "d": 2.0},
+        )
+        result.status(test_id="a", test_status="inprogress", route_code="0")
+        self.assertEqual([], reports)
+        result.status(test_id="a", test_status="success", route_code="0")
+        values = dict(reports[-1])
+        self.assertEqual("1/5", values["tests"])
+        # e takes the mean duration: (4 + 2 + 2.75) / 2 workers.
+        self.assertEqual("4s", values["eta"])
+        result.status(test_id="c", test_status="fail", route_code="1/0")
+        values = dict(reports[-1])
+        self.assertEqual("2/5", values["tests"])
+        self.assertEqual("1 1", values["workers"])
+        self.assertEqual("3s", values["eta"])
+
+    def test_unknown_tests(self):
+        result, reports = self.make_result()
+        result.status(test_id="a", test_status="success")
+        values = dict(reports[-1])
+        self.assertEqual("1", values["tests"])
+        self.assertNotIn("eta", values)
+        result.stopTestRun()
+        self.assertEqual(None, reports[-1])
+
+    def test_reports_at_most_once_per_interval(self):
+        result, reports = self.make_result(interval=3600)
+        for test_id in range(100):
+            result.status(test_id=str(test_id), test_status="success")
+        self.assertEqual([], reports)
@@ -15,32 +15,83 @@
 """Tests for the testcommand module."""
 
 from io import BytesIO
-import os.path
+import os
 import optparse
+import random
 import re
+import subprocess
+import sys
+import threading
+import time
 
+from fixtures import EnvironmentVariable, MonkeyPatch
 import subunit
+from testtools.content import text_content
+from testtools.testresult.doubles import StreamResult
 from testtools.matchers import (
     Equals,
     MatchesAny,
     raises,
 )
 
-from testrepository.commands import run
+from testrepository import testcommand
+from testrepository.commands import load, run
 from testrepository.ui.model import UI
 from testrepository.repository import memory
-from testrepository.testcommand import TestCommand
+from testrepository.testcommand import (
+    DurationEstimator,
+    TestCommand,
+    expand_shell_variables,
+)
 from testrepository.tests import ResourcedTestCase
 from testrepository.tests.stubpackage import TempDirResource
 from testrepository.tests.test_repository import run_timed
 
 
+class StubTimesRepository(object):
+    """A repository that knows only test times, for scheduling tests."""
+
+    def __init__(self, times):
+        self.times = times
+
+    def get_test_times(self, test_ids):
+        known = dict(
+            (test_id, self.times[test_id])
+            for test_id in test_ids
+            if test_id in self.times
+        )
+        return dict(known=known, unknown=set(test_ids) - set(known))
+
+    def get_all_test_times(self):
+        return dict(self.times)
+
+
 class FakeTestCommand(TestCommand):
     def __init__(self, ui, repo):
         TestCommand.__init__(self, ui, repo)
         self.oldschool = True
 
 
+class TestTerminateProcess(ResourcedTestCase):
+    def test_terminates_the_commands_the_shell_runs(self):
+        if os.name != "posix":
+            self.skipTest("Process groups are POSIX only.")
+        # The shell waits for sleep, which holds stdout open.
+        proc = subprocess.Popen(
+            "sleep 60; echo done",
+            shell=True,
+            stdout=subprocess.PIPE,
+            start_new_session=True,
+        )
+        self.addCleanup(proc.stdout.close)
+        self.assertEqual(True, testcommand.terminate_process(proc))
+        started = time.monotonic()
+        self.assertEqual(b"", proc.stdout.read())
+        self.assertLess(time.monotonic() - started, 30)
+        proc.wait()
+        self.assertEqual(False, testcommand.terminate_process(proc))
+
+
 class TestTestCommand(ResourcedTestCase):
     resources = [("tempdir", TempDirResource())]
 
@@ -113,6 +164,108 @@ class TestTestCommand(ResourcedTestCase):
             ui.outputs,
         )
 
+    def set_pool_config(self):
+        self.set_config(
+            "[DEFAULT]\ntest_command=foo\n"
+            "instance_provision=provision -c $INSTANCE_COUNT\n"
+            "instance_dispose=bar $INSTANCE_IDS\n"
+            "instance_check=check $INSTANCE_ID\n"
+            "instance_pool_idle_timeout=60\n"
+        )
+
+    def test_obtain_instance_reuses_healthy_pooled_instances(self):
+        repo = memory.RepositoryFactory().initialise("memory:")
+        pool = repo.get_instance_pool()
+        pool.add(["warm", "sick"], 1)
+        pool.release(["sick"], now=time.time() - 1)
+        pool.release(["warm"])
+        ui, command = self.get_test_ui_and_cmd(repository=repo)
+        self.set_pool_config()
+        ui.proc_outputs = [b"", b"", b"", b"new\n"]
+        ui.proc_results = [0, 1, 0, 0]
+        command.obtain_instance(2)
+        self.assertEqual(set([b"warm", b"new"]), command._instances)
+        self.assertEqual(
+            [
+                ("values", [("running", "check warm")]),
+                ("popen", ("check warm",), {"shell": True}),
+                ("communicate",),
+                ("values", [("running", "check sick")]),
+                ("popen", ("check sick",), {"shell": True}),
+                ("communicate",),
+                ("values", [("running", "bar sick")]),
+                ("popen", ("bar sick",), {"shell": True}),
+                ("communicate",),
+                ("values", [("running", "provision -c 1")]),
+                ("popen", ("provision -c 1",), {"shell": True, "stdout": -1}),
+                ("communicate",),
+            ],
+            ui.outputs,
+        )
+        self.assertEqual(
+            [("new", os.getpid()), ("warm", os.getpid())],
+            [row[:2] for row in pool.list()],
+        )
+        # Cleaning up returns the instances to the pool, rather than
+        # disposing of them.
+        del ui.outputs[:]
+        command.cleanUp()
+        command.setUp()
+        self.assertEqual([], ui.outputs)
+        self.assertEqual(
+            [("new", None), ("warm", None)], [row[:2] for row in pool.list()]
+        )
+
+    def test_pooled_instances_checked_concurrently(self):
+        repo = memory.RepositoryFactory().initialise("memory:")
+        pool = repo.get_instance_pool()
+        pool.add(["warm", "sick"], 1)
+        pool.release(["warm", "sick"])
+        ui, command = self.get_test_ui_and_cmd(repository=repo)
+        self.set_pool_config()
+        ui.concurrent_popen = True
+        # Each check only finishes once both are running.
+        barrier = threading.Barrier(2, timeout=10)
+        popen = ui.subprocess_Popen
+
+        def subprocess_Popen(cmd, **kwargs):
+            process = popen(cmd, **kwargs)
+            if cmd.startswith("check"):
+                barrier.wait()
+                process.returncode = int(cmd == "check sick")
+            if cmd.startswith("provision"):
+                process.stdout = BytesIO(b"new\n")
+            return process
+
+        ui.subprocess_Popen = subprocess_Popen
+        command.obtain_instance(2)
+        self.assertEqual(set([b"warm", b"new"]), command._instances)
+        commands = set(output[1][0] for output in ui.outputs if output[0] == "popen")
+        self.assertEqual(
+            set(["check warm", "check sick", "bar sick", "provision -c 1"]), commands
+        )
+
+    def test_cleanUp_disposes_of_expired_pooled_instances(self):
+        repo = memory.RepositoryFactory().initialise("memory:")
+        pool = repo.get_instance_pool()
+        pool.add(["stale"], 1)
+        pool.release(["stale"], now=time.time() - 61)
+        pool.add(["baz"], os.getpid())
+        ui, command = self.get_test_ui_and_cmd(repository=repo)
+        self.set_pool_config()
+        command._instances.update([b"baz"])
+        command.cleanUp()
+        command.setUp()
+        self.assertEqual(
+            [
+                ("values", [("running", "bar stale")]),
+                ("popen", ("bar stale",), {"shell": True}),
+                ("communicate",),
+            ],
+            ui.outputs,
+        )
+        self.assertEqual(["baz"], [row[0] for row in pool.list()])
+
     def test_TestCommand_cleanUp_disposes_instances_fail_raises(self):
         ui, command = self.get_test_ui_and_cmd()
         ui.proc_results = [1]
@@ -302,6 +455,47 @@ class TestTestCommand(ResourcedTestCase):
             ),
         )
 
+    def test_provisions_in_background_from_setup(self):
+        self.dirty()
+        ui = UI(options=[("concurrency", 2), ("parallel", True)])
+        ui.here = self.tempdir
+        ui.set_command(run.run(ui))
+        ui.concurrent_popen = True
+        ui.proc_outputs = [b"returned\ninstances\n"]
+        self.set_config(
+            "[DEFAULT]\ntest_command=foo $IDLIST\n"
+            "instance_provision=provision -c $INSTANCE_COUNT\n"
+        )
+        command = self.useFixture(TestCommand(ui, None))
+        instance = command.obtain_instance(2)
+        self.assertEqual(set([b"returned", b"instances"]), command._instances)
+        self.assertEqual(set([instance]), command._allocated_instances)
+        self.assertEqual(
+            [
+                ("values", [("running", "provision -c 2")]),
+                ("popen", ("provision -c 2",), {"shell": True, "stdout": -1}),
+                ("communicate",),
+            ],
+            ui.outputs,
+        )
+
+    def test_background_provisioning_errors_raised_by_obtain_instance(self):
+        self.dirty()
+        ui = UI(options=[("concurrency", 2), ("parallel", True)])
+        ui.here = self.tempdir
+        ui.set_command(run.run(ui))
+        ui.concurrent_popen = True
+        ui.proc_results = [1]
+        self.set_config(
+            "[DEFAULT]\ntest_command=foo $IDLIST\n"
+            "instance_provision=provision -c $INSTANCE_COUNT\n"
+        )
+        command = self.useFixture(TestCommand(ui, None))
+        self.assertThat(
+            lambda: command.obtain_instance(2),
+            raises(ValueError("Provisioning instances failed, return 1")),
+        )
+
     def test_list_tests_uses_instances(self):
         ui, command = self.get_test_ui_and_cmd()
         self.set_config(
@@ -352,6 +546,74 @@ class TestTestCommand(ResourcedTestCase):
         fixture = self.useFixture(command.get_run_command())
         self.assertEqual(set(["returned", "ids"]), set(fixture.list_tests()))
 
+    def test_list_tests_cached(self):
+        buffer = BytesIO()
+        stream = subunit.StreamResultToBytes(buffer)
+        stream.status(test_id="returned", test_status="exists")
+        stream.status(test_id="ids", test_status="exists")
+        subunit_bytes = buffer.getvalue()
+        repo = memory.RepositoryFactory().initialise("memory:")
+        ui, command = self.get_test_ui_and_cmd(repository=repo)
+        ui.proc_outputs = [subunit_bytes, subunit_bytes]
+        self.set_config(
+            "[DEFAULT]\ntest_command=foo $LISTOPT $IDLIST\n"
+            "test_list_option=--list\ntest_list_cache_files=*.py\n"
+        )
+        source_path = os.path.join(self.tempdir, "source.py")
+        with open(source_path, "wt") as source:
+            source.write("1")
+        fixture = self.useFixture(command.get_run_command())
+        self.assertEqual(["returned", "ids"], fixture.list_tests())
+        self.assertEqual(["returned", "ids"], fixture.list_tests())
+        popens = [output for output in ui.outputs if output[0] == "popen"]
+        self.assertEqual(1, len(popens))
+        # Changing a source file invalidates the listing.
+        with open(source_path, "wt") as source:
+            source.write("12")
+        self.assertEqual(["returned", "ids"], fixture.list_tests())
+        popens = [output for output in ui.outputs if output[0] == "popen"]
+        self.assertEqual(2, len(popens))
+
+    def test_listing_cache_key_expands_variables(self):
+        repo = memory.RepositoryFactory().initialise("memory:")
+        ui, command = self.get_test_ui_and_cmd(repository=repo)
+        self.set_config(
+            "[DEFAULT]\ntest_command=${PYTHON:-python} -m foo $LISTOPT $IDLIST\n"
+            "test_list_option=--list\ntest_list_cache_files=*.py\n"
+        )
+        self.useFixture(EnvironmentVariable("PYTHON"))
+        fixture = self.useFixture(command.get_run_command())
+        key = fixture._listing_cache_key()
+        self.useFixture(EnvironmentVariable("PYTHON", "python"))
+        self.assertEqual(key, fixture._listing_cache_key())
+        self.useFixture(EnvironmentVariable("PYTHON", "python3.99"))
+        self.assertNotEqual(key, fixture._listing_cache_key())
+
+    def test_expand_shell_variables(self):
+        environ = {"A": "a", "EMPTY": ""}
+        self.assertEqual(
+            "a a x a x  y",
+            expand_shell_variables(
+                "$A ${A} ${B:-x} ${B:-$A} ${EMPTY:-x} ${EMPTY-x} ${B-y}", environ
+            ),
+        )
+
+    def test_list_tests_relist_ignores_cache(self):
+        repo = memory.RepositoryFactory().initialise("memory:")
+        self.dirty()
+        ui = UI(options=[("relist", True)])
+        ui.here = self.tempdir
+        ui.set_command(run.run(ui))
+        command = self.useFixture(TestCommand(ui, repo))
+        self.set_config(
+            "[DEFAULT]\ntest_command=foo $LISTOPT $IDLIST\n"
+            "test_list_option=--list\ntest_list_cache_files=*.py\n"
+        )
+        fixture = self.useFixture(command.get_run_command())
+        repo.set_test_listing(fixture._listing_cache_key(), ["stale"])
+        self.assertEqual([], fixture.list_tests())
+        self.assertEqual([], repo.get_test_listing(fixture._listing_cache_key()))
+
     def test_list_tests_nonzero_exit(self):
         ui, command = self.get_test_ui_and_cmd()
         ui.proc_results = [1]
@@ -377,17 +639,14 @@ class TestTestCommand(ResourcedTestCase):
         )
         fixture = self.useFixture(command.get_run_command())
         # partitioning by two generates 'slow' and the two fast ones as partitions
-        # flushed out by equal numbers of unknown duration tests.
+        # flushed out with the unknown duration tests, which are estimated to
+        # take as long as the median test.
         test_ids = frozenset(
             ["slow", "fast1", "fast2", "unknown1", "unknown2", "unknown3", "unknown4"]
         )
         partitions = fixture.partition_tests(test_ids, 2)
         self.assertTrue("slow" in partitions[0])
-        self.assertFalse("fast1" in partitions[0])
-        self.assertFalse("fast2" in partitions[0])
         self.assertFalse("slow" in partitions[1])
-        self.assertTrue("fast1" in partitions[1])
-        self.assertTrue("fast2" in partitions[1])
         self.assertEqual(3, len(partitions[0]))
         self.assertEqual(4, len(partitions[1]))
 
@@ -448,19 +707,367 @@ class TestTestCommand(ResourcedTestCase):
         # There isn't a public way to define a group callback [as yet].
         fixture._group_callback = group_id
         partitions = fixture.partition_tests(test_ids, 2)
-        # Timed groups are deterministic:
-        self.assertTrue("TestCase2.fast1" in partitions[0])
-        self.assertTrue("TestCase2.fast2" in partitions[0])
-        self.assertTrue("TestCase1.slow" in partitions[1])
-        self.assertTrue("TestCase1.fast" in partitions[1])
-        self.assertTrue("TestCase1.fast2" in partitions[1])
-        # Untimed groups just need to be kept together:
-        if "TestCase3.test1" in partitions[0]:
-            self.assertTrue("TestCase3.test2" in partitions[0])
-        if "TestCase4.test" not in partitions[0]:
-            self.assertTrue("TestCase4.test" in partitions[1])
-        if "testdir.testfile.TestCase5.test" not in partitions[0]:
-            self.assertTrue("testdir.testfile.TestCase5.test" in partitions[1])
+        # The untimed tests in TestCase1 are estimated from TestCase1.slow,
+        # making it the longest group by far; the other untimed groups are
+        # estimated from the median and all fit alongside TestCase2.
+        self.assertEqual(
+            set(["TestCase1.slow", "TestCase1.fast", "TestCase1.fast2"]),
+            set(partitions[0]),
+        )
+        self.assertEqual(6, len(partitions[1]))
+
+    def test_partition_tests_estimates_new_tests(self):
+        repo = memory.RepositoryFactory().initialise("memory:")
+        result = repo.get_inserter()
+        result.startTestRun()
+        run_timed("pkg.slow.test_a", 30, result)
+        for i in range(4):
+            run_timed("pkg.fast.test_%d" % i, 1, result)
+        result.stopTestRun()
+        ui, command = self.get_test_ui_and_cmd(repository=repo)
+        self.set_config("[DEFAULT]\ntest_command=foo $IDLIST\n")
+        fixture = self.useFixture(command.get_run_command())
+        test_ids = ["pkg.slow.test_a", "pkg.slow.test_b", "pkg.slow.test_c"]
+        test_ids.extend("pkg.fast.test_%d" % i for i in range(4))
+        partitions = fixture.partition_tests(test_ids, 3)
+        # The new slow tests are expected to be as slow as their neighbour, so
+        # each gets a partition of its own rather than being dealt out
+        # round-robin.
+        for partition in partitions:
+            self.assertEqual(
+                1, len([test_id for test_id in partition if "slow" in test_id])
+            )
+
+    def test_partition_tests_estimates_from_all_timed_tests(self):
+        repo = memory.RepositoryFactory().initialise("memory:")
+        result = repo.get_inserter()
+        result.startTestRun()
+        run_timed("pkg.slow.test_a", 30, result)
+        for i in range(4):
+            run_timed("pkg.fast.test_%d" % i, 1, result)
+        result.stopTestRun()
+        ui, command = self.get_test_ui_and_cmd(repository=repo)
+        self.set_config("[DEFAULT]\ntest_command=foo $IDLIST\n")
+        fixture = self.useFixture(command.get_run_command())
+        # Only fast tests are known, but the new slow tests are still
+        # estimated from pkg.slow.test_a, which is not being run.
+        test_ids = ["pkg.slow.test_b", "pkg.slow.test_c", "pkg.fast.test_0"]
+        group_ids, timed, unknown = fixture._time_groups(test_ids)
+        self.assertEqual(
+            {"pkg.slow.test_b": 30, "pkg.slow.test_c": 30, "pkg.fast.test_0": 1},
+            timed,
+        )
+        self.assertEqual([], unknown)
+
+    def test_duration_estimator(self):
+        estimator = DurationEstimator(
+            {"a.b.C.test1": 4.0, "a.b.C.test2": 2.0, "a.d.test": 6.0, "e": 1.0}
+        )
+        # The mean of the tests sharing the longest prefix.
+        self.assertEqual(3.0, estimator.estimate("a.b.C.test3"))
+        self.assertEqual(3.0, estimator.estimate("a.b.D.test"))
+        self.assertEqual(4.0, estimator.estimate("a.x.test"))
+        self.assertEqual(6.0, estimator.estimate("a.d.other"))
+        # The median of all tests when nothing is shared.
+        self.assertEqual(3.0, estimator.estimate("f.test"))
+        self.assertEqual(3.0, estimator.estimate("f"))
+
+    def test_partition_tests_benchmark(self):
+        # Scheduling must stay a negligible part of starting a run, even for
+        # very large suites on many workers. Set TESTR_BENCHMARK to schedule a
+        # million tests; by default a tenth of that is used to keep the suite
+        # fast.
+        if os.environ.get("TESTR_BENCHMARK"):
+            count = 1000000
+        else:
+            count = 100000
+        rng = random.Random(0)
+        times = dict(("test%d" % i, rng.random()) for i in range(count))
+        ui, command = self.get_test_ui_and_cmd(repository=StubTimesRepository(times))
+        self.set_config(
+            "[DEFAULT]\ntest_command=foo $IDLIST $LISTOPT\ntest_list_option=--list\n"
+        )
+        fixture = self.useFixture(command.get_run_command())
+        start = time.time()
+        partitions = fixture.partition_tests(list(times), 64)
+        elapsed = time.time() - start
+        self.addDetail(
+            "benchmark", text_content("%d tests in %0.3fs" % (count, elapsed))
+        )
+        self.assertEqual(count, sum(map(len, partitions)))
+        # Longest-first greedy scheduling leaves partitions within one test
+        # duration of each other.
+        partition_times = [
+            sum(times[test_id] for test_id in partition) for partition in partitions
+        ]
+        self.assertTrue(max(partition_times) - min(partition_times) <= 1.0)
+
+    def test_batch_tests(self):
+        repo = memory.RepositoryFactory().initialise("memory:")
+        result = repo.get_inserter()
+        result.startTestRun()
+        run_timed("slow", 3, result)
+        run_timed("medium", 2, result)
+        run_timed("fast", 1, result)
+        result.stopTestRun()
+        ui, command = self.get_test_ui_and_cmd(repository=repo)
+        self.set_config(
+            "[DEFAULT]\ntest_command=foo $IDLIST $LISTOPT\ntest_list_option=--list\n"
+            "test_batch_size=2\n"
+        )
+        fixture = self.useFixture(command.get_run_command())
+        batches = fixture.batch_tests(["fast", "medium", "new", "slow"], 2)
+        # Longest first, with the new test estimated from the median.
+        self.assertEqual([["slow", "medium"], ["new", "fast"]], batches)
+
+    def test_batch_tests_default_size(self):
+        ui, command = self.get_test_ui_and_cmd(repository=StubTimesRepository({}))
+        self.set_config("[DEFAULT]\ntest_command=foo $IDLIST\n")
+        fixture = self.useFixture(command.get_run_command())
+        test_ids = ["a%d" % i for i in range(10)] + ["b%d" % i for i in range(10)]
+        fixture._group_callback = lambda test_id: test_id[0]
+        batches = fixture.batch_tests(test_ids, 2)
+        # 20 tests over two workers with four batches each: batches of three
+        # tests, except that groups are not split between batches.
+        self.assertEqual([test_ids[:10], test_ids[10:]], batches)
+        fixture._group_callback = None
+        batches = fixture.batch_tests(test_ids, 2)
+        self.assertEqual(7, len(batches))
+        self.assertEqual(test_ids, sum(batches, []))
+
+    def test_run_tests_dynamic(self):
+        self.dirty()
+        ui = UI(options=[("concurrency", 2), ("parallel", True), ("dynamic", True)])
+        ui.here = self.tempdir
+        ui.set_command(run.run(ui))
+        ui.proc_outputs = [b"a", b"b", b"c\n"]
+        ui.proc_results = [0, 3, 0]
+        command = self.useFixture(TestCommand(ui, StubTimesRepository({})))
+        self.set_config("[DEFAULT]\ntest_command=foo $IDLIST\ntest_batch_size=1\n")
+        fixture = self.useFixture(command.get_run_command(test_ids=["1", "2", "3"]))
+        workers = fixture.run_tests()
+        # One batch is started per worker up front.
+        self.assertEqual(2, len(workers))
+        self.assertEqual([(["1", "2", "3"], 2)], fixture.schedule)
+        self.assertEqual(
+            [
+                ("values", [("running", "foo 1")]),
+                (
+                    "popen",
+                    ("foo 1",),
+                    {
+                        "shell": True,
+                        "stdin": -1,
+                        "stdout": -1,
+                        "start_new_session": True,
+                    },
+                ),
+                ("values", [("running", "foo 2")]),
+                (
+                    "popen",
+                    ("foo 2",),
+                    {
+                        "shell": True,
+                        "stdin": -1,
+                        "stdout": -1,
+                        "start_new_session": True,
+                    },
+                ),
+            ],
+            ui.outputs,
+        )
+        # The first worker to finish its batch takes the remaining one.
+        self.assertEqual(b"b", workers[1].stdout.read(1))
+        self.assertEqual(None, workers[1].returncode)
+        self.assertEqual(b"\nc\n", workers[1].stdout.read())
+        self.assertEqual(
+            (
+                "popen",
+                ("foo 3",),
+                {"shell": True, "stdin": -1, "stdout": -1, "start_new_session": True},
+            ),
+            ui.outputs[-1],
+        )
+        self.assertEqual(3, workers[1].returncode)
+        self.assertEqual([b"a"], workers[0].stdout.readlines())
+        self.assertEqual(0, workers[0].wait())
+
+    def test_dynamic_worker_read1_does_not_wait_for_next_batch(self):
+        self.dirty()
+        ui = UI(options=[("concurrency", 1), ("parallel", True), ("dynamic", True)])
+        ui.here = self.tempdir
+        ui.set_command(run.run(ui))
+        ui.proc_outputs = [b"a\n", b"b"]
+        command = self.useFixture(TestCommand(ui, StubTimesRepository({})))
+        self.set_config("[DEFAULT]\ntest_command=foo $IDLIST\ntest_batch_size=1\n")
+        fixture = self.useFixture(command.get_run_command(test_ids=["1", "2"]))
+        [worker] = fixture.run_tests()
+        self.assertEqual(b"a\n", worker.read1(10))
+        # The first batch ends and the second starts.
+        self.assertEqual(None, worker.read1(10))
+        self.assertEqual(b"b", worker.read1(10))
+        self.assertEqual(b"", worker.read1(10))
+        self.assertRaises(ValueError, worker.fileno)
+
+    def test_progress_timeout_stops_the_test_runner(self):
+        if os.name != "posix":
+            self.skipTest("Process groups are POSIX only.")
+        ui, command = self.get_test_ui_and_cmd()
+        ui.subprocess_Popen = subprocess.Popen
+        # A runner which starts a test and hangs, run by a shell which waits
+        # for it rather than exec'ing it.
+        script = (
+            "import subunit, sys, time;"
+            "subunit.StreamResultToBytes(sys.stdout.buffer).status("
+            "test_id=sys.argv[1], test_status='inprogress');"
+            "sys.stdout.flush();"
+            "time.sleep(60)"
+        )
+        self.set_config(
+            '[DEFAULT]\ntest_command=%s -c "%s" $IDLIST; exit $?\n'
+            "test_progress_timeout=0.5\n" % (sys.executable, script)
+        )
+        fixture = self.useFixture(command.get_run_command(test_ids=["hung"]))
+        streams = [run.ReturnCodeToSubunit(proc) for proc in fixture.run_tests()]
+        result = StreamResult()
+        started = time.monotonic()
+        load.StreamMultiplexer(streams, progress_timeout=fixture.progress_timeout).run(
+            result
+        )
+        self.assertLess(time.monotonic() - started, 30)
+        self.assertEqual(
+            [("hung", "inprogress"), ("hung", "fail")],
+            [
+                (event.test_id, event.test_status)
+                for event in result._events
+                if event.name == "status" and event.test_status
+            ],
+        )
+
+    def test_worker_timeout_reschedules_unfinished_tests(self):
+        ui, command = self.get_test_ui_and_cmd()
+        ui.proc_outputs = [b"hung", b"rest"]
+        self.set_config(
+            "[DEFAULT]\ntest_command=foo $IDLIST\ntest_worker_timeout=2.5\n"
+        )
+        fixture = self.useFixture(command.get_run_command(test_ids=["a", "b", "c"]))
+        self.assertEqual(2.5, fixture.worker_timeout)
+        self.assertEqual(None, fixture.progress_timeout)
+        [worker] = fixture.run_tests()
+        self.assertEqual(b"hung", worker.read1(10))
+        worker.abort({"a"})
+        self.assertEqual(("terminate",), ui.outputs[-1])
+        # The tests not done are run in a new process.
+        self.assertEqual(b"\n", worker.read1(10))
+        self.assertEqual(
+            (
+                "popen",
+                ("foo b c",),
+                {"shell": True, "stdin": -1, "stdout": -1, "start_new_session": True},
+            ),
+            ui.outputs[-1],
+        )
+        self.assertEqual(b"rest", worker.read1(10))
+
+    def test_run_tests_splits_long_idlist_commands(self):
+        self.useFixture(
+            MonkeyPatch("testrepository.testcommand.command_line_limit", lambda: 8)
+        )
+        ui, command = self.get_test_ui_and_cmd()
+        ui.proc_outputs = [b"first\n", b"second\n"]
+        ui.proc_results = [0, 1]
+        self.set_config("[DEFAULT]\ntest_command=foo $IDLIST\n")
+        fixture = self.useFixture(
+            command.get_run_command(test_ids=["a", "b", "c", "d"])
+        )
+        [worker] = fixture.run_tests()
+        self.assertEqual(
+            [
+                ("values", [("running", "foo a b")]),
+                (
+                    "popen",
+                    ("foo a b",),
+                    {
+                        "shell": True,
+                        "stdin": -1,
+                        "stdout": -1,
+                        "start_new_session": True,
+                    },
+                ),
+            ],
+            ui.outputs,
+        )
+        # The chunks run one after another as a single stream.
+        self.assertEqual(b"first\nsecond\n", worker.stdout.read())
+        self.assertEqual(
+            (
+                "popen",
+                ("foo c d",),
+                {"shell": True, "stdin": -1, "stdout": -1, "start_new_session": True},
+            ),
+            ui.outputs[-1],
+        )
+        self.assertEqual(1, worker.returncode)
+
+    def test_command_line_limit(self):
+        limit = testcommand.command_line_limit()
+        self.assertTrue(1024 < limit <= 131072, limit)
+
+    def test_run_tests_starts_partitions_concurrently(self):
+        self.dirty()
+        ui = UI(options=[("concurrency", 2), ("parallel", True)])
+        ui.here = self.tempdir
+        ui.set_command(run.run(ui))
+        ui.concurrent_popen = True
+        command = self.useFixture(TestCommand(ui, StubTimesRepository({})))
+        self.set_config("[DEFAULT]\ntest_command=foo $IDLIST\n")
+        fixture = self.useFixture(command.get_run_command(test_ids=["1", "2"]))
+        self.assertEqual(2, len(fixture.run_tests()))
+        self.assertEqual([(["1"], 1), (["2"], 1)], fixture.schedule)
+        # The commands are reported in partition order, before any process
+        # is started.
+        self.assertEqual(
+            [
+                ("values", [("running", "foo 1")]),
+                ("values", [("running", "foo 2")]),
+            ],
+            ui.outputs[:2],
+        )
+        self.assertEqual(
+            set(["foo 1", "foo 2"]), set(output[1][0] for output in ui.outputs[2:])
+        )
+
+    def check_run_tests_stops_started_processes_on_error(self, concurrent):
+        self.dirty()
+        ui = UI(options=[("concurrency", 2), ("parallel", True)])
+        ui.here = self.tempdir
+        ui.set_command(run.run(ui))
+        ui.concurrent_popen = concurrent
+        popen = ui.subprocess_Popen
+
+        def subprocess_Popen(cmd, **kwargs):
+            if cmd == "foo 2":
+                raise OSError("cannot start")
+            return popen(cmd, **kwargs)
+
+        ui.subprocess_Popen = subprocess_Popen
+        command = self.useFixture(TestCommand(ui, StubTimesRepository({})))
+        self.set_config(
+            "[DEFAULT]\ntest_command=foo $IDLIST\ninstance_execute=$COMMAND\n"
+        )
+        command._instances.update([b"a", b"b"])
+        fixture = self.useFixture(command.get_run_command(test_ids=["1", "2"]))
+        self.assertThat(fixture.run_tests, raises(OSError("cannot start")))
+        # The process which started was stopped and waited for, and both
+        # instances were released.
+        self.assertEqual(1, ui.outputs.count(("terminate",)))
+        self.assertEqual(set(), command._allocated_instances)
+
+    def test_run_tests_stops_started_processes_on_error(self):
+        self.check_run_tests_stops_started_processes_on_error(False)
+
+    def test_run_tests_concurrent_stops_started_processes_on_error(self):
+        self.check_run_tests_stops_started_processes_on_error(True)
 
     def test_run_tests_with_instances(self):
         # when there are instances and no instance_execute, run_tests acts as
@@ -473,7 +1080,16 @@ class TestTestCommand(ResourcedTestCase):
         self.assertEqual(
             [
                 ("values", [("running", "foo ")]),
-                ("popen", ("foo ",), {"shell": True, "stdin": -1, "stdout": -1}),
+                (
+                    "popen",
+                    ("foo ",),
+                    {
+                        "shell": True,
+                        "stdin": -1,
+                        "stdout": -1,
+                        "start_new_session": True,
+                    },
+                ),
             ],
             ui.outputs,
         )
@@ -495,7 +1111,12 @@ class TestTestCommand(ResourcedTestCase):
                 (
                     "popen",
                     ("quux bar -- foo 1",),
-                    {"shell": True, "stdin": -1, "stdout": -1},
+                    {
+                        "shell": True,
+                        "stdin": -1,
+                        "stdout": -1,
+                        "start_new_session": True,
+                    },
                 ),
             ],
             ui.outputs,
@@ -526,7 +1147,12 @@ class TestTestCommand(ResourcedTestCase):
                 (
                     "popen",
                     ("quux bar -- foo 1",),
-                    {"shell": True, "stdin": -1, "stdout": -1},
+                    {
+                        "shell": True,
+                        "stdin": -1,
+                        "stdout": -1,
+                        "start_new_session": True,
+                    },
                 ),
             ],
             ui.outputs,
@@ -555,7 +1181,16 @@ class TestTestCommand(ResourcedTestCase):
         self.assertEqual(
             [
                 ("values", [("running", expected_cmd)]),
-                ("popen", (expected_cmd,), {"shell": True, "stdin": -1, "stdout": -1}),
+                (
+                    "popen",
+                    (expected_cmd,),
+                    {
+                        "shell": True,
+                        "stdin": -1,
+                        "stdout": -1,
+                        "start_new_session": True,
+                    },
+                ),
             ],
             ui.outputs,
         )
@@ -573,6 +1208,15 @@ class TestTestCommand(ResourcedTestCase):
         self.set_config("[DEFAULT]\nfilter_tags=foo bar\n")
         self.assertEqual(set(["foo", "bar"]), command.get_filter_tags())
 
+    def test_get_compression(self):
+        ui, command = self.get_test_ui_and_cmd()
+        self.set_config("[DEFAULT]\ntest_command=foo\n")
+        self.assertEqual("none", command.get_compression())
+        self.set_config("[DEFAULT]\nrepository_compression=zlib\n")
+        self.assertEqual("zlib", command.get_compression())
+        self.set_config("[DEFAULT]\nrepository_compression=lzma\n")
+        self.assertRaises(ValueError, command.get_compression)
+
     def test_callout_concurrency(self):
         ui, command = self.get_test_ui_and_cmd()
         ui.proc_outputs = [b"4"]
@@ -198,6 +198,34 @@ AssertionError: quux...
         ui.output_values([("foo", 1), ("bar", "quux")])
         self.assertEqual(b"foo=1, bar=quux\n", ui._stdout.buffer.getvalue())
 
+    def test_outputs_progress_on_one_line(self):
+        ui, cmd = get_test_ui_and_cmd()
+        ui.output_progress([("tests", "10/20"), ("eta", "5s")])
+        ui.output_progress([("tests", "20/20")])
+        ui.output_progress(None)
+        self.assertEqual(
+            b"\rtests=10/20, eta=5s\rtests=20/20        \r" + b" " * 19 + b"\r",
+            ui._stdout.buffer.getvalue(),
+        )
+
+    def test_output_clears_progress(self):
+        ui, cmd = get_test_ui_and_cmd()
+        ui.output_progress([("tests", "10/20")])
+        ui.output_values([("running", "foo")])
+        ui.output_progress([("tests", "20/20")])
+        self.assertEqual(
+            b"\rtests=10/20\r" + b" " * 11 + b"\rrunning=foo\n\rtests=20/20",
+            ui._stdout.buffer.getvalue(),
+        )
+
+    def test_progress_shown_only_on_terminals(self):
+        ui, cmd = get_test_ui_and_cmd()
+        self.assertFalse(ui.show_progress)
+        ui._stdout.isatty = lambda: True
+        self.assertTrue(ui.show_progress)
+        ui.options.subunit = True
+        self.assertFalse(ui.show_progress)
+
     def test_outputs_summary_to_stdout(self):
         ui, cmd = get_test_ui_and_cmd()
         summary = [True, 1, None, 2, None, []]
@@ -22,10 +22,6 @@ See AbstractUI for details on what UI classes should do and are responsible
 for.
 """
 
-from testtools import StreamResult
-
-from testrepository.results import SummarizingResult
-
 
 class AbstractUI(object):
     """The base class for UI objects, this providers helpers and the interface.
@@ -53,8 +49,15 @@ class AbstractUI(object):
         command specific options.
     :ivar arguments: The parsed arguments for this ui. Set Command.args to
         define the accepted arguments for a command.
+    :ivar concurrent_popen: True if subprocess_Popen may be called from
+        several threads at once.
+    :ivar show_progress: True if the progress of test runs should be shown
+        with output_progress.
     """
 
+    concurrent_popen = False
+    show_progress = False
+
     def _check_cmd(self):
         """Check that cmd is valid. This method is meant to be overridden.
 
@@ -113,6 +116,17 @@ class AbstractUI(object):
         """
         raise NotImplementedError(self.output_error)
 
+    def output_progress(self, values):
+        """Show the progress of a test run, replacing any progress shown.
+
+        This is called repeatedly while tests run, when show_progress is
+        True.
+
+        :param values: An iterable of (label, value), or None to stop showing
+            progress.
+        """
+        raise NotImplementedError(self.output_progress)
+
     def output_rest(self, rest_string):
         """Show rest_string - a ReST document.
 
@@ -189,79 +203,11 @@ class AbstractUI(object):
         raise NotImplementedError(self.subprocess_Popen)
 
 
-class BaseUITestResult(StreamResult):
-    """An abstract test result used with the UI.
-
-    AbstractUI.make_result probably wants to return an object like this.
-    """
-
-    def __init__(self, ui, get_id, previous_run=None):
-        """Construct an `AbstractUITestResult`.
+def __getattr__(name):
+    # The test result classes need testtools, so they live in
+    # testrepository.ui.results and are only imported when asked for.
+    if name == "BaseUITestResult":
+        from testrepository.ui.results import BaseUITestResult
 
-        :param ui: The UI this result is associated with.
-        :param get_id: A nullary callable that returns the id of the test run.
-        """
-        super(BaseUITestResult, self).__init__()
-        self.ui = ui
-        self.get_id = get_id
-        self._previous_run = previous_run
-        self._summary = SummarizingResult()
-
-    def _get_previous_summary(self):
-        if self._previous_run is None:
-            return None
-        previous_summary = SummarizingResult()
-        previous_summary.startTestRun()
-        test = self._previous_run.get_test()
-        test.run(previous_summary)
-        previous_summary.stopTestRun()
-        return previous_summary
-
-    def _output_summary(self, run_id):
-        """Output a test run.
-
-        :param run_id: The run id.
-        """
-        if self.ui.options.quiet:
-            return
-        time = self._summary.get_time_taken()
-        time_delta = None
-        num_tests_run_delta = None
-        num_failures_delta = None
-        values = [("id", run_id, None)]
-        failures = self._summary.get_num_failures()
-        previous_summary = self._get_previous_summary()
-        if failures:
-            if previous_summary:
-                num_failures_delta = failures - previous_summary.get_num_failures()
-            values.append(("failures", failures, num_failures_delta))
-        if previous_summary:
-            num_tests_run_delta = self._summary.testsRun - previous_summary.testsRun
-            if time:
-                previous_time_taken = previous_summary.get_time_taken()
-                if previous_time_taken:
-                    time_delta = time - previous_time_taken
-        skips = len(self._summary.skipped)
-        if skips:
-            values.append(("skips", skips, None))
-        self.ui.output_summary(
-            not bool(failures),
-            self._summary.testsRun,
-            num_tests_run_delta,
-            time,
-            time_delta,
-            values,
-        )
-
-    def startTestRun(self):
-        super(BaseUITestResult, self).startTestRun()
-        self._summary.startTestRun()
-
-    def stopTestRun(self):
-        super(BaseUITestResult, self).stopTestRun()
-        run_id = self.get_id()
-        self._summary.stopTestRun()
-        self._output_summary(run_id)
-
-    def status(self, *args, **kwargs):
-        self._summary.status(*args, **kwargs)
+        return BaseUITestResult
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
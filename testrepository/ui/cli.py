@@ -16,89 +16,28 @@
 
 import os
 import signal
-import subunit
 import sys
 
-import testtools
-from testtools.compat import unicode_output_stream
-
 from testrepository import ui
 from testrepository.commands import get_command_parser
 
+# subunit and testtools are imported where they are used, so that commands
+# which do not show test results start quickly.
 
-class CLITestResult(ui.BaseUITestResult):
-    """A TestResult for the CLI."""
 
-    def __init__(self, ui, get_id, stream, previous_run=None, filter_tags=None):
-        """Construct a CLITestResult writing to stream.
+def __getattr__(name):
+    if name == "CLITestResult":
+        from testrepository.ui.results import CLITestResult
 
-        :param filter_tags: Tags that should be used to filter tests out. When
-            a tag in this set is present on a test outcome, the test is not
-            counted towards the test run count. If the test errors, then it is
-            still counted and the error is still shown.
-        """
-        super(CLITestResult, self).__init__(ui, get_id, previous_run)
-        self.stream = unicode_output_stream(stream)
-        self.sep1 = "=" * 70 + "\n"
-        self.sep2 = "-" * 70 + "\n"
-        self.filter_tags = filter_tags or frozenset()
-        self.filterable_states = set(["success", "uxsuccess", "xfail", "skip"])
-
-    def _format_error(self, label, test, error_text, test_tags=None):
-        test_tags = test_tags or ()
-        tags = " ".join(test_tags)
-        if tags:
-            tags = "tags: %s\n" % tags
-        return "".join(
-            [
-                self.sep1,
-                "%s: %s\n" % (label, test.id()),
-                tags,
-                self.sep2,
-                error_text,
-            ]
-        )
-
-    def status(
-        self,
-        test_id=None,
-        test_status=None,
-        test_tags=None,
-        runnable=True,
-        file_name=None,
-        file_bytes=None,
-        eof=False,
-        mime_type=None,
-        route_code=None,
-        timestamp=None,
-    ):
-        super(CLITestResult, self).status(
-            test_id=test_id,
-            test_status=test_status,
-            test_tags=test_tags,
-            runnable=runnable,
-            file_name=file_name,
-            file_bytes=file_bytes,
-            eof=eof,
-            mime_type=mime_type,
-            route_code=route_code,
-            timestamp=timestamp,
-        )
-        if test_status == "fail":
-            self.stream.write(
-                self._format_error(
-                    "FAIL", *(self._summary.errors[-1]), test_tags=test_tags
-                )
-            )
-        if test_status not in self.filterable_states:
-            return
-        if test_tags and test_tags.intersection(self.filter_tags):
-            self._summary.testsRun -= 1
+        return CLITestResult
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
 
 class UI(ui.AbstractUI):
     """A command line user interface."""
 
+    concurrent_popen = True
+
     def __init__(self, argv, stdin, stdout, stderr):
         """Create a command line UI.
 
@@ -112,6 +51,16 @@ class UI(ui.AbstractUI):
         self._stdout = stdout
         self._stderr = stderr
         self._binary_stdout = None
+        # The width of the progress line shown, if any.
+        self._progress_width = 0
+
+    @property
+    def show_progress(self):
+        """Show progress on terminals, unless it would mix with output."""
+        if self.options.quiet or getattr(self.options, "subunit", False):
+            return False
+        isatty = getattr(self._stdout, "isatty", None)
+        return isatty is not None and isatty()
 
     def _iter_streams(self, stream_type):
         # Only the first stream declared in a command can be accepted at the
@@ -120,9 +69,16 @@ class UI(ui.AbstractUI):
         first_stream_type = self.cmd.input_streams[0]
         if stream_type != first_stream_type and stream_type != first_stream_type[:-1]:
             return
+        import subunit
+
         yield subunit.make_stream_binary(self._stdin)
 
     def make_result(self, get_id, test_command, previous_run=None):
+        import subunit
+        import testtools
+
+        from testrepository.ui.results import CLITestResult
+
         if getattr(self.options, "subunit", False):
             serializer = subunit.StreamResultToBytes(self._stdout)
             # By pass user transforms - just forward it all,
@@ -142,6 +98,7 @@ class UI(ui.AbstractUI):
         return output, summary
 
     def output_error(self, error_tuple):
+        self._clear_progress()
         if "TESTR_PDB" in os.environ:
             import traceback
 
@@ -155,13 +112,40 @@ class UI(ui.AbstractUI):
         error_type = str(error_tuple[1])
         self._stderr.write(error_type + "\n")
 
+    def _clear_progress(self):
+        """Clear the progress line, if shown, so output starts on a clean line.
+
+        Every output method calls this first.
+        """
+        if self._progress_width:
+            self._stdout.write("\r%s\r" % (" " * self._progress_width))
+            # Before anything is written to stderr.
+            self._stdout.flush()
+            self._progress_width = 0
+
+    def output_progress(self, values):
+        if values is None:
+            self._clear_progress()
+            self._stdout.flush()
+            return
+        line = ", ".join("%s=%s" % (label, value) for label, value in values)
+        # Pad to overwrite the rest of a longer line shown before.
+        line += " " * max(self._progress_width - len(line), 0)
+        self._stdout.write("\r" + line)
+        self._stdout.flush()
+        self._progress_width = len(line)
+
     def output_rest(self, rest_string):
+        self._clear_progress()
         self._stdout.write(rest_string)
         if not rest_string.endswith("\n"):
             self._stdout.write("\n")
 
     def output_stream(self, stream):
+        self._clear_progress()
         if not self._binary_stdout:
+            import subunit
+
             self._binary_stdout = subunit.make_stream_binary(self._stdout)
         contents = stream.read(65536)
         assert type(contents) is bytes, "Bad stream contents %r" % type(contents)
@@ -173,6 +157,7 @@ class UI(ui.AbstractUI):
         self._binary_stdout.flush()
 
     def output_table(self, table):
+        self._clear_progress()
         # stringify
         contents = []
         for row in table:
@@ -213,11 +198,13 @@ class UI(ui.AbstractUI):
         self._stdout.write("".join(outputs))
 
     def output_tests(self, tests):
+        self._clear_progress()
         for test in tests:
             self._stdout.write(test.id())
             self._stdout.write("\n")
 
     def output_values(self, values):
+        self._clear_progress()
         outputs = []
         for label, value in values:
             outputs.append("%s=%s" % (label, value))
@@ -258,6 +245,7 @@ class UI(ui.AbstractUI):
         return "".join(summary)
 
     def output_summary(self, successful, tests, tests_delta, time, time_delta, values):
+        self._clear_progress()
         self._stdout.write(
             self._format_summary(
                 successful, tests, tests_delta, time, time_delta, values
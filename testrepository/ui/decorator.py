@@ -53,6 +53,10 @@ class UI(ui.AbstractUI):
     def here(self):
         return self._decorated.here
 
+    @property
+    def show_progress(self):
+        return self._decorated.show_progress
+
     def _iter_streams(self, stream_type):
         streams = self.input_streams.pop(stream_type, [])
         for stream_value in streams:
@@ -69,6 +73,9 @@ class UI(ui.AbstractUI):
     def output_error(self, error_tuple):
         return self._decorated.output_error(error_tuple)
 
+    def output_progress(self, values):
+        return self._decorated.output_progress(values)
+
     def output_rest(self, rest_string):
         return self._decorated.output_rest(rest_string)
 
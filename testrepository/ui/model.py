@@ -17,8 +17,8 @@
 from io import BytesIO
 import optparse
 
-
 from testrepository import ui
+from testrepository.ui.results import BaseUITestResult
 
 
 class ProcessModel(object):
@@ -29,14 +29,25 @@ class ProcessModel(object):
         self.returncode = 0
         self.stdin = BytesIO()
         self.stdout = BytesIO()
+        self._waited = False
 
     def communicate(self):
         self.ui.outputs.append(("communicate",))
         return self.stdout.getvalue(), b""
 
+    def poll(self):
+        # Running until waited for.
+        if self._waited:
+            return self.returncode
+        return None
+
     def wait(self):
+        self._waited = True
         return self.returncode
 
+    def terminate(self):
+        self.ui.outputs.append(("terminate",))
+
 
 class TestSuiteModel(object):
     def __init__(self):
@@ -50,7 +61,7 @@ class TestSuiteModel(object):
             getattr(result, method)(*args)
 
 
-class TestResultModel(ui.BaseUITestResult):
+class TestResultModel(BaseUITestResult):
     def __init__(self, ui, get_id, previous_run=None):
         super(TestResultModel, self).__init__(ui, get_id, previous_run)
         self._suite = TestSuiteModel()
@@ -172,6 +183,9 @@ class UI(ui.AbstractUI):
     def output_error(self, error_tuple):
         self.outputs.append(("error", error_tuple))
 
+    def output_progress(self, values):
+        self.outputs.append(("progress", values))
+
     def output_rest(self, rest_string):
         self.outputs.append(("rest", rest_string))
 
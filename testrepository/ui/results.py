@@ -0,0 +1,167 @@
+#
+# Copyright (c) 2026 Testrepository Contributors
+#
+# Licensed under either the Apache License, Version 2.0 or the BSD 3-clause
+# license at the users choice. A copy of both licenses are available in the
+# project source as Apache-2.0 and BSD. You may not use this file except in
+# compliance with one of these two licences.
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under these licenses is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.  See the
+# license you chose for the specific language governing permissions and
+# limitations under that license.
+
+"""Test results which report to a UI."""
+
+from testtools import StreamResult
+from testtools.compat import unicode_output_stream
+
+from testrepository.results import SummarizingResult
+
+
+class BaseUITestResult(StreamResult):
+    """An abstract test result used with the UI.
+
+    AbstractUI.make_result probably wants to return an object like this.
+    """
+
+    def __init__(self, ui, get_id, previous_run=None):
+        """Construct an `AbstractUITestResult`.
+
+        :param ui: The UI this result is associated with.
+        :param get_id: A nullary callable that returns the id of the test run.
+        """
+        super(BaseUITestResult, self).__init__()
+        self.ui = ui
+        self.get_id = get_id
+        self._previous_run = previous_run
+        self._summary = SummarizingResult()
+
+    def _get_previous_summary(self):
+        if self._previous_run is None:
+            return None
+        return self._previous_run.get_summary()
+
+    def _output_summary(self, run_id):
+        """Output a test run.
+
+        :param run_id: The run id.
+        """
+        if self.ui.options.quiet:
+            return
+        time = self._summary.get_time_taken()
+        time_delta = None
+        num_tests_run_delta = None
+        num_failures_delta = None
+        values = [("id", run_id, None)]
+        failures = self._summary.get_num_failures()
+        previous_summary = self._get_previous_summary()
+        if failures:
+            if previous_summary:
+                num_failures_delta = failures - previous_summary.get_num_failures()
+            values.append(("failures", failures, num_failures_delta))
+        if previous_summary:
+            num_tests_run_delta = self._summary.testsRun - previous_summary.testsRun
+            if time:
+                previous_time_taken = previous_summary.get_time_taken()
+                if previous_time_taken:
+                    time_delta = time - previous_time_taken
+        skips = len(self._summary.skipped)
+        if skips:
+            values.append(("skips", skips, None))
+        self.ui.output_summary(
+            not bool(failures),
+            self._summary.testsRun,
+            num_tests_run_delta,
+            time,
+            time_delta,
+            values,
+        )
+
+    def startTestRun(self):
+        super(BaseUITestResult, self).startTestRun()
+        self._summary.startTestRun()
+
+    def stopTestRun(self):
+        super(BaseUITestResult, self).stopTestRun()
+        run_id = self.get_id()
+        self._summary.stopTestRun()
+        self._output_summary(run_id)
+
+    def status(self, *args, **kwargs):
+        self._summary.status(*args, **kwargs)
+
+
+class CLITestResult(BaseUITestResult):
+    """A TestResult for the CLI."""
+
+    def __init__(self, ui, get_id, stream, previous_run=None, filter_tags=None):
+        """Construct a CLITestResult writing to stream.
+
+        :param filter_tags: Tags that should be used to filter tests out. When
+            a tag in this set is present on a test outcome, the test is not
+            counted towards the test run count. If the test errors, then it is
+            still counted and the error is still shown.
+        """
+        super(CLITestResult, self).__init__(ui, get_id, previous_run)
+        self.stream = unicode_output_stream(stream)
+        self.sep1 = "=" * 70 + "\n"
+        self.sep2 = "-" * 70 + "\n"
+        self.filter_tags = filter_tags or frozenset()
+        self.filterable_states = set(["success", "uxsuccess", "xfail", "skip"])
+
+    def _format_error(self, label, test, error_text, test_tags=None):
+        test_tags = test_tags or ()
+        tags = " ".join(test_tags)
+        if tags:
+            tags = "tags: %s\n" % tags
+        return "".join(
+            [
+                self.sep1,
+                "%s: %s\n" % (label, test.id()),
+                tags,
+                self.sep2,
+                error_text,
+            ]
+        )
+
+    def status(
+        self,
+        test_id=None,
+        test_status=None,
+        test_tags=None,
+        runnable=True,
+        file_name=None,
+        file_bytes=None,
+        eof=False,
+        mime_type=None,
+        route_code=None,
+        timestamp=None,
+    ):
+        super(CLITestResult, self).status(
+            test_id=test_id,
+            test_status=test_status,
+            test_tags=test_tags,
+            runnable=runnable,
+            file_name=file_name,
+            file_bytes=file_bytes,
+            eof=eof,
+            mime_type=mime_type,
+            route_code=route_code,
+            timestamp=timestamp,
+        )
+        if test_status == "fail":
+            # Written to stream, which replaces unencodable characters,
+            # rather than through an output method of the UI (which would
+            # clear the progress line itself), so stop showing progress.
+            self.ui.output_progress(None)
+            self.stream.write(
+                self._format_error(
+                    "FAIL", *(self._summary.errors[-1]), test_tags=test_tags
+                )
+            )
+        if test_status not in self.filterable_states:
+            return
+        if test_tags and test_tags.intersection(self.filter_tags):
+            self._summary.testsRun -= 1